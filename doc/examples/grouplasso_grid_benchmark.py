@@ -0,0 +1,90 @@
+"""
+Time the log-Jacobian used in `approximate_grid_inference` for
+the group lasso on a problem with 100 groups.
+
+The log-Jacobian over a grid of 100 points is computed three ways:
+once per grid point with `block_diag` matrices built in a loop over
+groups (as `jacobian_grad_hess` used to), once per grid point with
+`jacobian_grad_hess` and in one batch with `log_jacobian`.
+The whole grid inference is then timed for the first few targets.
+"""
+from __future__ import print_function
+import time
+from collections import OrderedDict
+
+import numpy as np
+from scipy.linalg import block_diag
+
+from selectinf.tests.instance import gaussian_group_instance
+from selectinf.randomized.approx_reference_grouplasso import (group_lasso,
+                                                              approximate_grid_inference,
+                                                              jacobian_grad_hess,
+                                                              log_jacobian)
+
+def timeit(f, ntimes=3):
+    tic = time.time()
+    for _ in range(ntimes):
+        f()
+    return (time.time() - tic) / ntimes
+
+def _jacobian_block_diag(gamma, C, active_dirs):
+
+    to_diag = [[g] * (ug.size - 1) for (g, ug) in zip(gamma, active_dirs.values())]
+    GammaMinus = block_diag(*[i for gp in to_diag for i in gp])
+    J = np.log(np.linalg.det(GammaMinus + C))
+    GpC_inv = np.linalg.inv(GammaMinus + C)
+    S = block_diag(*[np.ones((1, ug.size - 1)) for ug in active_dirs.values()])
+    return J, S.dot(GpC_inv.diagonal()), -S.dot(np.multiply(GpC_inv, GpC_inv.T).dot(S.T))
+
+def jacobians(ngroup=100, size=5, ngrid=100):
+
+    active_dirs = OrderedDict()
+    for g in range(ngroup):
+        u = np.random.standard_normal(size)
+        active_dirs[g] = u / np.linalg.norm(u)
+    m = ngroup * (size - 1)
+    W = np.random.standard_normal((m, m))
+    C = W.dot(W.T) / m + np.identity(m)
+    gammas = np.random.exponential(size=(ngrid, ngroup)) + 0.5
+
+    loop = lambda: [_jacobian_block_diag(g, C, active_dirs) for g in gammas]
+    single = lambda: [jacobian_grad_hess(g, C, active_dirs) for g in gammas]
+    batch = lambda: log_jacobian(gammas, C, active_dirs)
+    return loop, single, batch
+
+def grid_inference(n=2000, ngroup=100, size=5, ntarget=3):
+
+    p = ngroup * size
+    groups = np.arange(ngroup).repeat(size)
+    X, Y = gaussian_group_instance(n=n,
+                                   p=p,
+                                   signal=3,
+                                   sgroup=10,
+                                   groups=groups,
+                                   sigma=1.,
+                                   rho=0.2)[:2]
+    sigma_ = np.std(Y)
+    weights = dict([(g, 0.8 * sigma_ * np.sqrt(2 * np.log(p))) for g in range(ngroup)])
+    conv = group_lasso.gaussian(X, Y, groups, weights, randomizer_scale=0.5 * sigma_)
+    conv.fit()
+    conv._setup_implied_gaussian()
+    G = approximate_grid_inference(conv, sigma_ ** 2)
+
+    def f():
+        for m in range(min(ntarget, G.ntarget)):
+            G.log_reference(G.observed_target[m].reshape((1,)),
+                            np.diag(G.target_cov)[m].reshape((1, 1)),
+                            G.target_score_cov[m].reshape((1, -1)),
+                            G.stat_grid[m])
+    return f
+
+def main():
+
+    loop, single, batch = jacobians()
+    print('log-Jacobian on 100 groups x 100 grid points: ' + 
+          'block_diag loop %0.3fs, jacobian_grad_hess %0.3fs, log_jacobian %0.3fs' %
+          (timeit(loop), timeit(single), timeit(batch)))
+    print('log_reference for 3 targets, 100 groups: %0.3fs' % timeit(grid_inference(), ntimes=1))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Time mpmath work at mpmath's working precision against the 80 digit
+global precision that `selectinf.distributions.pvalue` used to set
+at import time.
+
+The multiprecision fallbacks in `selectinf.distributions.pvalue`
+raise the precision themselves, through `mp_precision`, so
+everything else runs at working precision. 
+
+There is no speedup on the common path: `constraints.pivot` and
+`truncated_gaussian.cdf` run in double precision, and their mpmath
+fallbacks still use 80 digits, so both report about 1x. The speedup
+is for mpmath code that does not ask for extra digits, run in the
+same process as `selectinf`. That regime is timed with quadrature 
+of the normal density, where 80 digits cost several times as much.
+"""
+from __future__ import print_function
+import time
+
+import numpy as np
+from mpmath import mp
+
+from selectinf.constraints.affine import constraints, sample_from_constraints
+from selectinf.truncated.gaussian import truncated_gaussian
+
+def timeit(f, ntimes=5):
+    tic = time.time()
+    for _ in range(ntimes):
+        f()
+    return (time.time() - tic) / ntimes
+
+def pivots(ndirections=200):
+
+    A, b = np.random.standard_normal((10,30)), np.random.standard_normal(10)
+    con = constraints(A, b)
+    while True:
+        w = np.random.standard_normal(30)
+        if con(w):
+            break
+    Z = sample_from_constraints(con, w)[-1]
+    directions = np.random.standard_normal((ndirections, 30))
+
+    def f():
+        [con.pivot(eta, Z) for eta in directions]
+    return f
+
+def cdfs(npoints=200):
+
+    # two sets of intervals: one handled in double precision,
+    # one far in the tails and so narrow that mpmath is needed
+
+    tgs = [truncated_gaussian([(-np.inf,-4.),(3.,np.inf)], mu=0.5, scale=2.),
+           truncated_gaussian([(30.,30. + 1.e-10)])]
+    Z = [np.linspace(-5, 5, npoints),
+         np.linspace(30., 30. + 1.e-10, npoints)]
+
+    def f():
+        for tg, z in zip(tgs, Z):
+            [tg.cdf(v) for v in z]
+    return f
+
+def ambient_mpmath(npoints=40):
+
+    # mpmath code outside selectinf, which runs at 
+    # whatever precision is set globally
+
+    Z = np.linspace(-5, 5, npoints)
+
+    def f():
+        [mp.quad(mp.npdf, [-1, z]) for z in Z]
+    return f
+
+def main():
+
+    for name, f in [('constraints.pivot', pivots()),
+                    ('truncated_gaussian.cdf', cdfs()),
+                    ('mpmath quadrature', ambient_mpmath())]:
+        working = timeit(f)
+        with mp.workdps(80):
+            global_80 = timeit(f)
+        print('%s: working precision %0.3fs, global 80 digits %0.3fs, speedup %0.1fx' %
+              (name, working, global_80, global_80 / working))
+
+if __name__ == '__main__':
+    main()
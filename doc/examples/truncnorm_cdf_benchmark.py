@@ -0,0 +1,43 @@
+"""
+Time `truncnorm_cdf_vec` in double precision against the
+truncated normal CDF computed with mpmath at 80 digits,
+as `selectinf.distributions.pvalue` used to for each point.
+"""
+from __future__ import print_function
+import time
+
+import numpy as np
+from mpmath import mp
+
+from selectinf.distributions.pvalue import truncnorm_cdf_vec
+
+def truncnorm_cdf_mp(x, a, b):
+
+    x = min(max(x, a), b)
+    with mp.workdps(80):
+        if a > 0 and b > 0:
+            Fx, Fa, Fb = mp.ncdf(-x), mp.ncdf(-a), mp.ncdf(-b)
+            return float((Fa - Fx) / (Fa - Fb))
+        Fx, Fa, Fb = mp.ncdf(x), mp.ncdf(a), mp.ncdf(b)
+        return float((Fx - Fa) / (Fb - Fa))
+
+def main(n=2000, ntimes=10):
+
+    A = np.random.standard_normal(n) * 5
+    B = A + np.random.exponential(size=n)
+    X = A + np.random.uniform(size=n) * (B - A)
+
+    tic = time.time()
+    for _ in range(ntimes):
+        truncnorm_cdf_vec(X, A, B)
+    float_time = (time.time() - tic) / ntimes
+
+    tic = time.time()
+    [truncnorm_cdf_mp(x, a, b) for x, a, b in zip(X, A, B)]
+    mp_time = time.time() - tic
+
+    print('%d points: float64 %0.2es, mpmath %0.2es, speedup %0.1fx' %
+          (n, float_time, mp_time, mp_time / float_time))
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,7 @@
 import numpy as np
 
+from ..constraints.affine import box_constraints
+
 def solve_barrier_affine_py(conjugate_arg,
                             precision,
                             feasible_point,
@@ -77,6 +79,7 @@ def solve_barrier_nonneg(conjugate_arg,
                          feasible_point=None,
                          step=1,
                          nstep=1000,
+                         min_its=0,
                          tol=1.e-8):
 
     scaling = np.sqrt(np.diag(precision))
@@ -111,6 +114,7 @@ def solve_barrier_nonneg(conjugate_arg,
 
         count = 0
         while True:
+            count += 1
             proposal = current - step * cur_grad
             proposed_value = objective(proposal)
             if proposed_value <= current_value:
@@ -124,7 +128,7 @@ def solve_barrier_nonneg(conjugate_arg,
 
         # stop if relative decrease is small
 
-        if np.fabs(current_value - proposed_value) < tol * np.fabs(current_value):
+        if np.fabs(current_value - proposed_value) < tol * np.fabs(current_value) and itercount >= min_its:
             current = proposal
             current_value = proposed_value
             break
@@ -137,3 +141,305 @@ def solve_barrier_nonneg(conjugate_arg,
 
     hess = np.linalg.inv(precision + np.diag(barrier_hessian(current)))
     return current_value, current, hess
+
+def solve_barrier_orthant(conjugate_arg,
+                          precision,
+                          feasible_point,
+                          sign,
+                          lower,
+                          step=1,
+                          nstep=1000,
+                          min_its=200,
+                          tol=1.e-10):
+    r"""
+    Solve the barrier problem of `solve_barrier_affine_py` when
+    the constraint is the shifted orthant $\{o: s \odot o \geq l\}$, 
+    i.e. `con_linear` has rows $-s_ie_i^T$ and `con_offset` is $-l$.
+
+    This is the separable barrier of `solve_barrier_nonneg` in the 
+    variables $v = s \odot o - l$, with $O(k)$ barrier terms. 
+    Iterates and stopping rule are those of `solve_barrier_affine_py`.
+    """
+
+    sign = np.asarray(sign, float)
+    lower = np.asarray(lower, float)
+    precision = np.asarray(precision)
+
+    con_map = lambda u: -sign * u
+    con_adjoint = lambda w: -sign * w
+    con_gram = lambda h: np.diag(h) # con_linear.T.dot(np.diag(h)).dot(con_linear)
+    scaling = np.sqrt(np.diag(precision))
+
+    return _solve_barrier_structured(conjugate_arg,
+                                     precision,
+                                     feasible_point,
+                                     con_map,
+                                     con_adjoint,
+                                     con_gram,
+                                     -lower,
+                                     scaling,
+                                     step=step,
+                                     nstep=nstep,
+                                     min_its=min_its,
+                                     tol=tol)
+
+def solve_barrier_monotone(conjugate_arg,
+                           precision,
+                           feasible_point,
+                           con_offset,
+                           step=1,
+                           nstep=1000,
+                           min_its=200,
+                           tol=1.e-10):
+    r"""
+    Solve the barrier problem of `solve_barrier_affine_py` when
+    `con_linear` is the monotone cone constraint of SLOPE, 
+    $-I$ stacked on the $(k-1) \times k$ matrix $D$ with
+    $Du = (u_{i+1} - u_i)_{1 \leq i < k}$.
+
+    The $2k-1$ barrier terms are evaluated with differences
+    so $D$ is never formed. 
+    Iterates and stopping rule are those of `solve_barrier_affine_py`.
+    """
+
+    precision = np.asarray(precision)
+    k = precision.shape[0]
+
+    def con_map(u):
+        return np.hstack([-u, np.diff(u)])
+
+    def con_adjoint(w):
+        result = -w[:k].copy()
+        result[1:] += w[k:]
+        result[:-1] -= w[k:]
+        return result
+
+    def con_gram(h): # con_linear.T.dot(np.diag(h)).dot(con_linear)
+        h_I, h_D = h[:k], h[k:]
+        diag = h_I.copy()
+        diag[1:] += h_D
+        diag[:-1] += h_D
+        return np.diag(diag) - np.diag(h_D, 1) - np.diag(h_D, -1)
+
+    diag_prec = np.diag(precision)
+    scaling = np.sqrt(np.hstack([diag_prec, 
+                                 diag_prec[1:] + diag_prec[:-1] - 2 * np.diag(precision, 1)]))
+
+    return _solve_barrier_structured(conjugate_arg,
+                                     precision,
+                                     feasible_point,
+                                     con_map,
+                                     con_adjoint,
+                                     con_gram,
+                                     np.asarray(con_offset),
+                                     scaling,
+                                     step=step,
+                                     nstep=nstep,
+                                     min_its=min_its,
+                                     tol=tol)
+
+def _solve_barrier_structured(conjugate_arg,
+                              precision,
+                              feasible_point,
+                              con_map,
+                              con_adjoint,
+                              con_gram,
+                              con_offset,
+                              scaling,
+                              step=1,
+                              nstep=1000,
+                              min_its=200,
+                              tol=1.e-10):
+    """
+    The loop of `solve_barrier_affine_py` with `con_linear`
+    given by its action `con_map`, its adjoint `con_adjoint`
+    and `con_gram(h) = con_linear.T.dot(np.diag(h)).dot(con_linear)`.
+    `scaling` is `np.sqrt(np.diag(con_linear.dot(precision).dot(con_linear.T)))`.
+    """
+
+    conjugate_arg = np.asarray(conjugate_arg)
+
+    if feasible_point is None:
+        feasible_point = 1. / scaling
+
+    objective = lambda u: -u.T.dot(conjugate_arg) + u.T.dot(precision).dot(u)/2. \
+                          + np.log(1.+ 1./((con_offset - con_map(u))/ scaling)).sum()
+    grad = lambda u: -conjugate_arg + precision.dot(u) - con_adjoint(1./(scaling + con_offset - con_map(u)) -
+                                                                     1./(con_offset - con_map(u)))
+    barrier_hessian = lambda u: con_gram(-1./((scaling + con_offset - con_map(u))**2.)
+                                         + 1./((con_offset - con_map(u))**2.))
+
+    current = feasible_point
+    current_value = np.inf
+
+    for itercount in range(nstep):
+        cur_grad = grad(current)
+
+        # make sure proposal is feasible
+
+        count = 0
+        while True:
+            count += 1
+            proposal = current - step * cur_grad
+            if np.all(con_offset - con_map(proposal) > 0):
+                break
+            step *= 0.5
+            if count >= 40:
+                raise ValueError('not finding a feasible point')
+
+        # make sure proposal is a descent
+
+        count = 0
+        while True:
+            count += 1
+            proposal = current - step * cur_grad
+            proposed_value = objective(proposal)
+            if proposed_value <= current_value:
+                break
+            step *= 0.5
+            if count >= 20:
+                if not (np.isnan(proposed_value) or np.isnan(current_value)):
+                    break
+                else:
+                    raise ValueError('value is NaN: %f, %f' % (proposed_value, current_value))
+
+        # stop if relative decrease is small
+
+        if np.fabs(current_value - proposed_value) < tol * np.fabs(current_value) and itercount >= min_its:
+            current = proposal
+            current_value = proposed_value
+            break
+
+        current = proposal
+        current_value = proposed_value
+
+        if itercount % 4 == 0:
+            step *= 2
+
+    hess = np.linalg.inv(precision + barrier_hessian(current))
+    return current_value, current, hess
+
+def constraint_structure(con_linear, con_offset=None):
+    r"""
+    Detect structure in the constraint $\{o: Ao \leq b\}$ that
+    the barrier problem of `solve_barrier_affine_py` can exploit.
+
+    Parameters
+    ----------
+
+    con_linear : ndarray or `box_constraints`
+        Linear part $A$, or a box in which case `con_offset`
+        is ignored.
+
+    con_offset : ndarray
+        Offset $b$.
+
+    Returns
+    -------
+
+    structure : str
+        One of 'orthant' (each row of $A$ has one nonzero and each 
+        variable is in exactly one row, i.e. $s \odot o \geq l$ up to 
+        scaling of the rows), 'monotone' (the SLOPE constraint of
+        `solve_barrier_monotone`) or 'affine'.
+
+    params : dict
+        For 'orthant', the `sign` and `lower` of the orthant.
+    """
+
+    if isinstance(con_linear, box_constraints):
+        if (np.all(np.isfinite(con_linear.lower)) and 
+            not np.any(np.isfinite(con_linear.upper))):
+            return 'orthant', {'sign': con_linear.sign,
+                               'lower': con_linear.lower}
+        return 'affine', {}
+
+    A = np.asarray(con_linear)
+    if A.ndim != 2:
+        return 'affine', {}
+    nrow, k = A.shape
+    nonzero = A != 0
+
+    if nrow == k and np.all(nonzero.sum(1) == 1) and np.all(nonzero.sum(0) == 1):
+        rows, cols = np.nonzero(nonzero)
+        values = A[rows, cols]
+        sign, lower = np.zeros(k), np.zeros(k)
+        sign[cols] = -np.sign(values)
+        lower[cols] = -np.asarray(con_offset)[rows] / np.fabs(values)
+        return 'orthant', {'sign': sign, 'lower': lower}
+
+    if nrow == 2 * k - 1 and k > 1:
+        if (np.all(A[:k] == -np.identity(k)) and
+            np.all(A[k:] == np.diff(np.identity(k), axis=0))):
+            return 'monotone', {}
+
+    return 'affine', {}
+
+def solve_barrier(conjugate_arg,
+                  precision,
+                  feasible_point,
+                  con_linear,
+                  con_offset,
+                  structure=None,
+                  affine_solver=solve_barrier_affine_py,
+                  diagnostics=None,
+                  **solve_args):
+    """
+    Solve the barrier problem of `solve_barrier_affine_py`,
+    dispatching to `solve_barrier_orthant` or `solve_barrier_monotone`
+    when `constraint_structure` finds that structure in the constraint
+    and to `affine_solver` otherwise.
+
+    Parameters
+    ----------
+
+    structure : tuple, optional
+        Output of `constraint_structure(con_linear, con_offset)`,
+        if already computed.
+
+    affine_solver : callable
+        Solver for general constraints, such as
+        the compiled version of `solve_barrier_affine_py`.
+
+    diagnostics : dict, optional
+        If not None, updated with the detected 'structure'
+        and the name of the 'solver' used.
+
+    Other arguments are as in `solve_barrier_affine_py`.
+    """
+
+    if structure is None:
+        structure = constraint_structure(con_linear, con_offset)
+    structure, params = structure
+
+    if structure == 'orthant':
+        solver = solve_barrier_orthant
+        value = solver(conjugate_arg,
+                       precision,
+                       feasible_point,
+                       params['sign'],
+                       params['lower'],
+                       **solve_args)
+    elif structure == 'monotone':
+        solver = solve_barrier_monotone
+        value = solver(conjugate_arg,
+                       precision,
+                       feasible_point,
+                       con_offset,
+                       **solve_args)
+    else:
+        if isinstance(con_linear, box_constraints):
+            con_linear, con_offset = con_linear.linear_part, con_linear.offset
+        solver = affine_solver
+        value = solver(conjugate_arg,
+                       precision,
+                       feasible_point,
+                       con_linear,
+                       con_offset,
+                       **solve_args)
+
+    if diagnostics is not None:
+        diagnostics.update({'structure': structure,
+                            'solver': getattr(solver, '__name__', str(solver))})
+    return value
+
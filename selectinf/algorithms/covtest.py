@@ -82,7 +82,6 @@ def covtest(X, Y, sigma=1, exact=True,
     idx = np.argsort(np.fabs(Z))[-1]
     sign = np.sign(Z[idx])
 
-    I = np.identity(p)
     subset = np.ones(p, np.bool)
     subset[idx] = 0
     selector = np.vstack([X.T[subset],-X.T[subset],-sign*X[:,idx]])
@@ -1,4 +1,5 @@
 from warnings import warn
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 from scipy.stats import norm as ndist
@@ -20,11 +21,19 @@ def debiasing_matrix(X,
                      objective_stop=True,  # stop based on relative decrease in objective?
                      kkt_tol=1.e-4,  # tolerance for the KKT conditions
                      parameter_tol=1.e-4,  # tolerance for relative convergence of parameter
-                     objective_tol=1.e-4  # tolerance for relative decrease in objective
+                     objective_tol=1.e-4,  # tolerance for relative decrease in objective
+                     nthreads=1,  # how many threads solve rows?
+                     warm_start=False  # start each row at the solution of the previous row?
                      ):
     """
     Find a row of debiasing matrix using line search of
     Javanmard and Montanari.
+
+    The rows are independent problems. With `nthreads > 1` 
+    they are split into contiguous chunks solved in a pool
+    of threads, each with its own work buffers (the compiled 
+    solver releases the GIL). With `warm_start`, each row 
+    of a chunk starts at the solution of the previous row.
     """
 
     n, p = X.shape
@@ -42,98 +51,201 @@ def debiasing_matrix(X,
 
     nndef_diag = (X ** 2).sum(0) / n
 
-    for idx, row in enumerate(rows):
-
-        bound = orig_bound
-        soln = np.zeros(p)
-        soln_old = np.zeros(p)
-        ever_active = np.zeros(p, np.intp)
-        ever_active[0] = row + 1  # C code is 1-based
-        nactive = np.array([1], np.intp)
-
-        linear_func = np.zeros(p)
-        linear_func[row] = -1
-        gradient = linear_func.copy()
-
-        counter_idx = 1
-        incr = 0;
-
-        last_output = None
-
-        Xsoln = np.zeros(n)  # X\hat{\beta}
-
-        ridge_term = 0
-
-        need_update = np.zeros(p, np.intp)
+    solve_args = {'linesearch': linesearch,
+                  'scaling_factor': scaling_factor,
+                  'max_active': max_active,
+                  'max_try': max_try,
+                  'warn_kkt': warn_kkt,
+                  'max_iter': max_iter,
+                  'kkt_stop': kkt_stop,
+                  'parameter_stop': parameter_stop,
+                  'objective_stop': objective_stop,
+                  'kkt_tol': kkt_tol,
+                  'parameter_tol': parameter_tol,
+                  'objective_tol': objective_tol}
+
+    def solve_chunk(chunk):
+        buffers = _debiasing_buffers(n, p)
+        initial = None
+        for idx in chunk:
+            M[idx] = _debiasing_row(X, 
+                                    rows[idx], 
+                                    nndef_diag, 
+                                    orig_bound, 
+                                    buffers,
+                                    initial=initial,
+                                    **solve_args)
+            if warm_start:
+                initial = M[idx]
+
+    chunks = [chunk for chunk in np.array_split(np.arange(len(rows)), max(nthreads, 1))
+              if chunk.shape[0] > 0]
+    if len(chunks) > 1:
+        pool = ThreadPool(len(chunks))
+        try:
+            pool.map(solve_chunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for chunk in chunks:
+            solve_chunk(chunk)
 
-        while (counter_idx < max_try):
-            bound_vec = np.ones(p) * bound
+    return np.squeeze(M)
 
-            result = solve_wide_(X,
-                                 Xsoln,
-                                 linear_func,
-                                 nndef_diag,
-                                 gradient,
-                                 need_update,
-                                 ever_active,
-                                 nactive,
-                                 bound_vec,
-                                 ridge_term,
-                                 soln,
-                                 soln_old,
-                                 max_iter,
-                                 kkt_tol,
-                                 objective_tol,
-                                 parameter_tol,
-                                 max_active,
-                                 kkt_stop,
-                                 objective_stop,
-                                 parameter_stop)
+def _debiasing_buffers(n, p):
+    """
+    Work buffers of `solve_wide_`, reused for the rows a thread solves.
+    """
+    return {'soln': np.zeros(p),
+            'soln_old': np.zeros(p),
+            'Xsoln': np.zeros(n), # X\hat{\beta}
+            'linear_func': np.zeros(p),
+            'gradient': np.zeros(p),
+            'need_update': np.zeros(p, np.intp),
+            'ever_active': np.zeros(p, np.intp),
+            'nactive': np.zeros(1, np.intp),
+            'bound_vec': np.zeros(p)}
+
+def _debiasing_row(X,
+                   row,
+                   nndef_diag,
+                   orig_bound,
+                   buffers,
+                   initial=None,
+                   linesearch=True,
+                   scaling_factor=1.5,
+                   max_active=None,
+                   max_try=10,
+                   warn_kkt=False,
+                   max_iter=50,
+                   kkt_stop=True,
+                   parameter_stop=True,
+                   objective_stop=True,
+                   kkt_tol=1.e-4,
+                   parameter_tol=1.e-4,
+                   objective_tol=1.e-4):
+    """
+    One row of `debiasing_matrix`, solved in `buffers`
+    and started at `initial` if not None.
+    """
 
-            niter = result['iter']
+    n, p = X.shape
 
-            # Logic for whether we should continue the line search
+    bound = orig_bound
+    soln = buffers['soln']
+    soln_old = buffers['soln_old']
+    Xsoln = buffers['Xsoln']
+    linear_func = buffers['linear_func']
+    gradient = buffers['gradient']
+    need_update = buffers['need_update']
+    ever_active = buffers['ever_active']
+    nactive = buffers['nactive']
+    bound_vec = buffers['bound_vec']
+
+    linear_func[:] = 0
+    linear_func[row] = -1
+    need_update[:] = 0
+
+    # the compiled solver reads the index buffers as C ints
+
+    ever_active[:] = 0
+    nactive[:] = 0
+    ever_active_C = ever_active.view(np.intc)
+    ever_active_C[0] = row + 1  # C code is 1-based
+    nactive.view(np.intc)[0] = 1
+
+    warm_active = []
+    if initial is not None:
+        warm_active = np.nonzero(initial)[0]
+        warm_active = warm_active[warm_active != row]
+
+    if len(warm_active) and len(warm_active) + 1 < max_active:
+        soln[:] = initial
+        soln_old[:] = initial
+        Xsoln[:] = X.dot(soln)
+        gradient[:] = X.T.dot(Xsoln) / n + linear_func
+        ever_active_C[1:len(warm_active) + 1] = warm_active + 1
+        nactive.view(np.intc)[0] = len(warm_active) + 1
+    else:
+        soln[:] = 0
+        soln_old[:] = 0
+        Xsoln[:] = 0
+        gradient[:] = linear_func
 
-            if not linesearch: break
+    counter_idx = 1
+    incr = 0;
 
-            if counter_idx == 1:
-                if niter == (max_iter + 1):
-                    incr = 1  # was the original problem feasible? 1 if not
-                else:
-                    incr = 0  # original problem was feasible
+    last_output = None
 
-            if incr == 1:  # trying to find a feasible point
-                if niter < (max_iter + 1) and counter_idx > 1:
-                    break
-                bound = bound * scaling_factor;
-            elif niter == (max_iter + 1) and counter_idx > 1:
-                result = last_output  # problem seems infeasible because we didn't solve it
-                break  # so we revert to previously found solution
+    ridge_term = 0
 
-            bound = bound / scaling_factor
+    while (counter_idx < max_try):
+        bound_vec[:] = bound
+
+        result = solve_wide_(X,
+                             Xsoln,
+                             linear_func,
+                             nndef_diag,
+                             gradient,
+                             need_update,
+                             ever_active,
+                             nactive,
+                             bound_vec,
+                             ridge_term,
+                             soln,
+                             soln_old,
+                             max_iter,
+                             kkt_tol,
+                             objective_tol,
+                             parameter_tol,
+                             max_active,
+                             kkt_stop,
+                             objective_stop,
+                             parameter_stop)
+
+        niter = result['iter']
+
+        # Logic for whether we should continue the line search
+
+        if not linesearch: break
+
+        if counter_idx == 1:
+            if niter == (max_iter + 1):
+                incr = 1  # was the original problem feasible? 1 if not
+            else:
+                incr = 0  # original problem was feasible
+
+        if incr == 1:  # trying to find a feasible point
+            if niter < (max_iter + 1) and counter_idx > 1:
+                break
+            bound = bound * scaling_factor;
+        elif niter == (max_iter + 1) and counter_idx > 1:
+            result = last_output  # problem seems infeasible because we didn't solve it
+            break  # so we revert to previously found solution
 
-            counter_idx += 1
-            last_output = {'soln': result['soln'],
-                           'kkt_check': result['kkt_check']}
+        bound = bound / scaling_factor
 
-            # If the active set has grown to a certain size
-            # then we stop, presuming problem has become
-            # infeasible.
+        counter_idx += 1
+        last_output = {'soln': result['soln'],
+                       'kkt_check': result['kkt_check']}
 
-            # We revert to the previous solution
+        # If the active set has grown to a certain size
+        # then we stop, presuming problem has become
+        # infeasible.
 
-            if result['max_active_check']:
-                result = last_output
-                break
+        # We revert to the previous solution
 
-            # Check feasibility
+        if result['max_active_check']:
+            result = last_output
+            break
 
-            if warn_kkt and not result['kkt_check']:
-                warn("Solution for row of M does not seem to be feasible")
-                
-        M[idx] = result['soln'] * 1.
+        # Check feasibility
 
-    return np.squeeze(M)
+        if warn_kkt and not result['kkt_check']:
+            warn("Solution for row of M does not seem to be feasible")
+            
+    return result['soln'] * 1.
 
 
 def _find_row_approx_inverse_X(X,
@@ -298,7 +410,8 @@ def debiased_lasso_inference(lasso_obj, variables, delta):
                           _full_linear_part.shape[1]))
     _full_cov[:_constraints.linear_part.shape[1]][:, :_constraints.linear_part.shape[1]] = _constraints.covariance
     _full_cov[_constraints.linear_part.shape[1]:][:,
-    _constraints.linear_part.shape[1]:] = _inactive_constraints.covariance
+    _constraints.linear_part.shape[1]:] = _inactive_constraints.covariance.dot(
+        np.identity(_inactive_constraints.dim))
     _full_constraints = constraints(_full_linear_part,
                                     _full_offset,
                                     covariance=_full_cov)
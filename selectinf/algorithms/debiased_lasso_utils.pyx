@@ -8,7 +8,7 @@ DTYPE_int = np.int
 ctypedef cnp.int_t DTYPE_int_t
 ctypedef cnp.intp_t DTYPE_intp_t
 
-cdef extern from "debias.h":
+cdef extern from "debias.h" nogil:
 
    int solve_wide(double *X_ptr,              # Sqrt of non-neg def matrix -- X^TX/ncase = nndef #
                   double *X_theta_ptr,        # Fitted values   #
@@ -76,57 +76,75 @@ def solve_wide_(cnp.ndarray[DTYPE_float_t, ndim=2] X,            # Sqrt of non-n
                 int objective_stop,                             # Break based on convergence of objective value? #
                 int parameter_stop):                            # Break based on parameter convergence? #
 
-    niter = solve_wide(<double *>X.data,
-                        <double *>X_theta.data,
-                        <double *>linear_func.data,
-                        <double *>nndef_diag.data,
-                        <double *>gradient.data,
-                        <int *>need_update.data,
-                        <int *>ever_active.data,
-                        <int *>nactive.data,
-                        <int>X.shape[0],
-                        <int>X.shape[1],
-                        <double *>bound.data,
-                        ridge_term,
-                        <double *>theta.data,
-                        <double *>theta_old.data,
-                        maxiter,
-                        kkt_tol,
-                        parameter_tol,
-                        objective_tol,
-                        max_active,
-                        kkt_stop,
-                        parameter_stop,
-                        objective_stop)
+    # pointers are taken with the GIL held, the solver runs without it
+    # so rows of the debiasing matrix can be solved in threads
 
-    # Check whether feasible
+    cdef double *X_ptr = <double *>X.data
+    cdef double *X_theta_ptr = <double *>X_theta.data
+    cdef double *linear_func_ptr = <double *>linear_func.data
+    cdef double *nndef_diag_ptr = <double *>nndef_diag.data
+    cdef double *gradient_ptr = <double *>gradient.data
+    cdef int *need_update_ptr = <int *>need_update.data
+    cdef int *ever_active_ptr = <int *>ever_active.data
+    cdef int *nactive_ptr = <int *>nactive.data
+    cdef double *bound_ptr = <double *>bound.data
+    cdef double *theta_ptr = <double *>theta.data
+    cdef double *theta_old_ptr = <double *>theta_old.data
+    cdef int ncase = X.shape[0]
+    cdef int nfeature = X.shape[1]
+    cdef int niter, kkt_check
 
-    ncase = X.shape[0]
-    nfeature = X.shape[1]
+    with nogil:
+        niter = solve_wide(X_ptr,
+                           X_theta_ptr,
+                           linear_func_ptr,
+                           nndef_diag_ptr,
+                           gradient_ptr,
+                           need_update_ptr,
+                           ever_active_ptr,
+                           nactive_ptr,
+                           ncase,
+                           nfeature,
+                           bound_ptr,
+                           ridge_term,
+                           theta_ptr,
+                           theta_old_ptr,
+                           maxiter,
+                           kkt_tol,
+                           parameter_tol,
+                           objective_tol,
+                           max_active,
+                           kkt_stop,
+                           parameter_stop,
+                           objective_stop)
 
-    kkt_check = check_KKT_wide(<double *>theta.data,
-                               <double *>gradient.data,
-                               <double *>X_theta.data,
-                               <double *>X.data,
-                               <double *>linear_func.data,
-                               <int *>need_update.data,
-                               ncase,
-                               nfeature,
-                               <double *>bound.data,
-                               ridge_term,
-                               kkt_tol)
+        # Check whether feasible
+
+        kkt_check = check_KKT_wide(theta_ptr,
+                                   gradient_ptr,
+                                   X_theta_ptr,
+                                   X_ptr,
+                                   linear_func_ptr,
+                                   need_update_ptr,
+                                   ncase,
+                                   nfeature,
+                                   bound_ptr,
+                                   ridge_term,
+                                   kkt_tol)
 
     max_active_check = nactive[0] >= max_active
 
-    # Make sure gradient is updated -- essentially a matrix multiply
+    with nogil:
+
+        # Make sure gradient is updated -- essentially a matrix multiply
 
-    update_gradient_wide(<double *>gradient.data,
-                          <double *>X_theta.data,
-                          <double *>X.data,
-                          <double *>linear_func.data,
-                          <int *>need_update.data,
-                          ncase,
-                          nfeature)
+        update_gradient_wide(gradient_ptr,
+                             X_theta_ptr,
+                             X_ptr,
+                             linear_func_ptr,
+                             need_update_ptr,
+                             ncase,
+                             nfeature)
 
     return {'soln':theta,
             'gradient':gradient,
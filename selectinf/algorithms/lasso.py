@@ -16,7 +16,9 @@ from copy import copy
 import numpy as np
 import pandas as pd
 from scipy.stats import norm as ndist, t as tdist
-from scipy.linalg import block_diag
+from scipy.linalg import block_diag, cho_factor, cho_solve, solve_triangular
+from scipy.sparse import issparse
+from scipy.sparse.linalg import LinearOperator
 
 from regreg.api import (glm,
                         weighted_l1norm,
@@ -31,6 +33,7 @@ from .debiased_lasso import (debiasing_matrix,
                              pseudoinverse_debiasing_matrix)
 
 from ..constraints.affine import (constraints, 
+                                  box_constraints,
                                   selection_interval,
                                   interval_constraints,
                                   sample_from_constraints,
@@ -40,6 +43,10 @@ from ..constraints.affine import (constraints,
 from ..distributions.discrete_family import discrete_family
 from ..truncated.gaussian import truncated_gaussian_old as TG
 from ..glm import pairs_bootstrap_glm
+from ..base import (screened_solve,
+                    design_columns,
+                    blocked_design,
+                    data_context)
 
 
 class lasso(object):
@@ -56,7 +63,8 @@ class lasso(object):
                  loglike,
                  feature_weights,
                  covariance_estimator=None,
-                 ignore_inactive_constraints=False):
+                 ignore_inactive_constraints=False,
+                 context=None):
         r"""
         Create a new post-selection dor the LASSO problem
         Parameters
@@ -69,6 +77,9 @@ class lasso(object):
         covariance_estimator : callable (optional)
             If None, use the parameteric
             covariance estimate of the selected model.
+        context : `data_context` (optional)
+            Cache of columns of the Gram matrix shared
+            with other queries on the same data.
         Notes
         -----
         If not None, `covariance_estimator` should
@@ -87,8 +98,12 @@ class lasso(object):
 
         self.covariance_estimator = covariance_estimator
         self.ignore_inactive_constraints = ignore_inactive_constraints
+        self.context = context
 
-    def fit(self, lasso_solution=None, solve_args={'tol': 1.e-12, 'min_its': 50}):
+    def fit(self, 
+            lasso_solution=None, 
+            solve_args={'tol': 1.e-12, 'min_its': 50},
+            screen=True):
         """
         Fit the lasso using `regreg`.
         This sets the attributes `soln`, `onestep` and
@@ -103,6 +118,10 @@ class lasso(object):
              constraints will generally not be satisfied.
         solve_args : keyword args
              Passed to `regreg.problems.simple_problem.solve`.
+        screen : bool
+             If True, solve on the variables kept by the strong
+             rule, adding back violators of the KKT conditions
+             until there are none. See `selectinf.base.screened_solve`.
         Returns
         -------
         soln : np.float
@@ -119,8 +138,13 @@ class lasso(object):
 
         self._penalty = weighted_l1norm(self.feature_weights, lagrange=1.)
         if lasso_solution is None and not hasattr(self, "lasso_solution"):
-            problem = simple_problem(self.loglike, self._penalty)
-            self.lasso_solution = problem.solve(**solve_args)
+            if screen:
+                self.lasso_solution = screened_solve(self.loglike,
+                                                     self._penalty,
+                                                     solve_args=solve_args)
+            else:
+                problem = simple_problem(self.loglike, self._penalty)
+                self.lasso_solution = problem.solve(**solve_args)
         elif lasso_solution is not None:
             self.lasso_solution = lasso_solution
 
@@ -132,8 +156,11 @@ class lasso(object):
             self.inactive = lasso_solution == 0
             self.active_signs = np.sign(lasso_solution[self.active])
             self._active_soln = lasso_solution[self.active]
-            H = self.loglike.hessian(self.lasso_solution)
-            H_AA = H[self.active][:, self.active]
+            H_AA, H_IA, H_II = _hessian_blocks(self.loglike,
+                                               self.lasso_solution,
+                                               self.active,
+                                               self.inactive,
+                                               context=self.context)
             H_AAinv = np.linalg.inv(H_AA)
             Q = self.loglike.quadratic
             G_Q = Q.objective(self.lasso_solution, 'grad')
@@ -145,9 +172,15 @@ class lasso(object):
             self.active_penalized = self.feature_weights[self.active] != 0
 
             if self.active_penalized.sum():
-                self._constraints = constraints(-np.diag(self.active_signs)[self.active_penalized],
-                                                (self.active_signs * dbeta_A)[self.active_penalized],
-                                                covariance=H_AAinv)
+                # sign constraints s_A * beta_A >= -s_A * dbeta_A
+                # on the penalized active coordinates
+                _lower = np.where(self.active_penalized,
+                                  -self.active_signs * dbeta_A,
+                                  -np.inf)
+                self._constraints = box_constraints(_lower,
+                                                    np.inf * np.ones(_lower.shape),
+                                                    sign=self.active_signs,
+                                                    covariance=H_AAinv)
             else:
                 self._constraints = constraints(np.identity(self.active.shape[0]),
                                                 1.e12 * np.ones(self.active.shape[0]) * H_AAinv.max(),
@@ -158,17 +191,17 @@ class lasso(object):
 
                 # inactive constraints
 
-                H_IA = H[self.inactive][:, self.active]
-                H_II = H[self.inactive][:, self.inactive]
-                inactive_cov = H_II - H_IA.dot(H_AAinv).dot(H_IA.T)
+                # the inactive covariance H_II - H_IA H_AA^{-1} H_AI
+                # is kept as an operator and the constraints |G_I| <= w_I
+                # as a box, so nothing of size p_I x p_I is formed
+
                 irrepresentable = H_IA.dot(H_AAinv)
                 inactive_mean = irrepresentable.dot(-G_A)
-                self._inactive_constraints = constraints(np.vstack([np.identity(self.inactive.sum()),
-                                                                    -np.identity(self.inactive.sum())]),
-                                                         np.hstack([self.feature_weights[self.inactive],
-                                                                    self.feature_weights[self.inactive]]),
-                                                         covariance=inactive_cov,
-                                                         mean=inactive_mean)
+                inactive_cov = _schur_complement(H_II, H_IA, irrepresentable)
+                self._inactive_constraints = box_constraints(-self.feature_weights[self.inactive],
+                                                             self.feature_weights[self.inactive],
+                                                             covariance=inactive_cov,
+                                                             mean=inactive_mean)
                 if not self._inactive_constraints(G_I):
                     warnings.warn(
                         'inactive constraint of KKT conditions not satisfied -- perhaps need to solve with more accuracy')
@@ -243,7 +276,9 @@ class lasso(object):
                 level=0.95,
                 compute_intervals=False,
                 dispersion=None,
-                truth=None):
+                truth=None,
+                UMAU=False,
+                ncpu=1):
         """
         Summary table for inference adjusted for selection.
 
@@ -266,83 +301,103 @@ class lasso(object):
             True values of each beta for selected variables. If not None, a column 'pval' are p-values
             computed under these corresponding null hypotheses.
 
+        UMAU : bool
+            Use UMAU intervals instead of equal-tailed ones?
+
+        ncpu : int
+            Number of processes used to solve for the
+            UMAU intervals.
+
         Returns
         -------
         pval_summary : np.recarray
             Array with one entry per active variable.
             Columns are 'variable', 'pval', 'lasso', 'onestep', 'lower_trunc', 'upper_trunc', 'sd'.
+
+        Notes
+        -----
+        All active variables are handled at once: the contrasts
+        are the columns of `np.diag(self.active_signs)`, their
+        truncation limits come from `constraints.bounds_matrix`
+        and the p-values and intervals from the vectorized
+        `pivot_matrix` and `interval_matrix`.
         """
 
         if alternative not in ['twosided', 'onesided']:
             raise ValueError("alternative must be one of ['twosided', 'onesided']")
 
+        C = self.constraints
+
         if truth is None:
             truth = np.zeros_like(self.active_signs)
 
         if dispersion is None:
             dispersion = 1.
-            
-        result = []
-        C = self.constraints
-        if C is not None:
-            _cov = C.covariance.copy()
-            C.covariance = _cov * dispersion
+
+        columns = ['variable',
+                   'pvalue',
+                   'lasso',
+                   'onestep',
+                   'lower_confidence',
+                   'upper_confidence',
+                   'lower_trunc',
+                   'upper_trunc',
+                   'sd']
+
+        if C is None:
+            return pd.DataFrame(index=self.active,
+                                data=dict([(n, []) for n in columns]))
+
+        _cov = C.covariance
+        C.covariance = _cov * dispersion
+        try:
             one_step = self.onestep_estimator
-            for i in range(one_step.shape[0]):
-                eta = np.zeros_like(one_step)
-                eta[i] = self.active_signs[i]
-                _alt = {"onesided": 'greater',
-                        'twosided': "twosided"}[alternative]
-                if C.linear_part.shape[0] > 0:  # there were some constraints
-                    _pval = C.pivot(eta, one_step, null_value=truth[i], alternative=_alt)
-                else:
-                    obs = (eta * one_step).sum()
-                    sd = np.sqrt((eta * C.covariance.dot(eta)))
-                    Z = obs / sd
-                    _pval = 2 * ndist.sf(np.fabs(Z))
+            signs = self.active_signs
+            directions = np.diag(signs)
+            _alt = {"onesided": 'greater',
+                    'twosided': "twosided"}[alternative]
+            alpha = 1 - level
+
+            L, Z, U, sd = C.bounds_matrix(directions, one_step)
+            constrained = np.asarray(C.offset).shape[0] > 0
+
+            if constrained:
+                pvalues = C.pivot_matrix(directions,
+                                         one_step,
+                                         null_value=truth,
+                                         alternative=_alt)
+            else:
+                pvalues = 2 * ndist.sf(np.fabs(Z / sd))
 
-                alpha = 1 - level
-                if compute_intervals:
-                    if C.linear_part.shape[0] > 0:  # there were some constraints
-                        try:
-                            _interval = C.interval(eta,
-                                                   one_step,
-                                                   alpha=alpha)
-                        except OverflowError:
-                            _interval = (-np.inf, np.inf)
-                        _interval = sorted([_interval[0] * self.active_signs[i],
-                                            _interval[1] * self.active_signs[i]])
-                    else:
-                        _interval = (obs - ndist.ppf(1 - alpha / 2) * sd,
-                                     obs + ndist.ppf(1 - alpha / 2) * sd)
+            if compute_intervals:
+                if constrained:
+                    intervals = C.interval_matrix(directions,
+                                                  one_step,
+                                                  alpha=alpha,
+                                                  UMAU=UMAU,
+                                                  ncpu=ncpu)
+                    intervals = np.sort(intervals * signs[:, None], 1)
                 else:
-                    _interval = [np.nan, np.nan]
-                _bounds = np.array(C.bounds(eta, one_step))
-                sd = _bounds[-1]
-                lower_trunc, est, upper_trunc = sorted(_bounds[:3] * self.active_signs[i])
-
-                result.append((self.active[i],
-                               _pval,
-                               self.lasso_solution[self.active[i]],
-                               one_step[i],
-                               _interval[0],
-                               _interval[1],
-                               lower_trunc,
-                               upper_trunc,
-                               sd))
+                    q = ndist.ppf(1 - alpha / 2)
+                    intervals = np.array([Z - q * sd, Z + q * sd]).T
+            else:
+                intervals = np.nan * np.ones((one_step.shape[0], 2))
+
+            trunc = np.sort(np.array([L, Z, U]).T * signs[:, None], 1)
+        finally:
             C.covariance = _cov
-            
+
         df = pd.DataFrame(index=self.active,
-                          data=dict([(n, d) for n, d in zip(['variable',
-                                                             'pvalue',
-                                                             'lasso',
-                                                             'onestep',
-                                                             'lower_confidence',
-                                                             'upper_confidence',
-                                                             'lower_trunc',
-                                                             'upper_trunc',
-                                                             'sd'],
-                                                            np.array(result).T)]))
+                          data=dict(zip(columns,
+                                        [self.active,
+                                         pvalues,
+                                         self.lasso_solution[self.active],
+                                         one_step,
+                                         intervals[:, 0],
+                                         intervals[:, 1],
+                                         trunc[:, 0],
+                                         trunc[:, 2],
+                                         sd])))
         df['variable'] = df['variable'].astype(int)
         return df
 
@@ -360,10 +415,64 @@ class lasso(object):
         """
         Affine constraints for this LASSO problem.
         These are the constraints determined only
-        by the active block.
+        by the active block. Formed by `fit` if
+        they have not been already.
         """
+        if not hasattr(self, "_constraints"):
+            self.fit()
         return self._constraints
 
+    def path(self, 
+             scalings,
+             solve_args={'tol': 1.e-12, 'min_its': 50}):
+        r"""
+        Solve the LASSO along a sequence of penalties
+        `scaling * self.feature_weights`, largest first,
+        warm starting each solve at the previous solution.
+
+        Parameters
+        ----------
+
+        scalings : sequence
+             Multipliers of `self.feature_weights`.
+
+        solve_args : keyword args
+             Passed to `selectinf.base.screened_solve`.
+
+        Returns
+        -------
+
+        path : [`lasso`]
+             One `lasso` per entry of `scalings`, in the same order,
+             with `lasso_solution` set. The constraints are only
+             formed (by `fit`) when `constraints` or `summary` is first
+             used. All of them share a `data_context` caching 
+             the columns of the Gram matrix $X^TWX$ for the variables 
+             active along the path, so forming constraints at many penalties
+             costs little more than doing so at the smallest one.
+
+        """
+        scalings = np.asarray(scalings, float)
+        if self.context is None:
+            self.context = data_context()
+        path = [None] * scalings.shape[0]
+
+        soln = np.zeros(self.loglike.shape)
+        for idx in np.argsort(-scalings):
+            L = lasso(self.loglike,
+                      scalings[idx] * self.feature_weights,
+                      covariance_estimator=self.covariance_estimator,
+                      ignore_inactive_constraints=self.ignore_inactive_constraints,
+                      context=self.context)
+            soln = screened_solve(self.loglike,
+                                  weighted_l1norm(L.feature_weights, lagrange=1.),
+                                  solve_args=solve_args,
+                                  initial=soln)
+            L.lasso_solution = soln.copy()
+            path[idx] = L
+
+        return path
+
     @classmethod
     def gaussian(klass,
                  X,
@@ -748,6 +857,106 @@ class lasso(object):
         return L
 
 
+def _hessian_blocks(loglike, beta, active, inactive, context=None):
+    """
+    Blocks of the Hessian of `loglike` at `beta` needed by `lasso.fit`.
+
+    When `loglike` is a `glm` with a dense or `scipy.sparse` design, 
+    the Hessian is $X^TWX$ and only the active columns $X_A$ are 
+    made dense and multiplied out, so the full $p \times p$ 
+    Hessian is never formed.
+    If `context` is a `data_context`, the columns of $X^TWX$ are 
+    cached in it and reused for later calls with the same weights $W$,
+    as happens along a path of Gaussian LASSO fits.
+
+    Parameters
+    ----------
+
+    loglike : `regreg.smooth.glm.glm`
+        A (negative) log-likelihood.
+
+    beta : np.float(p)
+        Point at which to evaluate the Hessian.
+
+    active : np.int
+        Indices of the active set.
+
+    inactive : np.bool(p)
+        Indicator of the inactive set.
+
+    context : `data_context` (optional)
+        Cache of columns of $X^TWX$.
+
+    Returns
+    -------
+
+    H_AA : np.float((|A|,|A|))
+
+    H_IA : np.float((|I|,|A|))
+
+    H_II : callable
+        Computes $H_{II}V$ for a vector or matrix $V$.
+    """
+
+    data = getattr(loglike, 'data', None)
+    if (data is not None and 
+        (isinstance(data[0], (np.ndarray, blocked_design)) or issparse(data[0])) and
+        hasattr(loglike, 'saturated_loss')):
+        X = data[0]
+        X_A = design_columns(X, active)
+        W = loglike.saturated_loss.hessian(X_A.dot(beta[active]))
+
+        if context is not None:
+            H_A = data_context.ensure(context, X).weighted_gram(W, active)
+            H_AA = H_A[active]
+            H_IA = H_A[inactive]
+        else:
+            WX_A = W[:, None] * X_A
+            H_AA = X_A.T.dot(WX_A)
+            H_IA = np.asarray(X.T.dot(WX_A))[inactive]
+
+        def H_II(V):
+            V_full = np.zeros((X.shape[1],) + V.shape[1:])
+            V_full[inactive] = V
+            XV = X.dot(V_full)
+            WXV = (W * XV.T).T
+            return np.asarray(X.T.dot(WXV))[inactive]
+
+    else:
+        H = loglike.hessian(beta)
+        H_AA = H[active][:, active]
+        H_IA = H[inactive][:, active]
+        _H_II = H[inactive][:, inactive]
+        H_II = _H_II.dot
+
+    return H_AA, H_IA, H_II
+
+def _weighted_gram(X, W, chunksize=10000):
+    r"""
+    Compute $X^TWX$ for diagonal $W$ (given as a vector) by
+    accumulating over blocks of `chunksize` rows of X,
+    so that no copy of X larger than a block is made.
+    """
+    n, p = X.shape
+    G = np.zeros((p, p))
+    for start in range(0, n, chunksize):
+        X_block = np.asarray(X[start:start + chunksize])
+        G += X_block.T.dot(W[start:start + chunksize, None] * X_block)
+    return G
+
+def _schur_complement(H_II, H_IA, irrepresentable):
+    r"""
+    Matrix-free $H_{II} - H_{IA}H_{AA}^{-1}H_{AI}$,
+    with `irrepresentable` equal to $H_{IA}H_{AA}^{-1}$.
+    """
+    p_I = H_IA.shape[0]
+    matvec = lambda V: H_II(V) - irrepresentable.dot(H_IA.T.dot(V))
+    return LinearOperator((p_I, p_I),
+                          matvec=matvec,
+                          matmat=matvec,
+                          rmatvec=matvec,
+                          dtype=float)
+
 def nominal_intervals(lasso_obj, level=0.95):
     """
     Intervals for OLS parameters of active variables
@@ -1832,7 +2041,8 @@ class ROSI(lasso):
     def fit(self,
             lasso_solution=None,
             solve_args={'tol': 1.e-12, 'min_its': 50},
-            debiasing_args={}):
+            debiasing_args={},
+            chunksize=10000):
         """
         Fit the lasso using `regreg`.
         This sets the attributes `soln`, `onestep` and
@@ -1851,6 +2061,9 @@ class ROSI(lasso):
              Arguments passed to `.debiased_lasso.debiasing_matrix`
              or `.debiased_lasso.pseudoinverse_debiasing_matrix` depending
              on `self.approximate_inverse`.
+        chunksize : int
+             Number of rows of X used at a time when
+             forming $X^TWX$ for n > p.
         Returns
         -------
         soln : np.float
@@ -1894,11 +2107,18 @@ class ROSI(lasso):
 
             if n > p and self.approximate_inverse is None:
 
-                Q = self.loglike.hessian(lasso_solution)
+                # with Q = LL^T, Q^{-1}[E][:,E] = Z^TZ where LZ = I[:,E],
+                # so only |E| columns of L^{-1} are needed, and 
+                # Q is accumulated over blocks of rows of X
+
+                Q = _weighted_gram(X, W, chunksize=chunksize)
                 E = self.active
-                Qi = np.linalg.inv(Q)
-                self._QiE = Qi[E][:, E]
-                _beta_bar = Qi.dot(self._Qbeta_bar)
+                Q_factor = cho_factor(Q, lower=True)
+                Z = solve_triangular(Q_factor[0], 
+                                     np.identity(p)[:, E],
+                                     lower=True)
+                self._QiE = Z.T.dot(Z)
+                _beta_bar = cho_solve(Q_factor, self._Qbeta_bar)
                 self._beta_barE = _beta_bar[E]
                 one_step = self._beta_barE
 
@@ -108,3 +108,23 @@ def test_modelQ():
 
 
 
+
+def test_blocked_cholesky():
+
+    n, p, s = 500, 50, 4
+    X, y, beta = gaussian_instance(n=n,
+                                   p=p,
+                                   s=s,
+                                   sigma=1)[:3]
+
+    lagrange = 1. * np.ones(p)
+
+    LF = ROSI.gaussian(X, y, lagrange, approximate_inverse=None)
+    LF.fit(chunksize=73)
+
+    # compare to the full inverse
+
+    Qi = np.linalg.inv(X.T.dot(X))
+    E = LF.active
+    np.testing.assert_allclose(LF._QiE, Qi[E][:,E])
+    np.testing.assert_allclose(LF._beta_barE, Qi.dot(X.T.dot(y))[E])
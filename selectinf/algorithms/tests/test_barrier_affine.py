@@ -0,0 +1,109 @@
+import numpy as np
+import nose.tools as nt
+
+from ...tests.flags import SET_SEED
+from ...tests.decorators import set_seed_iftrue
+from ...constraints.affine import box_constraints
+from ..barrier_affine import (solve_barrier_affine_py,
+                              solve_barrier_orthant,
+                              solve_barrier_monotone,
+                              solve_barrier,
+                              constraint_structure)
+
+def _problem(k):
+
+    W = np.random.standard_normal((k, k))
+    precision = W.dot(W.T) / k + np.identity(k)
+    conjugate_arg = 3 * np.random.standard_normal(k)
+    return conjugate_arg, precision
+
+def _compare(affine, structured):
+
+    # same objective, so the same value and
+    # solutions up to the tolerance of the solver
+
+    np.testing.assert_allclose(affine[0], structured[0], rtol=1.e-5)
+    np.testing.assert_allclose(affine[1], structured[1], rtol=1.e-3, atol=1.e-4)
+    np.testing.assert_allclose(affine[2], structured[2], rtol=1.e-3, atol=1.e-4)
+
+@set_seed_iftrue(SET_SEED)
+def test_orthant(k=8):
+
+    conjugate_arg, precision = _problem(k)
+    sign = np.random.choice([-1., 1.], k)
+    lower = np.random.standard_normal(k)
+    feasible_point = sign * (lower + 1)
+
+    # {o: sign * o >= lower} as an affine constraint,
+    # with rows permuted and rescaled
+
+    perm = np.random.permutation(k)
+    scale = np.random.uniform(1, 2, size=k)
+    con_linear = np.zeros((k, k))
+    con_linear[np.arange(k), perm] = -sign[perm] * scale
+    con_offset = -lower[perm] * scale
+
+    structure, params = constraint_structure(con_linear, con_offset)
+    nt.assert_equal(structure, 'orthant')
+    np.testing.assert_allclose(params['sign'], sign)
+    np.testing.assert_allclose(params['lower'], lower)
+
+    affine = solve_barrier_affine_py(conjugate_arg,
+                                     precision,
+                                     feasible_point,
+                                     con_linear,
+                                     con_offset)
+    _compare(affine, solve_barrier_orthant(conjugate_arg,
+                                           precision,
+                                           feasible_point,
+                                           sign,
+                                           lower))
+
+    diagnostics = {}
+    _compare(affine, solve_barrier(conjugate_arg,
+                                   precision,
+                                   feasible_point,
+                                   con_linear,
+                                   con_offset,
+                                   diagnostics=diagnostics))
+    nt.assert_equal(diagnostics['solver'], 'solve_barrier_orthant')
+
+@set_seed_iftrue(SET_SEED)
+def test_monotone(k=6):
+
+    conjugate_arg, precision = _problem(k)
+
+    # o_1 >= o_2 >= ... >= o_k >= 0
+
+    con_linear = np.vstack([-np.identity(k),
+                            np.diff(np.identity(k), axis=0)])
+    con_offset = np.zeros(2 * k - 1)
+    feasible_point = np.cumsum(np.random.exponential(size=k))[::-1]
+
+    nt.assert_equal(constraint_structure(con_linear, con_offset)[0], 'monotone')
+
+    affine = solve_barrier_affine_py(conjugate_arg,
+                                     precision,
+                                     feasible_point,
+                                     con_linear,
+                                     con_offset)
+    _compare(affine, solve_barrier_monotone(conjugate_arg,
+                                            precision,
+                                            feasible_point,
+                                            con_offset))
+
+def test_structure():
+
+    k = 5
+    nt.assert_equal(constraint_structure(box_constraints(np.zeros(k),
+                                                         np.inf * np.ones(k)))[0], 'orthant')
+    nt.assert_equal(constraint_structure(box_constraints(np.zeros(k),
+                                                         np.ones(k)))[0], 'affine')
+    nt.assert_equal(constraint_structure(np.random.standard_normal((3, k)),
+                                         np.ones(3))[0], 'affine')
+
+    # a coordinate constrained twice is not an orthant
+
+    con_linear = -np.identity(k)
+    con_linear[1, 0] = -1
+    nt.assert_equal(constraint_structure(con_linear, np.zeros(k))[0], 'affine')
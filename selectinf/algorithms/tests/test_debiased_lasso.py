@@ -84,6 +84,28 @@ def test_approx_inverse_nondegen(n=100, p=20):
 
     M = debiasing_matrix(X, np.arange(p))
 
+def test_debiasing_threads(n=100, p=40):
+    X = np.random.standard_normal((n, p))
+    X[:, 3] = X[:, 3] + X[:, 5]
+    rows = np.arange(0, p, 3)
+
+    # rows solved in threads are the same
+
+    M = debiasing_matrix(X, rows)
+    M_threads = debiasing_matrix(X, rows, nthreads=3)
+    np.testing.assert_allclose(M, M_threads)
+
+    # warm starts change only the path to the solution
+
+    solve_args = {'kkt_tol':1.e-14, 
+                  'parameter_tol':1.e-14, 
+                  'objective_tol':1.e-14, 
+                  'max_iter':1000, 
+                  'linesearch':False}
+    M = debiasing_matrix(X, rows, 0.3, **solve_args)
+    M_warm = debiasing_matrix(X, rows, 0.3, nthreads=2, warm_start=True, **solve_args)
+    np.testing.assert_allclose(M, M_warm, rtol=1.e-6, atol=1.e-8)
+
 @np.testing.dec.skipif(not rpy2_available, msg="rpy2 not available, skipping test")
 def test_compareR(n=100, p=30):
     X = np.random.standard_normal((n, p))
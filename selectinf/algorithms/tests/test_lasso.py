@@ -17,8 +17,10 @@ from ..lasso import (lasso,
                      standard_lasso,
                      nominal_intervals,
                      glm_sandwich_estimator,
-                     glm_parametric_estimator)
+                     glm_parametric_estimator,
+                     _hessian_blocks)
 from ..sqrt_lasso import (solve_sqrt_lasso, choose_lambda)
+from ...base import screened_solve
 
 import regreg.api as rr
 
@@ -119,6 +121,117 @@ def test_logistic():
 
         return L, C, P
 
+@set_seed_iftrue(True)
+def test_summary_vectorized(n=100, p=20):
+
+    X, y = instance(n=n, p=p, s=3, sigma=1, signal=4)[:2]
+    lam = np.mean(np.fabs(np.dot(X.T, np.random.standard_normal((n, 1000)))).max(0))
+    L = lasso.gaussian(X, y, lam)
+    L.fit()
+    S = L.summary(alternative='onesided', compute_intervals=True, dispersion=1.5)
+
+    # compare to one contrast at a time
+
+    C = L.constraints
+    C.covariance = C.covariance * 1.5
+    for i, var in enumerate(L.active):
+        eta = np.zeros_like(L.onestep_estimator)
+        eta[i] = L.active_signs[i]
+        np.testing.assert_allclose(S['pvalue'][var], 
+                                   C.pivot(eta, L.onestep_estimator, alternative='greater'),
+                                   rtol=1.e-6)
+        interval = sorted(np.array(C.interval(eta, L.onestep_estimator, alpha=0.05)) * 
+                          L.active_signs[i])
+        np.testing.assert_allclose([S['lower_confidence'][var], S['upper_confidence'][var]],
+                                   interval, rtol=1.e-6)
+    C.covariance = C.covariance / 1.5
+
+    S1 = L.summary(compute_intervals=True, UMAU=True)
+    S2 = L.summary(compute_intervals=True, UMAU=True, ncpu=2)
+    np.testing.assert_allclose(S1['upper_confidence'], S2['upper_confidence'])
+
+@set_seed_iftrue(True)
+def test_path(n=100, p=20):
+
+    X, y = instance(n=n, p=p, s=3, sigma=1, signal=4)[:2]
+    lam = np.mean(np.fabs(np.dot(X.T, np.random.standard_normal((n, 1000)))).max(0))
+    scalings = [0.6, 1.5, 1., 0.8]
+
+    L = lasso.gaussian(X, y, lam)
+    path = L.path(scalings)
+    nt.assert_equal(len(path), len(scalings))
+
+    for scaling, L_path in zip(scalings, path):
+        L_single = lasso.gaussian(X, y, scaling * lam)
+        L_single.fit()
+        np.testing.assert_allclose(L_path.lasso_solution, L_single.lasso_solution,
+                                   atol=1.e-5, rtol=1.e-5)
+
+        # constraints are formed lazily
+
+        nt.assert_false(hasattr(L_path, '_constraints'))
+        S_path, S_single = L_path.summary(), L_single.summary()
+        nt.assert_true(hasattr(L_path, '_constraints'))
+        np.testing.assert_array_equal(S_path['variable'], S_single['variable'])
+        np.testing.assert_allclose(S_path['pvalue'], S_single['pvalue'], 
+                                   rtol=1.e-3, atol=1.e-4)
+
+@set_seed_iftrue(True)
+def test_strong_rule_screening(n=100, p=500):
+
+    X, y = instance(n=n, p=p, s=3, sigma=1, signal=4)[:2]
+    lam_max = np.fabs(X.T.dot(y)).max()
+    group_weights = dict([(g, 0.7 * lam_max) for g in range(p // 5)])
+
+    for frac in [0.8, 0.6, 0.3]:
+        weights = frac * lam_max * np.ones(p)
+        weights[:2] = 0
+
+        L_screen = lasso.gaussian(X, y, weights)
+        L_screen.fit(screen=True)
+
+        L_full = lasso.gaussian(X, y, weights)
+        L_full.fit(screen=False)
+
+        np.testing.assert_allclose(L_screen.lasso_solution, L_full.lasso_solution,
+                                   atol=1.e-6, rtol=1.e-6)
+
+    loss = rr.glm.gaussian(X, y)
+    penalty = rr.group_lasso(np.repeat(np.arange(p // 5), 5), 
+                             weights=group_weights,
+                             lagrange=1.)
+    quad = rr.identity_quadratic(0.1, 0, np.random.standard_normal(p), 0)
+    soln_screen = screened_solve(loss, penalty, quadratic=quad)
+    soln_full = rr.simple_problem(loss, penalty).solve(quad, tol=1.e-12, min_its=50)
+    np.testing.assert_allclose(soln_screen, soln_full, atol=1.e-6, rtol=1.e-6)
+
+@set_seed_iftrue(True)
+def test_hessian_blocks(n=100, p=30):
+
+    X = np.random.standard_normal((n,p))
+    Y = np.random.binomial(1, 0.5, size=(n,))
+
+    L = lasso.logistic(X, Y, 2.)
+    L.fit()
+    active, inactive = L.active, L.inactive
+
+    H = L.loglike.hessian(L.lasso_solution)
+    H_AA, H_IA, H_II = _hessian_blocks(L.loglike, L.lasso_solution, active, inactive)
+
+    np.testing.assert_allclose(H_AA, H[active][:,active])
+    np.testing.assert_allclose(H_IA, H[inactive][:,active])
+    V = np.random.standard_normal((inactive.sum(), 3))
+    np.testing.assert_allclose(H_II(V), H[inactive][:,inactive].dot(V))
+
+    # matrix-free inactive covariance agrees with the dense one
+
+    H_AAinv = np.linalg.inv(H_AA)
+    inactive_cov = H[inactive][:,inactive] - H_IA.dot(H_AAinv).dot(H_IA.T)
+    C = L._inactive_constraints
+    np.testing.assert_allclose(C.covariance.dot(np.identity(inactive.sum())), 
+                               inactive_cov)
+    nt.assert_true(C(L._G_I))
+
 @set_seed_iftrue(True)
 def test_poisson():
 
@@ -1,3 +1,11 @@
+import hashlib
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+from scipy.sparse import issparse
+
 import regreg.api as rr
 import regreg.affine as ra
 
@@ -24,14 +32,674 @@ def restricted_estimator(loss, active, solve_args={'min_its':50, 'tol':1.e-10}):
         Solution to restricted problem.
 
     """
-    X, Y = loss.data
-
-    if not loss._is_transform and hasattr(loss, 'saturated_loss'): # M_est is a glm
-        X_restricted = X[:,active]
-        loss_restricted = rr.affine_smooth(loss.saturated_loss, X_restricted)
-    else:
-        I_restricted = ra.selector(active, ra.astransform(X).input_shape[0], ra.identity((active.sum(),)))
-        loss_restricted = rr.affine_smooth(loss, I_restricted.T)
+    loss_restricted = _restrict_loss(loss, active)
     beta_E = loss_restricted.solve(**solve_args)
     
     return beta_E
+
+def screened_solve(loss, 
+                   penalty,
+                   quadratic=None,
+                   solve_args={'min_its':50, 'tol':1.e-12},
+                   max_rounds=50,
+                   initial=None):
+    r"""
+    Solve a LASSO or group LASSO problem
+
+    .. math::
+
+        \text{minimize}_{\beta} \ell(\beta) + Q(\beta) + 
+        \sum_g w_g \|\beta_g\|_2
+
+    on a screened set of groups, discarding groups 
+    up front by the strong rule and adding back violators
+    of the KKT conditions until there are none.
+
+    A group $g$ is kept if $w_g=0$ or 
+    $\|\nabla_g (\ell + Q)(0)\|_2 \geq w_g (2 - s_{\max})$ where
+    $s_{\max} = \max_g \|\nabla_g (\ell + Q)(0)\|_2 / w_g$ is the 
+    smallest scaling of the weights with solution 0.
+    After each solve the gradient at the solution is checked 
+    on the discarded groups, so the result is a solution
+    of the full problem.
+
+    Parameters
+    ----------
+
+    loss : objective function
+        A GLM loss, or other smooth loss.
+
+    penalty : `rr.weighted_l1norm` or `rr.group_lasso`
+        The penalty.
+
+    quadratic : `rr.identity_quadratic` (optional)
+        Quadratic term added to the objective, 
+        as in `rr.simple_problem.solve`.
+
+    solve_args : dict
+        Passed to `solve`.
+
+    max_rounds : int
+        Maximum number of rounds of adding back KKT violators
+        before solving the full problem.
+
+    initial : ndarray (optional)
+        Warm start for the solver. Groups nonzero 
+        in `initial` are never discarded.
+
+    Returns
+    -------
+
+    soln : ndarray
+        Solution to the full problem.
+
+    """
+    p = loss.shape[0]
+
+    if quadratic is None:
+        quadratic = rr.identity_quadratic(0, 0, 0, 0)
+    if getattr(loss, 'quadratic', None) is not None:
+        full_quadratic = quadratic + loss.quadratic
+    else:
+        full_quadratic = quadratic
+
+    lagrange = penalty.lagrange
+    if hasattr(penalty, 'groups'): # group lasso
+        labels = np.asarray(penalty.groups)
+        index = group_index.from_penalty(penalty)
+        group_labels, group_inverse = index.labels, index.inverse
+        group_weights = lagrange * np.array([penalty.weights[g] for g in group_labels])
+    else:
+        labels = None
+        group_inverse = np.arange(p)
+        group_weights = lagrange * np.asarray(penalty.weights) * np.ones(p)
+    ngroup = group_weights.shape[0]
+
+    def gradient(beta):
+        return (loss.smooth_objective(beta, 'grad') + 
+                full_quadratic.objective(beta, 'grad'))
+
+    def group_norms(G):
+        return np.sqrt(np.bincount(group_inverse, weights=G**2, minlength=ngroup))
+
+    def full_solve(initial=None):
+        problem = rr.simple_problem(loss, penalty)
+        if initial is not None:
+            problem.coefs[:] = initial
+        return problem.solve(quadratic, **solve_args)
+
+    if initial is None:
+        initial = np.zeros(p)
+
+    penalized = group_weights > 0
+    norms = group_norms(gradient(np.zeros(p)))
+    if not penalized.sum():
+        return full_solve(initial=initial)
+    s_max = (norms[penalized] / group_weights[penalized]).max()
+    keep_groups = ~penalized | (norms >= group_weights * (2 - s_max))
+    keep_groups |= group_norms(initial) > 0
+
+    beta = np.array(initial, float)
+    for _ in range(max_rounds):
+        if keep_groups.all():
+            break
+        keep = keep_groups[group_inverse]
+
+        loss_restricted = _restrict_loss(loss, keep)
+        quadratic_restricted = _restrict_quadratic(full_quadratic, keep)
+        if labels is not None:
+            penalty_restricted = rr.group_lasso(labels[keep],
+                                                weights=dict([(g, penalty.weights[g]) 
+                                                              for g in np.unique(labels[keep])]),
+                                                lagrange=lagrange)
+        else:
+            penalty_restricted = rr.weighted_l1norm(group_weights[keep] / lagrange,
+                                                    lagrange=lagrange)
+        problem = rr.simple_problem(loss_restricted, penalty_restricted)
+        problem.coefs[:] = beta[keep]
+        beta = np.zeros(p)
+        beta[keep] = problem.solve(quadratic_restricted, **solve_args)
+
+        # KKT conditions on the discarded groups
+
+        norms = group_norms(gradient(beta))
+        violators = ~keep_groups & (norms > group_weights)
+        if not violators.any():
+            return beta
+        keep_groups = keep_groups | violators
+
+    return full_solve(initial=beta)
+
+def _restrict_loss(loss, keep):
+    """
+    The loss as a function of `beta[keep]`, 
+    with the other coordinates fixed at 0.
+    """
+    X, Y = loss.data
+
+    if not loss._is_transform and hasattr(loss, 'saturated_loss'): # M_est is a glm
+        return rr.affine_smooth(loss.saturated_loss, X[:,keep])
+    I_restricted = ra.selector(keep, ra.astransform(X).input_shape[0], ra.identity((keep.sum(),)))
+    return rr.affine_smooth(loss, I_restricted.T)
+
+def _restrict_quadratic(quadratic, keep):
+    """
+    An `rr.identity_quadratic` restricted to `beta[keep]`.
+    """
+    def _restrict(v):
+        v = np.asarray(v)
+        if v.shape:
+            return v[keep]
+        return v
+    return rr.identity_quadratic(quadratic.coef,
+                                 _restrict(quadratic.center),
+                                 _restrict(quadratic.linear_term),
+                                 quadratic.constant_term)
+
+def design_columns(X, columns=None):
+    """
+    Dense columns of a (possibly sparse) design.
+
+    Parameters
+    ----------
+
+    X : ndarray, `scipy.sparse` matrix or `blocked_design`
+        Design matrix.
+
+    columns : ndarray (optional)
+        Which columns to extract, boolean or integer.
+        Defaults to all columns.
+
+    Returns
+    -------
+
+    X_E : ndarray
+        Dense array with the selected columns.
+
+    """
+    if columns is not None:
+        X = X[:, columns]
+    if issparse(X) or isinstance(X, blocked_design):
+        return X.toarray()
+    return np.asarray(X)
+
+def weighted_gram(X, W, columns=None):
+    r"""
+    Weighted cross products $X^TWX_E$ of a (possibly sparse) design 
+    with its columns $E$.
+
+    For a sparse design only $X_E$ is made dense and the
+    product is a sparse-dense product, so the cost is proportional
+    to the number of nonzeros of $X$ times $|E|$.
+
+    Parameters
+    ----------
+
+    X : ndarray, `scipy.sparse` matrix or `blocked_design`
+        Design matrix of shape `(n, p)`.
+
+    W : ndarray
+        Weights of shape `(n,)`.
+
+    columns : ndarray (optional)
+        Columns $E$, boolean or integer. Defaults to all columns.
+
+    Returns
+    -------
+
+    Q : ndarray
+        Dense array of shape `(p, |E|)`.
+
+    """
+    if isinstance(X, blocked_design):
+        return X.weighted_gram(W, columns)
+    if issparse(X) and columns is None:
+        return np.asarray(X.T.dot(X.multiply(W[:, None]).tocsc()).toarray())
+    WX_E = W[:, None] * design_columns(X, columns)
+    return np.asarray(X.T.dot(WX_E))
+
+def column_norms2(X):
+    """
+    Squared Euclidean norms of the columns 
+    of a (possibly sparse) design.
+    """
+    if isinstance(X, blocked_design):
+        return X.column_norms2()
+    if issparse(X):
+        return np.asarray(X.multiply(X).sum(0)).reshape(-1)
+    return (X ** 2).sum(0)
+
+class blocked_design(ra.affine_transform):
+
+    r"""
+    A design matrix read in blocks of rows, 
+    such as a `np.memmap` of a `.npy` file larger than memory.
+
+    Products $X\beta$, $X^Tr$ and $X^TWX_E$ are accumulated
+    over blocks of `chunksize` rows, optionally reduced
+    in a pool of `nthreads` threads. Only one block of rows 
+    per thread is resident at a time. 
+
+    The object can be used as the design of a `regreg` GLM,
+    and by `design_columns`, `weighted_gram` and `column_norms2`.
+    Indexing columns, as in `X[:, E]`, returns a `blocked_design`
+    reading only those columns.
+    """
+
+    def __init__(self, 
+                 X, 
+                 chunksize=10000, 
+                 nthreads=1,
+                 columns=None):
+        r"""
+        Parameters
+        ----------
+
+        X : ndarray
+            Design matrix, typically a `np.memmap`.
+
+        chunksize : int
+            Number of rows in each block.
+
+        nthreads : int
+            Number of threads reducing over blocks.
+
+        columns : ndarray (optional)
+            Integer indices of the columns of `X` to use.
+
+        """
+        self.X = X
+        self.chunksize = int(chunksize)
+        self.nthreads = nthreads
+        self.columns = columns
+
+        n = X.shape[0]
+        p = X.shape[1] if columns is None else len(columns)
+        self.shape = (n, p)
+        self.input_shape, self.output_shape = (p,), (n,)
+        self.affine_offset = None
+        self.linear_operator = None
+        self.diagD = False
+
+    @staticmethod
+    def from_npy(filename, 
+                 chunksize=10000, 
+                 nthreads=1):
+        """
+        Memory-map a design stored by `np.save`.
+        """
+        return blocked_design(np.load(filename, mmap_mode='r'),
+                              chunksize=chunksize,
+                              nthreads=nthreads)
+
+    def _blocks(self):
+        n = self.shape[0]
+        return [slice(start, min(start + self.chunksize, n)) 
+                for start in range(0, n, self.chunksize)]
+
+    def _read(self, rows):
+        X_block = np.asarray(self.X[rows])
+        if self.columns is not None:
+            X_block = X_block[:, self.columns]
+        return X_block
+
+    def _map(self, f):
+        blocks = self._blocks()
+        if self.nthreads > 1:
+            pool = ThreadPool(self.nthreads)
+            try:
+                pool.map(f, blocks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for rows in blocks:
+                f(rows)
+
+    def _reduce(self, f):
+        blocks = self._blocks()
+        if self.nthreads > 1:
+            pool = ThreadPool(self.nthreads)
+            try:
+                results = pool.imap_unordered(f, blocks)
+                value = next(results)
+                for result in results:
+                    value += result
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            value = f(blocks[0])
+            for rows in blocks[1:]:
+                value += f(rows)
+        return value
+
+    def dot(self, beta):
+        """
+        Compute $X\beta$ for a vector or matrix $\beta$.
+        """
+        beta = np.asarray(beta)
+        value = np.zeros((self.shape[0],) + beta.shape[1:])
+        def f(rows):
+            value[rows] = self._read(rows).dot(beta)
+        self._map(f)
+        return value
+
+    def linear_map(self, beta):
+        return self.dot(beta)
+
+    def affine_map(self, beta):
+        return self.dot(beta)
+
+    def adjoint_map(self, r):
+        """
+        Compute $X^Tr$ for a vector or matrix $r$,
+        e.g. $X^Ty$ or the gradient of a GLM.
+        """
+        r = np.asarray(r)
+        return self._reduce(lambda rows: self._read(rows).T.dot(r[rows]))
+
+    @property
+    def T(self):
+        return _blocked_adjoint(self)
+
+    def weighted_gram(self, W, columns=None):
+        r"""
+        Compute $X^TWX_E$ for the columns $E$ 
+        (all columns by default).
+        """
+        def f(rows):
+            X_block = self._read(rows)
+            X_E = X_block if columns is None else X_block[:, columns]
+            return X_block.T.dot(W[rows, None] * X_E)
+        return self._reduce(f)
+
+    def column_norms2(self):
+        """
+        Squared Euclidean norms of the columns.
+        """
+        return self._reduce(lambda rows: (self._read(rows) ** 2).sum(0))
+
+    def toarray(self):
+        value = np.zeros(self.shape)
+        def f(rows):
+            value[rows] = self._read(rows)
+        self._map(f)
+        return value
+
+    def __getitem__(self, index):
+        if (isinstance(index, tuple) and len(index) == 2 and 
+            isinstance(index[0], slice) and index[0] == slice(None)):
+            columns = np.arange(self.shape[1])[index[1]]
+            if self.columns is not None:
+                columns = self.columns[columns]
+            return blocked_design(self.X,
+                                  chunksize=self.chunksize,
+                                  nthreads=self.nthreads,
+                                  columns=columns)
+        if isinstance(index, tuple):
+            rows, columns = index
+            return self._read(rows)[:, columns]
+        return self._read(index)
+
+class _blocked_adjoint(object):
+
+    """
+    Transpose of a `blocked_design`, with only a `dot` method.
+    """
+
+    def __init__(self, design):
+        self.design = design
+        self.shape = design.shape[::-1]
+
+    def dot(self, r):
+        return self.design.adjoint_map(r)
+
+class data_context(object):
+
+    r"""
+    Cache of quantities computed from a design $X$ and
+    weights $W$, shared by queries and targets formed 
+    on the same data.
+
+    Columns of the Gram matrix $X^TWX$, Cholesky factors 
+    and inverses of its blocks, and restricted estimators 
+    are computed once and stored. Entries are keyed on 
+    the weights $W$ (through a digest of their values) and 
+    the columns involved, and the least recently used ones 
+    are evicted once the cache holds more than `max_bytes`.
+    A context is bound to the first design it sees 
+    and refuses any other.
+    """
+
+    def __init__(self, X=None, max_bytes=2**28):
+        r"""
+        Parameters
+        ----------
+
+        X : ndarray, `scipy.sparse` matrix or `blocked_design` (optional)
+            Design matrix. If None, bound on first use.
+
+        max_bytes : int
+            Bound on the memory used by cached arrays.
+
+        """
+        self.X = X
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._nbytes = 0
+
+    @staticmethod
+    def ensure(context, X):
+        """
+        Return `context` after checking it was built 
+        for `X`, or a new context for `X` if `context` is None.
+        """
+        if context is None:
+            return data_context(X)
+        context._check(X)
+        return context
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def clear(self):
+        self._cache.clear()
+        self._nbytes = 0
+
+    def _check(self, X):
+        if self.X is None:
+            self.X = X
+        elif self.X is not X:
+            raise ValueError('data_context was built for a different design')
+
+    def _columns(self, columns):
+        p = self.X.shape[1]
+        if columns is None:
+            return np.arange(p)
+        return np.arange(p)[columns]
+
+    def _lookup(self, key):
+        value = self._cache.pop(key, None)
+        if value is not None:
+            self._cache[key] = value # most recently used
+        return value
+
+    def _store(self, key, value, nbytes):
+        if key in self._cache:
+            self._nbytes -= _nbytes(self._cache.pop(key))
+        if nbytes > self.max_bytes:
+            return value
+        self._cache[key] = value
+        self._nbytes += nbytes
+        while self._nbytes > self.max_bytes:
+            _, old = self._cache.popitem(last=False)
+            self._nbytes -= _nbytes(old)
+        return value
+
+    def _get(self, key, compute):
+        value = self._lookup(key)
+        if value is None:
+            value = compute()
+            self._store(key, value, _nbytes(value))
+        return value
+
+    def weighted_gram(self, W, columns=None):
+        r"""
+        Columns $E$ of $X^TWX$, as in `weighted_gram`,
+        computing only those columns not yet cached.
+        """
+        wkey = _digest(W)
+        columns = self._columns(columns)
+
+        cached = [self._lookup(('column', wkey, j)) for j in columns]
+        missing = [j for j, col in zip(columns, cached) if col is None]
+        if missing:
+            Q_new = weighted_gram(self.X, W, missing)
+            new = dict([(j, Q_new[:, i]) for i, j in enumerate(missing)])
+            cached = [col if col is not None else new[j] 
+                      for j, col in zip(columns, cached)]
+            for j in missing:
+                self._store(('column', wkey, j), new[j], new[j].nbytes)
+
+        if not len(columns):
+            return np.zeros((self.X.shape[1], 0))
+        return np.array(cached).T
+
+    def cholesky(self, W, columns=None):
+        r"""
+        Cholesky factor, as returned by `scipy.linalg.cho_factor`,
+        of the block $Q_{EE}$ of $Q=X^TWX$.
+        """
+        columns = self._columns(columns)
+        def compute():
+            Q_EE = self.weighted_gram(W, columns)[columns]
+            return cho_factor(Q_EE)
+        return self._get(('cholesky', _digest(W), tuple(columns)), compute)
+
+    def inverse(self, W, columns=None):
+        r"""
+        Inverse $Q_{EE}^{-1}$ of the block $Q_{EE}$ of $Q=X^TWX$.
+        """
+        columns = self._columns(columns)
+        def compute():
+            factor = self.cholesky(W, columns)
+            return cho_solve(factor, np.identity(len(columns)))
+        return self._get(('inverse', _digest(W), tuple(columns)), compute)
+
+    def inverse_block(self, W, columns):
+        r"""
+        Block $(Q^{-1})_{EE}$ of the inverse of $Q=X^TWX$.
+        """
+        columns = self._columns(columns)
+        def compute():
+            p = self.X.shape[1]
+            factor = self.cholesky(W)
+            E = np.zeros((p, len(columns)))
+            E[columns, np.arange(len(columns))] = 1
+            return cho_solve(factor, E)[columns]
+        return self._get(('inverse_block', _digest(W), tuple(columns)), compute)
+
+    def restricted_estimator(self, 
+                             loss, 
+                             active, 
+                             solve_args={'min_its':50, 'tol':1.e-10}):
+        """
+        Cached `restricted_estimator` of `loss`
+        using only columns `active`.
+        """
+        self._check(loss.data[0])
+        key = ('restricted', 
+               id(loss), 
+               tuple(self._columns(active)), 
+               tuple(sorted(solve_args.items())))
+        value = self._lookup(key)
+        if value is None or value[0] is not loss:
+            value = (loss, restricted_estimator(loss, active, solve_args=solve_args))
+            self._store(key, value, value[1].nbytes)
+        return value[1].copy()
+
+def _digest(W):
+    return hashlib.sha1(np.ascontiguousarray(W, np.float64).tobytes()).hexdigest()
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return sum([_nbytes(v) for v in value 
+                if isinstance(v, (np.ndarray, tuple))])
+
+class group_index(object):
+
+    """
+    Compact index of the groups of a group LASSO penalty.
+
+    Coordinates are stably sorted by group, so the coordinates
+    of the `k`-th group (in sorted order of labels) are
+    `order[offsets[k]:offsets[k+1]]`, in increasing order.
+    Built once, it replaces a scan `groups == g` of all 
+    coordinates for each group.
+    """
+
+    def __init__(self, groups):
+        """
+        Parameters
+        ----------
+
+        groups : ndarray
+            Group label of each coordinate.
+
+        """
+        self.groups = groups
+        (self.labels,
+         self.inverse) = np.unique(np.asarray(groups), return_inverse=True)
+        self.order = np.argsort(self.inverse, kind='mergesort')
+        self.sizes = np.bincount(self.inverse, minlength=self.labels.shape[0])
+        self.offsets = np.hstack([0, np.cumsum(self.sizes)])
+        self._position = dict([(label, k) for k, label in enumerate(self.labels)])
+
+    @staticmethod
+    def from_penalty(penalty):
+        """
+        The index of `penalty.groups`, built once
+        and stored on the penalty.
+        """
+        index = getattr(penalty, '_group_index', None)
+        if index is None or index.groups is not penalty.groups:
+            index = group_index(penalty.groups)
+            penalty._group_index = index
+        return index
+
+    @property
+    def ngroup(self):
+        return self.labels.shape[0]
+
+    def position(self, label):
+        """
+        Position of group `label` in `labels`.
+        """
+        return self._position[label]
+
+    def indices(self, label):
+        """
+        Coordinates in group `label`.
+        """
+        k = self._position[label]
+        return self.order[self.offsets[k]:self.offsets[k+1]]
+
+    def features(self, labels):
+        """
+        Coordinates in the groups `labels`, concatenated
+        in the order of `labels`.
+        """
+        if not len(labels):
+            return np.zeros(0, np.intp)
+        return np.hstack([self.indices(label) for label in labels])
+
+    def norms(self, x):
+        """
+        Euclidean norm of `x` over each group, 
+        in the order of `labels`.
+        """
+        x = np.asarray(x)[self.order]
+        return np.sqrt(np.add.reduceat(x ** 2, self.offsets[:-1]))
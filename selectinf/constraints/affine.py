@@ -16,9 +16,14 @@ from warnings import warn
 from copy import copy
 
 import numpy as np
-
-from ..distributions.pvalue import truncnorm_cdf, norm_interval
-from ..truncated.gaussian import truncated_gaussian, truncated_gaussian_old
+from scipy.sparse import csr_matrix
+
+from ..distributions.pvalue import (truncnorm_cdf,
+                                    truncnorm_cdf_vec,
+                                    norm_interval)
+from ..truncated.gaussian import (truncated_gaussian,
+                                  equal_tailed_intervals,
+                                  UMAU_intervals)
 from ..sampling.api import (sample_truncnorm_white, 
                             sample_truncnorm_white_sphere,
                             sample_truncnorm_white_ball)
@@ -211,6 +216,19 @@ class constraints(object):
 
         """
 
+        covariance, mean, rank = self._conditional_moments(linear_part,
+                                                           value,
+                                                           rank=rank)
+        return constraints(self.linear_part,
+                           self.offset,
+                           covariance=covariance,
+                           mean=mean,
+                           rank=rank)
+
+    def _conditional_moments(self, linear_part, value, rank=None):
+        # covariance, mean and rank of the Gaussian
+        # after conditioning on linear_part.dot(Y) == value
+
         S = self.covariance
         C, d = linear_part, value
 
@@ -231,11 +249,9 @@ class constraints(object):
             else:
                 rank = 1
 
-        return constraints(self.linear_part,
-                           self.offset,
-                           covariance=self.covariance - delta_cov,
-                           mean=self.mean - delta_mean,
-                           rank=self.rank - rank)
+        return (self.covariance - delta_cov,
+                self.mean - delta_mean,
+                self.rank - rank)
 
     def bounds(self, direction_of_interest, Y):
         r"""
@@ -339,6 +355,99 @@ class constraints(object):
         else:
             return max(2 * min(P, 1-P), 0)
 
+    def bounds_matrix(self, directions_of_interest, Y):
+        r"""
+        Vectorized version of `bounds` for several
+        directions $\eta_1, \dots, \eta_k$ at once.
+
+        Parameters
+        ----------
+
+        directions_of_interest: np.float((n,k))
+            Matrix whose columns are the directions $\eta_j$
+            for which we may want to form
+            selection intervals or tests.
+
+        Y : np.float
+            A realization of $N(\mu,\Sigma)$ where
+            $\Sigma$ is `self.covariance`.
+
+        Returns
+        -------
+
+        L : np.float(k)
+            Lower truncation bounds.
+
+        Z : np.float(k)
+            The observed $\eta_j^TY$.
+
+        U : np.float(k)
+            Upper truncation bounds.
+
+        S : np.float(k)
+            Standard deviations of $\eta_j^TY$.
+
+        """
+        return interval_constraints_matrix(self.linear_part,
+                                           self.offset,
+                                           self.covariance,
+                                           Y,
+                                           directions_of_interest)
+
+    def pivot_matrix(self,
+                     directions_of_interest,
+                     Y,
+                     null_value=None,
+                     alternative='greater'):
+        r"""
+        Vectorized version of `pivot` for several
+        directions $\eta_1, \dots, \eta_k$ at once.
+
+        Parameters
+        ----------
+
+        directions_of_interest: np.float((n,k))
+            Matrix whose columns are the directions $\eta_j$
+            for which we may want to form
+            selection intervals or tests.
+
+        Y : np.float
+            A realization of $N(0,\Sigma)$ where
+            $\Sigma$ is `self.covariance`.
+
+        null_value : np.float(k) (optional)
+            Hypothesized values of $\eta_j^T\mu$. Defaults
+            to $\eta_j^T$ `self.mean`.
+
+        alternative : ['greater', 'less', 'twosided']
+            What alternative to use.
+
+        Returns
+        -------
+
+        P : np.float(k)
+            $p$-values of corresponding tests.
+
+        """
+
+        if alternative not in ['greater', 'less', 'twosided']:
+            raise ValueError("alternative should be one of ['greater', 'less', 'twosided']")
+        L, Z, U, S = self.bounds_matrix(directions_of_interest, Y)
+
+        if null_value is None:
+            meanZ = np.asarray(directions_of_interest).T.dot(self.mean)
+        else:
+            meanZ = null_value
+
+        P = truncnorm_cdf_vec((Z-meanZ)/S, (L-meanZ)/S, (U-meanZ)/S)
+
+        if alternative == 'greater':
+            return 1 - P
+        elif alternative == 'less':
+            return P
+        else:
+            return np.maximum(2 * np.minimum(P, 1-P), 0)
+
     def interval(self, direction_of_interest, Y,
                  alpha=0.05, UMAU=False):
         r"""
@@ -387,6 +496,51 @@ class constraints(object):
             alpha=alpha,
             UMAU=UMAU)
 
+    def interval_matrix(self, directions_of_interest, Y,
+                        alpha=0.05, UMAU=False, ncpu=1):
+        r"""
+        Vectorized version of `interval` for several
+        directions $\eta_1, \dots, \eta_k$ at once.
+        All endpoints are found simultaneously.
+
+        Parameters
+        ----------
+
+        directions_of_interest: np.float((n,k))
+            Matrix whose columns are the directions $\eta_j$
+            for which we may want to form
+            selection intervals or tests.
+
+        Y : np.float
+            A realization of $N(0,\Sigma)$ where
+            $\Sigma$ is `self.covariance`.
+
+        alpha : float
+            What level of confidence?
+
+        UMAU : bool
+            Use the UMAU intervals?
+
+        ncpu : int
+            Number of processes for the UMAU intervals.
+
+        Returns
+        -------
+
+        intervals : np.float((k,2))
+            Selection intervals for each $\eta_j^T\mu$.
+
+        """
+        return selection_interval_matrix( \
+            self.linear_part,
+            self.offset,
+            self.covariance,
+            Y,
+            directions_of_interest,
+            alpha=alpha,
+            UMAU=UMAU,
+            ncpu=ncpu)
+
     def covariance_factors(self, force=True):
         """
         Factor `self.covariance`,
@@ -489,6 +643,291 @@ class constraints(object):
         sqrt_inv = self.covariance_factors()[1]
         return sqrt_inv.T.dot(sqrt_inv.dot(direction))
 
+class box_constraints(constraints):
+
+    r"""
+    Affine constraints that are a box, possibly after
+    flipping the signs of some coordinates:
+
+    .. math::
+
+       C = \left\{z: l \leq s \odot z \leq u \right \}
+
+    The bounds $l, u$ may be infinite. These are equivalent to
+    `constraints` with a linear part made of the rows $s_ie_i^T$
+    (for finite $u_i$) stacked on the rows $-s_ie_i^T$ (for finite $l_i$),
+    but that matrix is never stored: checking the constraints, slicing
+    them in a direction of interest and conditioning are all $O(p)$
+    in the constraint part. The dense `linear_part` and `offset` are
+    still available, formed on demand.
+
+    >>> positive = box_constraints(np.zeros(2), np.inf * np.ones(2))
+    >>> Y = np.array([3, 4.4])
+    >>> eta = np.array([1, 1], float)
+    >>> list(positive.bounds(eta, Y)) # doctest: +NORMALIZE_WHITESPACE +ELLIPSIS
+    [1.399..., 7.4..., inf, 1.414...]  
+
+    """
+
+    def __init__(self,
+                 lower,
+                 upper,
+                 sign=None,
+                 covariance=None,
+                 mean=None,
+                 rank=None):
+        r"""
+        Create a new box constraint.
+
+        Parameters
+        ----------
+
+        lower : np.float(p)
+            Lower bounds $l$, possibly `-np.inf`.
+
+        upper : np.float(p)
+            Upper bounds $u$, possibly `np.inf`.
+
+        sign : np.float(p) (optional)
+            Signs $s$ applied to $z$ before comparing to
+            the bounds. Defaults to `np.ones(p)`.
+
+        covariance : np.float((p,p))
+            Covariance matrix of Gaussian distribution to be 
+            truncated. Defaults to `np.identity(self.dim)`.
+
+        mean : np.float(p)
+            Mean vector of Gaussian distribution to be 
+            truncated. Defaults to `np.zeros(self.dim)`.
+
+        rank : int
+            If not None, this should specify
+            the rank of the covariance matrix. Defaults
+            to self.dim.
+
+        """
+
+        self.lower = np.asarray(lower, float)
+        self.upper = np.asarray(upper, float)
+        self.dim = self.lower.shape[0]
+
+        if sign is None:
+            sign = np.ones(self.dim)
+        self.sign = np.ones(self.dim) * sign
+
+        self._upper_rows = np.nonzero(np.isfinite(self.upper))[0]
+        self._lower_rows = np.nonzero(np.isfinite(self.lower))[0]
+
+        if rank is None:
+            self.rank = self.dim
+        else:
+            self.rank = rank
+
+        if covariance is None:
+            covariance = np.identity(self.dim)
+        self.covariance = covariance
+
+        if mean is None:
+            mean = np.zeros(self.dim)
+        self.mean = mean
+
+    @property
+    def linear_part(self):
+        """
+        Dense linear part $A$, formed on demand.
+        """
+        A = np.zeros((self._upper_rows.shape[0] +
+                      self._lower_rows.shape[0], self.dim))
+        nupper = self._upper_rows.shape[0]
+        A[np.arange(nupper), self._upper_rows] = self.sign[self._upper_rows]
+        A[nupper + np.arange(self._lower_rows.shape[0]), self._lower_rows] = \
+            -self.sign[self._lower_rows]
+        return A
+
+    @property
+    def offset(self):
+        """
+        Offset $b$, with one entry per finite bound.
+        """
+        return np.hstack([self.upper[self._upper_rows],
+                          -self.lower[self._lower_rows]])
+
+    @property
+    def _sparse_linear_part(self):
+        # the linear part as a sparse matrix with one
+        # nonzero per row, used to slice the constraints
+
+        rows = np.hstack([self._upper_rows, self._lower_rows])
+        values = np.hstack([self.sign[self._upper_rows],
+                            -self.sign[self._lower_rows]])
+        return csr_matrix((values, (np.arange(rows.shape[0]), rows)),
+                          shape=(rows.shape[0], self.dim))
+
+    def __copy__(self):
+        r"""
+        A copy of the constraints.
+
+        Also copies _sqrt_cov, _sqrt_inv if attributes are present.
+        """
+        con = box_constraints(copy(self.lower),
+                              copy(self.upper),
+                              sign=copy(self.sign),
+                              mean=copy(self.mean),
+                              covariance=copy(self.covariance),
+                              rank=self.rank)
+        if hasattr(self, "_sqrt_cov"):
+            con._sqrt_cov = self._sqrt_cov.copy()
+            con._sqrt_inv = self._sqrt_inv.copy()
+            con._rowspace = self._rowspace.copy()
+        return con
+
+    def value(self, Y):
+        r"""
+        Compute $\max(Ay-b)$.
+        """
+        Y = np.asarray(Y)
+        sY = (self.sign * Y.T).T
+        V = np.hstack([(sY[self._upper_rows].T - self.upper[self._upper_rows]).ravel(),
+                       (self.lower[self._lower_rows] - sY[self._lower_rows].T).ravel()])
+        if V.shape[0] == 0:
+            return -np.inf
+        return V.max()
+
+    def conditional(self, linear_part, value,
+                    rank=None):
+        """
+        Return an equivalent constraint 
+        after having conditioned on a linear equality.
+        
+        The box is unchanged, only the mean and 
+        covariance are updated. See `constraints.conditional`.
+
+        Parameters
+        ----------
+
+        linear_part : np.float((k,q))
+             Linear part of equality constraint, `C` above.
+
+        value : np.float(k)
+             Value of equality constraint, `b` above.
+
+        rank : int
+            If not None, this should specify
+            the rank of `linear_part`. Defaults
+            to `min(k,q)`.
+
+        Returns
+        -------
+
+        conditional_con : `box_constraints`
+             Affine constraints having applied equality constraint.
+
+        """
+        covariance, mean, rank = self._conditional_moments(linear_part,
+                                                           value,
+                                                           rank=rank)
+        return box_constraints(self.lower,
+                               self.upper,
+                               sign=self.sign,
+                               covariance=covariance,
+                               mean=mean,
+                               rank=rank)
+
+    def bounds(self, direction_of_interest, Y):
+        r"""
+        Same as `constraints.bounds`, without forming
+        the linear part.
+        """
+        return interval_constraints(self._sparse_linear_part,
+                                    self.offset,
+                                    self.covariance,
+                                    Y,
+                                    direction_of_interest)
+
+    def bounds_matrix(self, directions_of_interest, Y):
+        r"""
+        Same as `constraints.bounds_matrix`, without forming
+        the linear part.
+        """
+        return interval_constraints_matrix(self._sparse_linear_part,
+                                           self.offset,
+                                           self.covariance,
+                                           Y,
+                                           directions_of_interest)
+
+    def interval(self, direction_of_interest, Y,
+                 alpha=0.05, UMAU=False):
+        r"""
+        Same as `constraints.interval`, without forming
+        the linear part.
+        """
+        return selection_interval( \
+            self._sparse_linear_part,
+            self.offset,
+            self.covariance,
+            Y,
+            direction_of_interest,
+            alpha=alpha,
+            UMAU=UMAU)
+
+    def interval_matrix(self, directions_of_interest, Y,
+                        alpha=0.05, UMAU=False, ncpu=1):
+        r"""
+        Same as `constraints.interval_matrix`, without forming
+        the linear part.
+        """
+        return selection_interval_matrix( \
+            self._sparse_linear_part,
+            self.offset,
+            self.covariance,
+            Y,
+            directions_of_interest,
+            alpha=alpha,
+            UMAU=UMAU,
+            ncpu=ncpu)
+
+    def whiten(self):
+        """
+        Return a whitened version of constraints in a different
+        basis, and a change of basis matrix.
+        See `constraints.whiten`.
+
+        The rows of the whitened linear part are
+        signed rows of the square-root of the covariance, 
+        so no matrix products are needed.
+
+        Returns
+        -------
+
+        inverse_map : callable
+
+        forward_map : callable
+
+        white_con : `constraints`
+
+        """
+        sqrt_cov, sqrt_inv = self.covariance_factors()[:2]
+
+        rows = np.hstack([self._upper_rows, self._lower_rows])
+        signs = np.hstack([self.sign[self._upper_rows],
+                           -self.sign[self._lower_rows]])
+        new_A = signs[:,None] * sqrt_cov[rows]
+        den = np.sqrt((new_A**2).sum(1))
+        new_b = self.offset - signs * self.mean[rows]
+        new_con = constraints(new_A / den[:,None], new_b / den)
+
+        mu = self.mean.copy()
+
+        def inverse_map(Z): 
+            if Z.ndim == 2:
+                return sqrt_cov.dot(Z) + mu[:,None]
+            else:
+                return sqrt_cov.dot(Z) + mu
+
+        forward_map = lambda W: sqrt_inv.dot(W - mu)
+
+        return inverse_map, forward_map, new_con
+
 def stack(*cons):
     """
     Combine constraints into a large constaint
@@ -613,6 +1052,93 @@ def interval_constraints(support_directions,
 
     return lower_bound, V, upper_bound, sigma
 
+def interval_constraints_matrix(support_directions,
+                                support_offsets,
+                                covariance,
+                                observed_data,
+                                directions_of_interest,
+                                tol = 1.e-4):
+    r"""
+    Vectorized version of `interval_constraints` for
+    a matrix of directions of interest whose columns
+    are $\eta_1, \dots, \eta_k$.
+
+    The products $A\Sigma\eta_j$ are formed for all
+    directions at once, so this is much cheaper than
+    calling `interval_constraints` once per column.
+
+    Parameters
+    ----------
+
+    support_directions : np.float
+         Matrix specifying constraint, $A$.
+
+    support_offsets : np.float
+         Offset in constraint, $b$.
+
+    covariance : np.float
+         Covariance matrix of `observed_data`.
+
+    observed_data : np.float
+         Observations.
+
+    directions_of_interest : np.float((n,k))
+         Directions in which we're interested for the
+         contrasts, one per column.
+
+    tol : float
+         Relative tolerance parameter for deciding
+         sign of $Az-b$.
+
+    Returns
+    -------
+
+    lower_bound : np.float(k)
+
+    observed : np.float(k)
+
+    upper_bound : np.float(k)
+
+    sigma : np.float(k)
+
+    """
+
+    # shorthand
+    A, b, S, X, W = (support_directions,
+                     support_offsets,
+                     covariance,
+                     observed_data,
+                     np.asarray(directions_of_interest))
+
+    U = A.dot(X) - b
+    if not np.all(U  < tol * np.fabs(U).max()) and WARNINGS:
+        warn('constraints not satisfied: %s' % repr(U))
+
+    SW = S.dot(W)
+    sigma = np.sqrt((W*SW).sum(0))
+    alpha = A.dot(SW) / sigma[None,:]**2
+    V = W.T.dot(X) # \eta_j^TZ
+
+    if alpha.shape[0] == 0:
+        return (-np.inf * np.ones_like(V), V,
+                np.inf * np.ones_like(V), sigma)
+
+    # as in `interval_constraints`, the zero coords
+    # in the denominator avoid divide-by-zero errors in RHS
+
+    zero_coords = alpha == 0
+    RHS = (-U[:,None] + V[None,:] * alpha) / (alpha + zero_coords)
+    RHS[zero_coords] = np.nan
+
+    thresh = tol * np.fabs(alpha).max(0)
+    pos_coords = alpha > thresh[None,:]
+    neg_coords = alpha < -thresh[None,:]
+
+    upper_bound = np.where(pos_coords, RHS, np.inf).min(0)
+    lower_bound = np.where(neg_coords, RHS, -np.inf).max(0)
+
+    return lower_bound, V, upper_bound, sigma
+
 def selection_interval(support_directions, 
                        support_offsets,
                        covariance,
@@ -663,21 +1189,80 @@ def selection_interval(support_directions,
 
     """
 
-    lower_bound, V, upper_bound, sigma = interval_constraints( \
+    direction_of_interest = np.asarray(direction_of_interest)
+    return selection_interval_matrix(support_directions, 
+                                     support_offsets,
+                                     covariance,
+                                     observed_data, 
+                                     direction_of_interest[:,None],
+                                     tol=tol,
+                                     alpha=alpha,
+                                     UMAU=UMAU)[0]
+
+def selection_interval_matrix(support_directions, 
+                              support_offsets,
+                              covariance,
+                              observed_data, 
+                              directions_of_interest,
+                              tol = 1.e-4,
+                              alpha = 0.05,
+                              UMAU=True,
+                              ncpu=1):
+    """
+    Vectorized version of `selection_interval` for
+    several directions of interest, the columns of
+    `directions_of_interest`. The endpoints of all intervals
+    are found simultaneously by `equal_tailed_intervals`
+    or `UMAU_intervals`.
+
+    Parameters
+    ----------
+
+    support_directions : np.float
+         Matrix specifying constraint, $A$.
+
+    support_offset : np.float
+         Offset in constraint, $b$.
+
+    covariance : np.float
+         Covariance matrix of `observed_data`.
+
+    observed_data : np.float
+         Observations.
+
+    directions_of_interest : np.float((n,k))
+         Directions in which we're interested for the
+         contrasts.
+
+    tol : float
+         Relative tolerance parameter for deciding 
+         sign of $Az-b$.
+
+    UMAU : bool
+         Use the UMAU interval, or twosided pivot.
+
+    ncpu : int
+         Number of processes for the UMAU intervals,
+         see `UMAU_intervals`.
+
+    Returns
+    -------
+
+    selection_intervals : np.float((k,2))
+
+    """
+
+    L, Z, U, S = interval_constraints_matrix( \
         support_directions, 
         support_offsets,
         covariance,
         observed_data, 
-        direction_of_interest,
+        directions_of_interest,
         tol=tol)
 
-    truncated = truncated_gaussian_old([(lower_bound, upper_bound)], scale=sigma)
     if UMAU:
-        _selection_interval = truncated.UMAU_interval(V, alpha)
-    else:
-        _selection_interval = truncated.equal_tailed_interval(V, alpha)
-    
-    return _selection_interval
+        return UMAU_intervals(L, Z, U, S, alpha=alpha, ncpu=ncpu)
+    return equal_tailed_intervals(L, Z, U, S, alpha=alpha)
 
 def sample_from_constraints(con, 
                             Y,
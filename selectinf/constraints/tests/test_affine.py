@@ -9,6 +9,7 @@ import nose.tools as nt
 import regreg.api as rr
 
 from .. import affine as AC
+from ...truncated.gaussian import truncated_gaussian_old
 from ...tests.flags import SET_SEED
 from ...tests.decorators import set_seed_iftrue
 
@@ -152,6 +153,107 @@ def test_pivots_intervals():
     con.interval(u, Z, UMAU=True)
     con.interval(u, Z, UMAU=False)
 
+@set_seed_iftrue(SET_SEED)
+def test_pivots_matrix():
+
+    A, b = np.random.standard_normal((10,30)), np.random.standard_normal(10)
+
+    con = AC.constraints(A,b)
+    W = np.random.standard_normal((30,30))
+    con.covariance = W.dot(W.T) / 30.
+    while True:
+        w = np.random.standard_normal(30)
+        if con(w):
+            break
+
+    Z = AC.sample_from_constraints(con, w)[-1]
+    directions = np.random.standard_normal((30,8))
+    directions[:,0] = 0
+    directions[4,0] = 1
+
+    bounds = np.array(con.bounds_matrix(directions, Z)).T
+    for j in range(directions.shape[1]):
+        np.testing.assert_allclose(bounds[j],
+                                   con.bounds(directions[:,j], Z),
+                                   rtol=1.e-8)
+
+    for alternative in ['greater', 'less', 'twosided']:
+        P = con.pivot_matrix(directions, Z, alternative=alternative)
+        P0 = [con.pivot(directions[:,j], Z, alternative=alternative)
+              for j in range(directions.shape[1])]
+        np.testing.assert_allclose(P, P0, rtol=1.e-6, atol=1.e-12)
+
+@set_seed_iftrue(SET_SEED)
+def test_intervals_matrix():
+
+    A, b = np.random.standard_normal((10,30)), np.random.standard_normal(10)
+
+    con = AC.constraints(A,b)
+    while True:
+        w = np.random.standard_normal(30)
+        if con(w):
+            break
+
+    Z = AC.sample_from_constraints(con, w)[-1]
+    directions = np.random.standard_normal((30,5))
+
+    intervals = con.interval_matrix(directions, Z, UMAU=False)
+    for j in range(directions.shape[1]):
+        L, V, U, S = con.bounds(directions[:,j], Z)
+        tg = truncated_gaussian_old([(L, U)], scale=S)
+        np.testing.assert_allclose(intervals[j], 
+                                   tg.equal_tailed_interval(V, 0.05),
+                                   rtol=1.e-4, atol=1.e-5)
+
+    for UMAU in [True, False]:
+        intervals = con.interval_matrix(directions, Z, UMAU=UMAU)
+        for j in range(directions.shape[1]):
+            np.testing.assert_allclose(intervals[j], 
+                                       con.interval(directions[:,j], Z, UMAU=UMAU))
+
+@set_seed_iftrue(SET_SEED)
+def test_box_constraints():
+
+    p = 12
+    lower = np.random.standard_normal(p) - 2
+    upper = lower + 3 * np.random.exponential(size=p)
+    lower[[1,4]] = -np.inf
+    upper[[2,4,7]] = np.inf
+    sign = np.random.choice([-1,1], p)
+
+    W = np.random.standard_normal((p,p))
+    S = W.dot(W.T) / p + np.identity(p)
+    box = AC.box_constraints(lower, upper, sign=sign, covariance=S)
+    con = AC.constraints(box.linear_part, box.offset, covariance=S)
+
+    Y = sign * np.clip(np.random.standard_normal(p), lower + 1.e-3, upper - 1.e-3)
+    nt.assert_true(box(Y) and con(Y))
+    Y_out = Y.copy()
+    Y_out[0] = sign[0] * (upper[0] + 1)
+    nt.assert_false(box(Y_out) or con(Y_out))
+    np.testing.assert_allclose(box.value(Y_out), con.value(Y_out))
+
+    eta = np.random.standard_normal(p)
+    directions = np.random.standard_normal((p,4))
+    np.testing.assert_allclose(box.bounds(eta, Y), con.bounds(eta, Y))
+    np.testing.assert_allclose(box.bounds_matrix(directions, Y), 
+                               con.bounds_matrix(directions, Y))
+    np.testing.assert_allclose(box.pivot(eta, Y), con.pivot(eta, Y))
+    np.testing.assert_allclose(box.interval(eta, Y), con.interval(eta, Y))
+
+    C = np.random.standard_normal((2,p))
+    box_cond, con_cond = box.conditional(C, C.dot(Y)), con.conditional(C, C.dot(Y))
+    nt.assert_true(isinstance(box_cond, AC.box_constraints))
+    np.testing.assert_allclose(box_cond.covariance, con_cond.covariance)
+    np.testing.assert_allclose(box_cond.mean, con_cond.mean)
+
+    white_box, white_con = box.whiten()[2], con.whiten()[2]
+    np.testing.assert_allclose(white_box.linear_part, white_con.linear_part)
+    np.testing.assert_allclose(white_box.offset, white_con.offset)
+
+    Z = AC.sample_from_constraints(box, Y, ndraw=100, burnin=100)
+    nt.assert_true(np.all([box(z) for z in Z]))
+
 @set_seed_iftrue(SET_SEED)
 def test_sampling():
     """
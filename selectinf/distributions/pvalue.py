@@ -18,15 +18,47 @@ They are described in the `Kac Rice`_ paper.
 import numpy as np
 from scipy.stats import chi
 
-from scipy.stats import norm as ndist, truncnorm 
+from scipy.stats import norm as ndist, truncnorm
 from scipy.integrate import quad
+from scipy.special import ndtri, log_ndtr, erf
 
 from mpmath import mp
-mp.dps = 80
+
+# Decimal precision of the `mpmath` fallbacks below. It is applied
+# only around the calls that need it, through `mp_precision`,
+# so the global `mpmath` precision is left untouched.
+
+MP_DPS = 80
+
+# Relative accuracy demanded of the double precision
+# evaluations below. Entries whose estimated relative error
+# exceeds this are recomputed with `mpmath`.
+
+FLOAT_RTOL = 1.e-10
+
+_EPS = np.finfo(np.float64).eps
+_LOG_TINY = np.log(np.finfo(np.float64).tiny)
+
+def mp_precision(dps=None):
+    """
+    Context manager in which `mpmath` works with at least
+    `dps` decimal places, restoring the previous precision on exit.
+
+    Parameters
+    ----------
+
+    dps : int
+        Decimal places, defaults to `MP_DPS`. A higher
+        precision already in effect is kept.
+
+    """
+    if dps is None:
+        dps = MP_DPS
+    return mp.workdps(max(dps, mp.dps))
 
 def norm_q(prob):
     r"""
-    A multi-precision calculation of the
+    A double precision calculation of the
     standard normal quantile function:
 
     .. math::
@@ -35,6 +67,10 @@ def norm_q(prob):
 
     where $p$ is `prob`.
 
+    Multi-precision values of `prob` whose complement $1-p$
+    (or $p$ itself) is not resolved in double precision
+    are evaluated with `mpmath`.
+
     Parameters
     ----------
 
@@ -46,19 +82,38 @@ def norm_q(prob):
     quantile : float
 
     """
-    return np.array(mp.erfinv(2*prob-1)*mp.sqrt(2))
-
+    prob = np.asarray(prob)
+    quantile = np.asarray(ndtri(prob.astype(np.float64)))
+
+    if prob.dtype == object:
+        quantile = quantile.astype(object)
+        for idx in np.ndindex(prob.shape):
+            p = prob[idx]
+            if isinstance(p, mp.mpf) and not _float_resolves_prob(p):
+                with mp_precision():
+                    quantile[idx] = mp.erfinv(2*p-1)*mp.sqrt(2)
+    return quantile
+
+def _float_resolves_prob(prob):
+    """
+    Can the multi-precision probability `prob` be rounded
+    to double precision without losing the relative accuracy
+    of either `prob` or `1-prob`?
+    """
+    tail = min(prob, 1 - prob)
+    return tail > 0 and float(tail) * FLOAT_RTOL > _EPS
 
 def norm_pdf(observed):
     r"""
-    A multi-precision calculation of the
+    A double precision calculation of the
     standard normal density function:
 
     .. math::
 
        \frac{e^{-T^2/2}}{\sqrt{2\pi}}
 
-    where `T` is observed.
+    where `T` is observed. Values that underflow
+    in double precision are evaluated with `mpmath`.
 
     Parameters
     ----------
@@ -71,16 +126,107 @@ def norm_pdf(observed):
     density : float
 
     """
-    return np.array(mp.npdf(observed))
+    x = np.asarray(observed, np.float64)
+    density = np.asarray(np.exp(-0.5 * x**2) / np.sqrt(2 * np.pi))
+
+    underflow = (density == 0) & np.isfinite(x)
+    if np.any(underflow):
+        density = density.astype(object)
+        for idx in np.ndindex(x.shape):
+            if underflow[idx]:
+                with mp_precision():
+                    density[idx] = mp.npdf(x[idx])
+    return density
+
+def log_norm_interval(lower, upper):
+    r"""
+    A vectorized, double precision evaluation of
+
+    .. math::
+
+        \log \left(\Phi(U) - \Phi(L)\right)
+
+    Intervals in the upper tail are reflected into the lower tail.
+    There the difference is computed from `scipy.special.log_ndtr`
+    as $\log \Phi(U) + \log(1 - e^{\log \Phi(L) - \log \Phi(U)})$,
+    which stays accurate far into the tails. Intervals containing
+    0 are computed as a sum of two `erf` terms of the same sign.
+
+    Parameters
+    ----------
+
+    lower : np.float
+        The lower limit $L$
+
+    upper : np.float
+        The upper limit $U$
+
+    Returns
+    -------
+
+    logP : np.float
+        Logarithm of the Gaussian mass of $[L,U]$.
+
+    precise : np.bool
+        False where the estimated relative error of
+        $e^{\log P}$ exceeds `FLOAT_RTOL`, i.e. where
+        the double precision evaluation should not be trusted.
+
+    """
+    a, b = np.broadcast_arrays(np.asarray(lower, np.float64),
+                               np.asarray(upper, np.float64))
+
+    reflect = a > 0
+    a, b = np.where(reflect, -b, a), np.where(reflect, -a, b)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+
+        # 0 is in the interval: two nonnegative terms, no cancellation
+
+        logP_straddle = np.log(0.5 * (erf(b / np.sqrt(2)) + erf(-a / np.sqrt(2))))
+
+        # interval in the lower tail
+
+        log_Fa, log_Fb = log_ndtr(a), log_ndtr(b)
+        D = log_Fa - log_Fb
+        logP_tail = log_Fb + _log1mexp(D)
+
+        # error in D relative to the mass 1 - exp(D)
+
+        scale = np.fabs(log_Fb) + np.where(np.isinf(log_Fa), 0, np.fabs(log_Fa))
+        rel_error = 4 * _EPS * scale * np.exp(D) / -np.expm1(D)
+
+    straddle = b > 0
+    empty = a >= b
+
+    logP = np.where(straddle, logP_straddle, logP_tail)
+    logP = np.where(empty, -np.inf, logP)
+
+    precise = (straddle | empty | (rel_error <= FLOAT_RTOL) |
+               np.isnan(a) | np.isnan(b))
+    return logP, precise
+
+def _log1mexp(D):
+    """
+    Stable evaluation of log(1 - exp(D)) for D <= 0.
+    """
+    return np.where(D > -np.log(2),
+                    np.log(-np.expm1(D)),
+                    np.log1p(-np.exp(D)))
 
 def norm_interval(lower, upper):
     r"""
-    A multiprecision evaluation of
+    An evaluation of
 
     .. math::
 
         \Phi(U) - \Phi(L)
 
+    in double precision, using `log_norm_interval`.
+    Where the double precision value is imprecise,
+    underflows, or is so close to 1 that its complement
+    is not resolved, a multiprecision value is returned.
+
     Parameters
     ----------
 
@@ -91,10 +237,24 @@ def norm_interval(lower, upper):
         The upper limit $U$
 
     """
-    if lower > 0 and upper > 0:
-        return mp.ncdf(-lower) - mp.ncdf(-upper)
-    else:
-        return mp.ncdf(upper) - mp.ncdf(lower)
+    logP, precise = log_norm_interval(lower, upper)
+    if logP == -np.inf:
+        return 0.
+    if precise and logP > _LOG_TINY and -np.expm1(logP) * FLOAT_RTOL > _EPS:
+        return float(np.exp(logP))
+    return norm_interval_mp(lower, upper)
+
+def norm_interval_mp(lower, upper):
+    """
+    Multiprecision version of `norm_interval`,
+    for formulas that difference Gaussian masses
+    and need more than double precision.
+    """
+    with mp_precision():
+        if lower > 0 and upper > 0:
+            return mp.ncdf(-lower) - mp.ncdf(-upper)
+        else:
+            return mp.ncdf(upper) - mp.ncdf(lower)
 
 def truncnorm_cdf(observed, lower, upper):
     r"""
@@ -121,24 +281,72 @@ def truncnorm_cdf(observed, lower, upper):
 
     P : float
 
+    """
+    return float(truncnorm_cdf_vec(observed, lower, upper))
+
+def _truncnorm_cdf_mp(observed, lower, upper):
+    """
+    Multiprecision version of `truncnorm_cdf`.
     """
     x, a, b = observed, lower, upper
 
     x = max(x, a)
     x = min(x, b)
 
-    #a = max(min(a, 5), -5)
-    #b = max(min(b, 5), -5)
-    #x = max(min(x, 5), -5)
-    #if a==b:
-    #    return 1.
+    with mp_precision():
+        if a > 0 and b > 0:
+            Fx, Fa, Fb = mp.ncdf(-x), mp.ncdf(-a), mp.ncdf(-b)
+            return float(( Fa - Fx ) / (Fa - Fb))
+        else:
+            Fx, Fa, Fb = mp.ncdf(x), mp.ncdf(a), mp.ncdf(b)
+            return float( ( Fx - Fa ) / ( Fb - Fa ) )
 
-    if a > 0 and b > 0:
-        Fx, Fa, Fb = mp.ncdf(-x), mp.ncdf(-a), mp.ncdf(-b)
-        return float(( Fa - Fx ) / (Fa - Fb))
-    else:
-        Fx, Fa, Fb = mp.ncdf(x), mp.ncdf(a), mp.ncdf(b)
-        return float( ( Fx - Fa ) / ( Fb - Fa ) )
+def truncnorm_cdf_vec(observed, lower, upper):
+    r"""
+    Vectorized version of `truncnorm_cdf`
+    evaluated in double precision.
+
+    .. math::
+
+        \frac{\Phi(T) - \Phi(L)}{\Phi(U) - \Phi(L)}
+
+    where $T$ is `observed`, $L$ is `lower` and $U$ is `upper`.
+    Both masses are computed in log space by `log_norm_interval`,
+    entries flagged as imprecise are recomputed with `mpmath`.
+
+    Parameters
+    ----------
+
+    observed : np.float
+
+    lower : np.float
+
+    upper : np.float
+
+    Returns
+    -------
+
+    P : np.float
+        Array of the broadcast shape of the arguments.
+
+    """
+    x, a, b = np.broadcast_arrays(np.asarray(observed, np.float64),
+                                  np.asarray(lower, np.float64),
+                                  np.asarray(upper, np.float64))
+
+    x = np.minimum(np.maximum(x, a), b)
+
+    logPx, precise_x = log_norm_interval(a, x)
+    logP, precise = log_norm_interval(a, b)
+
+    with np.errstate(invalid='ignore'):
+        P = np.asarray(np.exp(logPx - logP))
+
+    imprecise = ~(precise_x & precise)
+    for idx in np.ndindex(P.shape):
+        if imprecise[idx]:
+            P[idx] = _truncnorm_cdf_mp(x[idx], a[idx], b[idx])
+    return P
 
 
 def chi_pvalue(observed, lower_bound, upper_bound, sd, df, method='MC', nsim=1000):
@@ -0,0 +1,125 @@
+from __future__ import print_function
+
+import numpy as np
+import nose.tools as nt
+from mpmath import mp
+
+from ..pvalue import (truncnorm_cdf,
+                      truncnorm_cdf_vec,
+                      norm_interval,
+                      norm_interval_mp,
+                      log_norm_interval,
+                      norm_q,
+                      norm_pdf,
+                      mp_precision,
+                      MP_DPS)
+
+def _truncnorm_cdf_ref(x, a, b):
+    # reference value at 80 digits
+
+    x = min(max(x, a), b)
+    with mp.workdps(80):
+        if a > 0 and b > 0:
+            Fx, Fa, Fb = mp.ncdf(-x), mp.ncdf(-a), mp.ncdf(-b)
+            return float((Fa - Fx) / (Fa - Fb))
+        Fx, Fa, Fb = mp.ncdf(x), mp.ncdf(a), mp.ncdf(b)
+        return float((Fx - Fa) / (Fb - Fa))
+
+def _grid():
+    cutoffs = np.array([-np.inf, -40, -38.5, -12, -6, -2.5, -1, -1.e-3,
+                        0, 1.e-3, 0.7, 3, 8.2, 15, 37, 39.5, np.inf])
+    values = []
+    for a in cutoffs:
+        for b in cutoffs[cutoffs > a]:
+            lo = max(a, -50) - 0.5
+            hi = min(b, 50) + 0.5
+            for x in np.linspace(lo, hi, 7):
+                values.append((x, a, b))
+    return np.array(values)
+
+def test_truncnorm_cdf_accuracy():
+
+    X, A, B = _grid().T
+    P = truncnorm_cdf_vec(X, A, B)
+    P_ref = np.array([_truncnorm_cdf_ref(x, a, b) for x, a, b in zip(X, A, B)])
+    np.testing.assert_allclose(P, P_ref, rtol=1.e-9, atol=1.e-300)
+    nt.assert_true(np.all((P >= 0) & (P <= 1)))
+
+    for x, a, b in _grid()[::13]:
+        np.testing.assert_allclose(truncnorm_cdf(x, a, b),
+                                   _truncnorm_cdf_ref(x, a, b),
+                                   rtol=1.e-9, atol=1.e-300)
+
+def test_truncnorm_cdf_narrow():
+
+    # very short intervals far in the tails lose
+    # accuracy in double precision and fall back to mpmath
+
+    for a in [-35., -7.3, 4.1, 30.]:
+        for width in [1.e-12, 1.e-8, 1.e-3]:
+            x = a + 0.3 * width
+            np.testing.assert_allclose(truncnorm_cdf(x, a, a + width),
+                                       _truncnorm_cdf_ref(x, a, a + width),
+                                       rtol=1.e-9)
+
+def test_norm_interval():
+
+    for a, b in [(-np.inf, np.inf), (-1, 1), (2, 3.5), (-45, -40),
+                 (40, 41), (-3, np.inf), (5, 5 + 1.e-10), (3, 2)]:
+        val = norm_interval(a, b)
+        ref = norm_interval_mp(a, b) if a < b else 0
+        np.testing.assert_allclose(float(val), float(ref), rtol=1.e-10)
+
+    # complement of the mass is resolved
+
+    nt.assert_true(abs(float(1 - norm_interval(-10, np.inf)) -
+                       float(mp.ncdf(-10))) < 1.e-10 * float(mp.ncdf(-10)))
+
+    logP, precise = log_norm_interval([-50, -10, 20], [-49, -9, 22])
+    nt.assert_true(np.all(precise))
+    np.testing.assert_allclose(logP,
+                               [float(mp.log(norm_interval_mp(-50, -49))),
+                                float(mp.log(norm_interval_mp(-10, -9))),
+                                float(mp.log(norm_interval_mp(20, 22)))],
+                               rtol=1.e-12)
+
+def test_norm_q_pdf():
+
+    prob = np.array([1.e-50, 1.e-20, 0.025, 0.5, 0.975, 1 - 1.e-12])
+    with mp.workdps(80):
+        ref = [float(mp.sqrt(2) * mp.erfinv(2 * mp.mpf(p) - 1)) for p in prob]
+    np.testing.assert_allclose(norm_q(prob), ref, rtol=1.e-8)
+
+    # multiprecision input whose complement is below double precision
+
+    with mp.workdps(80):
+        p = 1 - mp.mpf('1e-30')
+    np.testing.assert_allclose(float(norm_q(p)),
+                               -float(norm_q(1.e-30)), rtol=1.e-10)
+
+    x = np.array([-3, 0, 1.5, 20.])
+    np.testing.assert_allclose(norm_pdf(x),
+                               [float(mp.npdf(v)) for v in x], rtol=1.e-12)
+    with mp.workdps(MP_DPS):
+        nt.assert_true(norm_pdf(45.)[()] == mp.npdf(45.))
+
+def test_precision_context():
+
+    # the fallbacks do not change the global precision
+
+    dps = mp.dps
+    val = norm_interval_mp(-3, -2)
+    truncnorm_cdf(30 + 1.e-13, 30, 30 + 1.e-12)
+    nt.assert_equal(mp.dps, dps)
+
+    # but are computed at MP_DPS digits
+
+    with mp.workdps(MP_DPS):
+        nt.assert_equal(val, mp.ncdf(-2) - mp.ncdf(-3))
+
+    with mp.workdps(200):
+        with mp_precision():
+            nt.assert_equal(mp.dps, 200)
+        with mp_precision(20):
+            nt.assert_equal(mp.dps, 200)
+    nt.assert_equal(mp.dps, dps)
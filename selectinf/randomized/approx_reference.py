@@ -4,7 +4,7 @@ import numpy as np, pandas as pd
 from scipy.interpolate import interp1d
 
 from ..distributions.discrete_family import discrete_family
-from ..algorithms.barrier_affine import solve_barrier_affine_py
+from ..algorithms.barrier_affine import solve_barrier, constraint_structure
 
 
 class approximate_grid_inference(object):
@@ -45,6 +45,10 @@ class approximate_grid_inference(object):
         self.linear_part = query.sampler.affine_con.linear_part
         self.offset = query.sampler.affine_con.offset
 
+        # the constraint is fixed, so its structure is detected once
+        self._structure = constraint_structure(self.linear_part, self.offset)
+        self.solver_diagnostics = {}
+
         self.logdens_linear = query.sampler.logdens_transform[0]
         self.cond_mean = query.cond_mean
         self.prec_opt = np.linalg.inv(query.cond_cov)
@@ -135,7 +139,6 @@ class approximate_grid_inference(object):
         target_lin = - self.logdens_linear.dot(target_score_cov.T.dot(prec_target))
 
         ref_hat = []
-        solver = solve_barrier_affine_py
         for k in range(grid.shape[0]):
             # in the usual D = N + Gamma theta.hat,
             # target_lin is "something" times Gamma,
@@ -147,12 +150,14 @@ class approximate_grid_inference(object):
                               self.cond_mean)
             conjugate_arg = self.prec_opt.dot(cond_mean_grid)
 
-            val, _, _ = solver(conjugate_arg,
-                               self.prec_opt,
-                               self.init_soln,
-                               self.linear_part,
-                               self.offset,
-                               **self.solve_args)
+            val, _, _ = solve_barrier(conjugate_arg,
+                                      self.prec_opt,
+                                      self.init_soln,
+                                      self.linear_part,
+                                      self.offset,
+                                      structure=self._structure,
+                                      diagnostics=self.solver_diagnostics,
+                                      **self.solve_args)
 
             ref_hat.append(-val - (conjugate_arg.T.dot(self.cond_cov).dot(conjugate_arg) / 2.))
 
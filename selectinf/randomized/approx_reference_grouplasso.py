@@ -1,5 +1,5 @@
 from __future__ import print_function
-from scipy.linalg import block_diag
+from scipy.linalg import block_diag, lu_factor, lu_solve
 from scipy.stats import norm as ndist
 from scipy.interpolate import interp1d
 
@@ -11,7 +11,7 @@ import pandas as pd
 
 import regreg.api as rr
 from .randomization import randomization
-from ..base import restricted_estimator
+from ..base import restricted_estimator, group_index
 from ..algorithms.barrier_affine import solve_barrier_affine_py as solver
 from ..distributions.discrete_family import discrete_family
 
@@ -26,7 +26,7 @@ class group_lasso(object):
                  use_lasso=True,  # should lasso solver be used where applicable - defaults to True
                  perturb=None):
 
-        _check_groups(groups)  # make sure groups looks sensible
+        self._group_index = _check_groups(groups)  # make sure groups looks sensible
 
         # log likelihood : quadratic loss
         self.loglike = loglike
@@ -37,7 +37,7 @@ class group_lasso(object):
 
         # group lasso penalty (from regreg)
         # use regular lasso penalty if all groups are size 1
-        if use_lasso and groups.size == np.unique(groups).size:
+        if use_lasso and groups.size == self._group_index.ngroup:
             # need to provide weights an an np.array rather than a dictionary
             weights_np = np.array([w[1] for w in sorted(weights.items())])
             self.penalty = rr.weighted_l1norm(weights=weights_np,
@@ -68,7 +68,7 @@ class group_lasso(object):
         active_groups = []  # active group labels
         active_dirs = {}  # dictionary: keys are group labels, values are unit-norm coefficients
         unpenalized = []  # selected groups with no penalty
-        overall = np.ones(self.nfeature, np.bool)  # mask of active features
+        overall = np.ones(self.nfeature, bool)  # mask of active features
         ordered_groups = []  # active group labels sorted by label
         ordered_opt = []  # gamma's ordered by group labels
         ordered_vars = []  # indices "ordered" by sorting group labels
@@ -77,26 +77,30 @@ class group_lasso(object):
 
         _, self.randomizer_prec = self.randomizer.cov_prec
 
+        index = self._group_index
+        soln = self.initial_soln
+        group_norms = index.norms(soln)
+        soln_norm = norm(soln)
+
         # now we are collecting the directions and norms of the active groups
-        for g in sorted(np.unique(self.groups)):  # g is group label
+        for k, g in enumerate(index.labels):  # g is group label
 
-            group_mask = self.groups == g
-            soln = self.initial_soln  # do not need to keep setting this
+            group_mask = index.indices(g)
 
-            if norm(soln[group_mask]) > tol * norm(soln):  # is group g appreciably nonzero
+            if group_norms[k] > tol * soln_norm:  # is group g appreciably nonzero
                 ordered_groups.append(g)
 
                 # variables in active group
-                ordered_vars.extend(np.flatnonzero(group_mask))
+                ordered_vars.extend(group_mask)
 
                 if self.penalty.weights[g] == 0:
                     unpenalized.append(g)
 
                 else:
                     active_groups.append(g)
-                    active_dirs[g] = soln[group_mask] / norm(soln[group_mask])
+                    active_dirs[g] = soln[group_mask] / group_norms[k]
 
-                ordered_opt.append(norm(soln[group_mask]))
+                ordered_opt.append(group_norms[k])
             else:
                 overall[group_mask] = False
 
@@ -530,50 +534,58 @@ class approximate_grid_inference(object):
         prec_target = np.linalg.inv(target_cov)
         target_lin = - self.logdens_linear.dot(target_score_cov.T.dot(prec_target))
 
-        ref_hat = []
+        # in the usual D = N + Gamma theta.hat,
+        # target_lin is "something" times Gamma,
+        # where "something" comes from implied Gaussian
+        # cond_mean is "something" times D
+        # Gamma is target_score_cov.T.dot(prec_target)
 
-        for k in range(grid.shape[0]):
-            # in the usual D = N + Gamma theta.hat,
-            # target_lin is "something" times Gamma,
-            # where "something" comes from implied Gaussian
-            # cond_mean is "something" times D
-            # Gamma is target_score_cov.T.dot(prec_target)
+        num_opt = self.prec_opt.shape[0]
 
-            num_opt = self.prec_opt.shape[0]
-            num_con = self.linear_part.shape[0]
+        #direction for decomposing o
 
-            cond_mean_grid = (target_lin.dot(np.atleast_1d(grid[k] - observed_target)) +
-                              self.cond_mean)
+        eta = -self.prec_opt.dot(self.logdens_linear.dot(target_score_cov.T))
 
-            #direction for decomposing o
+        implied_cov = eta.T.dot(self.cond_cov).dot(eta).item()
+        implied_prec = 1./implied_cov
 
-            eta = -self.prec_opt.dot(self.logdens_linear.dot(target_score_cov.T))
+        _A = self.cond_cov.dot(eta) * implied_prec
+        R = np.identity(num_opt) - _A.dot(eta.T)
 
-            implied_mean = np.asscalar(eta.T.dot(cond_mean_grid))
-            implied_cov = np.asscalar(eta.T.dot(self.cond_cov).dot(eta))
-            implied_prec = 1./implied_cov
+        A = self.linear_part.dot(_A).reshape((-1,))
+        b = self.offset-self.linear_part.dot(R).dot(self.init_soln)
 
-            _A = self.cond_cov.dot(eta) * implied_prec
-            R = np.identity(num_opt) - _A.dot(eta.T)
+        # only the implied mean varies over the grid
 
-            A = self.linear_part.dot(_A).reshape((-1,))
-            b = self.offset-self.linear_part.dot(R).dot(self.init_soln)
+        cond_mean_grid = (np.multiply.outer(np.asarray(grid) - observed_target, 
+                                            target_lin.reshape(-1)) +
+                          self.cond_mean[None, :])
+        implied_mean = cond_mean_grid.dot(eta.reshape(-1))
+        conjugate_arg = implied_mean * implied_prec
 
-            conjugate_arg = implied_mean * implied_prec
+        # the constraints do not vary over the grid,
+        # so each solve is warm started at the previous solution
 
-            val, soln, _ = solver(np.asarray([conjugate_arg]),
-                                  np.reshape(implied_prec, (1,1)),
-                                  eta.T.dot(self.init_soln),
-                                  A.reshape((A.shape[0],1)),
-                                  b,
-                                  **self.solve_args)
+        val = np.zeros(grid.shape[0])
+        soln = np.zeros(grid.shape[0])
+        feasible_point = eta.T.dot(self.init_soln)
+
+        for k in range(grid.shape[0]):
 
-            gamma_ = _A.dot(soln) + R.dot(self.init_soln)
-            log_jacob = jacobian_grad_hess(gamma_, self.C, self.active_dirs)
+            val[k], soln_k, _ = solver(np.asarray([conjugate_arg[k]]),
+                                       np.reshape(implied_prec, (1,1)),
+                                       feasible_point,
+                                       A.reshape((A.shape[0],1)),
+                                       b,
+                                       **self.solve_args)
+            soln[k] = np.asarray(soln_k).reshape(-1)[0]
+            feasible_point = np.atleast_1d(soln[k])
 
-            ref_hat.append(-val - ((conjugate_arg ** 2) * implied_cov)/ 2. + log_jacob[0])
+        gamma_ = (np.multiply.outer(soln, _A.reshape(-1)) + 
+                  R.dot(self.init_soln)[None, :])
+        log_jacob = log_jacobian(gamma_, self.C, self.active_dirs)
 
-        return np.asarray(ref_hat)
+        return -val - ((conjugate_arg ** 2) * implied_cov)/ 2. + log_jacob
 
     def _construct_families(self):
 
@@ -815,11 +827,18 @@ def solve_barrier_affine_jacobian_py(conjugate_arg,
 
 
 # Jacobian calculations
+def _jacobian_owner(active_dirs):
+    """Index of the active group owning each row of C: group g
+    owns `ug.size - 1` consecutive rows.
+    """
+    sizes = np.array([ug.size - 1 for ug in active_dirs.values()], np.intp)
+    return np.repeat(np.arange(sizes.shape[0]), sizes)
+
+
 def calc_GammaMinus(gamma, active_dirs):
     """Calculate Gamma^minus (as a function of gamma vector, active directions)
     """
-    to_diag = [[g] * (ug.size - 1) for (g, ug) in zip(gamma, active_dirs.values())]
-    return block_diag(*[i for gp in to_diag for i in gp])
+    return np.diag(np.asarray(gamma)[_jacobian_owner(active_dirs)])
 
 
 def jacobian_grad_hess(gamma, C, active_dirs):
@@ -828,21 +847,20 @@ def jacobian_grad_hess(gamma, C, active_dirs):
     if C.shape == (0, 0):  # when all groups are size one, C will be an empty array
         return 0, 0, 0
     else:
-        GammaMinus = calc_GammaMinus(gamma, active_dirs)
+        owner = _jacobian_owner(active_dirs)
+        GpC = C + np.diag(np.asarray(gamma)[owner])
 
-        # eigendecomposition
-        #evalues, evectors = eig(GammaMinus + C)
+        # one LU factorization gives the log Jacobian and the inverse
+        GpC_LU, piv = lu_factor(GpC)
+        diag_LU = np.diag(GpC_LU)
+        sign = np.prod(np.sign(diag_LU)) * (-1) ** (piv != np.arange(piv.shape[0])).sum()
+        J = np.log(sign) + np.log(np.fabs(diag_LU)).sum()
 
-        # log Jacobian
-        #J = log(evalues).sum()
-        J = np.log(np.linalg.det(GammaMinus + C))
-
-        # inverse
-        #GpC_inv = evectors.dot(np.diag(1 / evalues).dot(evectors.T))
-        GpC_inv = np.linalg.inv(GammaMinus + C)
+        GpC_inv = lu_solve((GpC_LU, piv), np.identity(GpC.shape[0]))
 
         # summing matrix (gamma.size by C.shape[0])
-        S = block_diag(*[np.ones((1, ug.size - 1)) for ug in active_dirs.values()])
+        S = np.zeros((len(active_dirs), owner.shape[0]))
+        S[owner, np.arange(owner.shape[0])] = 1
 
         # gradient
         grad_J = S.dot(GpC_inv.diagonal())
@@ -852,6 +870,29 @@ def jacobian_grad_hess(gamma, C, active_dirs):
 
         return J, grad_J, hess_J
 
+
+def log_jacobian(gammas, C, active_dirs, chunksize=None):
+    """ Calculate the log-Jacobian for each row of `gammas`, as
+    the first entry of `jacobian_grad_hess` does for a single gamma.
+    Rows are handled `chunksize` at a time, by default enough to
+    keep the stacked matrices to about 1e6 entries.
+    """
+    gammas = np.atleast_2d(gammas)
+    if C.shape == (0, 0):  # when all groups are size one, C will be an empty array
+        return np.zeros(gammas.shape[0])
+    owner = _jacobian_owner(active_dirs)
+    diag = np.arange(owner.shape[0])
+    if chunksize is None:
+        chunksize = max(1, int(1e6) // C.size)
+    value = np.zeros(gammas.shape[0])
+    for start in range(0, gammas.shape[0], chunksize):
+        gammas_ = gammas[start:start + chunksize]
+        GpC = np.repeat(C[None, :, :], gammas_.shape[0], axis=0)
+        GpC[:, diag, diag] += gammas_[:, owner]
+        sign, logdet = np.linalg.slogdet(GpC)
+        value[start:start + chunksize] = np.log(sign) + logdet
+    return value
+
 def _check_groups(groups):
     """Make sure that the user-specific groups are ok
     There are a number of assumptions that group_lasso makes about
@@ -861,7 +902,8 @@ def _check_groups(groups):
     is a group 2 and a group 4, there must also be at least one
     feature in group 3).
     This function checks the user-specified group scheme and
-    raises an exception if it finds any problems.
+    raises an exception if it finds any problems, returning
+    a `group_index` of the groups otherwise.
     Sorting feature groups is potentially tedious for the user and
     in future we might do this for them.
     """
@@ -881,10 +923,14 @@ def _check_groups(groups):
     if not np.issubdtype(agroups.dtype, np.integer):
         raise TypeError("Groups are not integers")
 
+    index = group_index(agroups)
+
     # check starts with 0
-    if not np.amin(agroups) == 0:
+    if not index.labels[0] == 0:
         raise ValueError("First group is not 0")
 
     # check for no skipped groups
-    if not np.all(np.diff(np.unique(agroups)) == 1):
+    if not np.all(np.diff(index.labels) == 1):
         raise ValueError("Some group is skipped")
+
+    return index
@@ -4,6 +4,7 @@ import numpy as np
 import pandas as pd
 
 from .query import gaussian_query
+from ..constraints.affine import box_constraints
 
 from .randomization import randomization
 
@@ -38,8 +39,8 @@ class drop_losers(gaussian_query):
                                           for winner in self._winners])
         std_win = self.std.loc[self._winners]
 
-        A = -np.identity(K)
-        b = -np.ones(K) * best_loser
+        box = box_constraints(np.ones(K) * best_loser,
+                              np.inf * np.ones(K))
         linear = np.identity(K)
         offset = np.zeros(K)
         
@@ -64,7 +65,7 @@ class drop_losers(gaussian_query):
         self.observed_score_state = -self.means[self._winners] # problem is a minimization
         self.selection_variable = {'winners':self._winners}
 
-        self._setup_sampler(A, b, linear, offset)
+        self._setup_sampler(box, None, linear, offset)
 
     def MLE_inference(self,
                       level=0.9,
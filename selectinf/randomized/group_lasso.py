@@ -5,13 +5,18 @@ from copy import copy
 
 import numpy as np
 from scipy.stats import norm as ndist
+from scipy.linalg import lu_factor, lu_solve
 
 import regreg.api as rr
 
 from .query import query, affine_gaussian_sampler
 
 from .randomization import randomization
-from ..base import restricted_estimator
+from ..base import (screened_solve,
+                    design_columns,
+                    column_norms2,
+                    data_context,
+                    group_index)
 from ..algorithms.debiased_lasso import (debiasing_matrix,
                                          pseudoinverse_debiasing_matrix)
 
@@ -44,7 +49,8 @@ class group_lasso(query):
                   weights,
                   ridge_term,
                   randomizer,
-                  perturb=None):
+                  perturb=None,
+                  context=None):
          r"""
          Create a new post-selection object for the LASSO problem
 
@@ -67,10 +73,16 @@ class group_lasso(query):
          perturb : np.ndarray
              Random perturbation subtracted as a linear
              term in the objective function.
+
+         context : `data_context` (optional)
+             Cache of Gram matrix blocks and restricted estimators
+             shared with other queries and targets on the same data.
+             If None, one is made by `fit` and stored as `context`.
          """
 
          self.loglike = loglike
          self.nfeature = p = self.loglike.shape[0]
+         self.context = context
 
          self.ridge_term = ridge_term
          self.penalty = rr.group_lasso(groups,
@@ -121,22 +133,26 @@ class group_lasso(query):
 
         tol = 1.e-6
 
-        for g in sorted(np.unique(self.penalty.groups)):
-            group = self.penalty.groups == g
+        index = group_index.from_penalty(self.penalty)
+        soln = self.initial_soln
+        group_norms = index.norms(soln)
+        soln_norm = np.linalg.norm(soln)
+
+        for k, g in enumerate(index.labels):
+            group = index.indices(g)
 
-            soln = self.initial_soln
-            if np.linalg.norm(soln[group]) * tol * np.linalg.norm(soln):
+            if group_norms[k] * tol * soln_norm:
                 ordered_groups.append(g)
-                ordered_vars.extend(np.nonzero(group)[0])
+                ordered_vars.extend(group)
 
                 if self.penalty.weights[g] == 0:
                     unpenalized.append(g)
                     ordered_opt.append(soln[group])
                 else:
                     active.append(g)
-                    dir = soln[group] / np.linalg.norm(soln[group])
+                    dir = soln[group] / group_norms[k]
                     active_dirs[g] = dir
-                    ordered_opt.append(np.linalg.norm(soln[group]) - self.penalty.weights[g])
+                    ordered_opt.append(group_norms[k] - self.penalty.weights[g])
             else:
                 overall[group] = False
 
@@ -149,9 +165,11 @@ class group_lasso(query):
 
         self.observed_opt_state = np.hstack(ordered_opt)
 
-        _beta_unpenalized = restricted_estimator(self.loglike, 
-                                                 overall, 
-                                                 solve_args=solve_args)
+        X, y = self.loglike.data
+        context = self.context = data_context.ensure(self.context, X)
+        _beta_unpenalized = context.restricted_estimator(self.loglike, 
+                                                         overall, 
+                                                         solve_args=solve_args)
 
         beta_bar = np.zeros(p)
         beta_bar[overall] = _beta_unpenalized
@@ -163,9 +181,8 @@ class group_lasso(query):
 
         # setup hessian and ridge term
 
-        X, y = self.loglike.data
         W = self._W = self.loglike.saturated_loss.hessian(X.dot(beta_bar))
-        opt_linear = np.dot(X.T, X[:, ordered_vars] * W[:, None])
+        opt_linear = context.weighted_gram(W, ordered_vars)
 
         # set the observed score (data dependent) state
 
@@ -222,8 +239,7 @@ class group_lasso(query):
              log_det,
              log_cond_density) = dens_info
             
-            group_idx = self.penalty.groups == group
-            initial_scaling = np.linalg.norm(soln[group]) - self.penalty.weights[group]
+            initial_scaling = group_norms[index.position(group)] - self.penalty.weights[group]
 
             sampler = polynomial_gaussian_sampler(implied_mean,
                                                   implied_variance,
@@ -394,9 +410,12 @@ class group_lasso(query):
                                      -self._initial_omega, 
                                      0)
         
-        problem = rr.simple_problem(self.loglike, self.penalty)
+        # strong rule screening, checked against the KKT conditions
 
-        initial_soln = problem.solve(quad, **solve_args) 
+        initial_soln = screened_solve(self.loglike,
+                                      self.penalty,
+                                      quadratic=quad,
+                                      solve_args=solve_args)
         initial_subgrad = -(self.loglike.smooth_objective(initial_soln, 
                                                           'grad') +
                             quad.objective(initial_soln, 'grad'))
@@ -467,7 +486,7 @@ class group_lasso(query):
         loglike = rr.glm.gaussian(X, Y, coef=1. / sigma ** 2, quadratic=quadratic)
         n, p = X.shape
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
         if ridge_term is None:
             ridge_term = np.std(Y) * np.sqrt(mean_diag) / np.sqrt(n - 1)
 
@@ -553,7 +572,7 @@ class group_lasso(query):
 
         loglike = rr.glm.logistic(X, successes, trials=trials, quadratic=quadratic)
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
 
         if ridge_term is None:
             ridge_term = np.std(Y) * np.sqrt(mean_diag) / np.sqrt(n - 1)
@@ -638,7 +657,7 @@ class group_lasso(query):
 
         # scale for randomization seems kind of meaningless here...
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
 
         if ridge_term is None:
             ridge_term = np.std(times) * np.sqrt(mean_diag) / np.sqrt(n - 1)
@@ -714,7 +733,7 @@ class group_lasso(query):
 
         # scale for randomizer seems kind of meaningless here...
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
 
         if ridge_term is None:
             ridge_term = np.std(counts) * np.sqrt(mean_diag) / np.sqrt(n - 1)
@@ -809,7 +828,7 @@ class group_lasso(query):
         if np.asarray(feature_weights).shape == ():
             feature_weights = np.ones(p) * feature_weights
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
         if ridge_term is None:
             ridge_term = np.sqrt(mean_diag) / (n - 1)
 
@@ -864,7 +883,8 @@ def _reference_density_info(soln,
                             group_lasso_penalty, 
                             # randomization precision times opt_linear
                             precision_opt_linear, 
-                            tol=1.e-6):
+                            tol=1.e-6,
+                            check=False):
     '''
     
     Parameters
@@ -875,21 +895,24 @@ def _reference_density_info(soln,
     fixing everything in the optimization variables except $r_g$.
     
     Above, $A_0$ is the Hessian of loss evaluated at an appropriate point.
+
+    If `check` is True, verify that the active block of 
+    `opt_linear` is symmetric.
     '''
     pen = group_lasso_penalty       # shorthand 
-    nz = soln != 0                  # nonzero
-    nnz = nz.sum()                  # num nonzero
-    Hr = np.zeros((nnz, nnz))       # restricted hessian   
 
     nz_groups = []
 
+    index = group_index.from_penalty(pen)
+    group_norms = index.norms(soln)
+
     for group in ordered_groups:
-        group_idx = pen.groups == group
-        group_soln = soln[pen.groups == group]
+        group_idx = index.indices(group)
+        group_soln = soln[group_idx]
 
-        ng = group_idx.sum()
-        group_direction = u_g = group_soln / np.linalg.norm(group_soln)
-        group_norm = r_g = np.linalg.norm(group_soln)   # really r_g^*
+        ng = group_idx.shape[0]
+        group_norm = r_g = group_norms[index.position(group)]   # really r_g^*
+        group_direction = u_g = group_soln / r_g
         group_weight = lambda_g = pen.weights[group]
 
         fraction = np.sqrt(r_g / (lambda_g + r_g))
@@ -899,7 +922,7 @@ def _reference_density_info(soln,
                        np.multiply.outer(u_g, u_g))
         group_P = np.identity(ng) - np.multiply.outer(u_g, u_g)
         nz_groups.append((group,         # a group index g
-                          group_idx,   # indices where group==idx
+                          group_idx,   # indices of the group
                           group_block, 
                           group_P,
                           r_g,          
@@ -908,46 +931,69 @@ def _reference_density_info(soln,
                         )
             
     # setup the block hessian Hr=D_0^{1/2}A_0D_0^{1/2}
-    
-    ctr_g = 0
-    for group_g in nz_groups:
-        which_idx_g, sqrt_g = group_g[1], group_g[2]
-        idx_g = slice(ctr_g, ctr_g + which_idx_g.sum())
-        ctr_h = 0
-        for group_h in nz_groups:
-            which_idx_h, sqrt_h = group_h[1], group_h[2]
-            idx_h = slice(ctr_h, ctr_h + which_idx_h.sum())
-            H_hg = opt_linear[which_idx_h][:,idx_g] # E columns of Hessian + epsilon I
-            assert(np.allclose(H_hg, opt_linear[which_idx_g][:,idx_h].T))
-            if group_h[0] == group_g[0]: # subtract the identity matrix
-                H_hg -= np.identity(H_hg.shape[0])
-            Hr[idx_g][:,idx_h] += sqrt_h.dot(H_hg).dot(sqrt_g).T # multiply left and right by D_0^{1/2}
-            ctr_h += which_idx_h.sum()
-        ctr_g += which_idx_g.sum()
+    # the active rows of opt_linear, in the order of its columns,
+    # are contiguous by group so D_0^{1/2} is block diagonal
+
+    sizes = np.array([len(group_g[1]) for group_g in nz_groups], np.intp)
+    starts = np.hstack([0, np.cumsum(sizes)[:-1]]).astype(np.intp)
+    slices = [slice(start, start + size) for start, size in zip(starts, sizes)]
+    rows = np.hstack([group_g[1] for group_g in nz_groups])
+    row_groups = np.repeat(np.arange(len(nz_groups)), sizes)
+
+    fractions = np.sqrt(np.array([r_g / (lambda_g + r_g) for 
+                                  _, _, _, _, r_g, lambda_g, _ in nz_groups]))
+    U = np.hstack([group_g[6] for group_g in nz_groups])
+
+    def sqrt_D0(M):
+        # D_0^{1/2}M with diagonal blocks f_g I + (1 - f_g) u_g u_g^T
+        UM = np.add.reduceat(U[:, None] * M, starts, axis=0)
+        return (fractions[row_groups][:, None] * M + 
+                ((1 - fractions[row_groups]) * U)[:, None] * UM[row_groups])
+
+    H_E = opt_linear[rows] # E rows of Hessian + epsilon I
+    if check:
+        assert(np.allclose(H_E, H_E.T))
+    H_E = H_E.T - np.identity(H_E.shape[0]) # subtract the identity matrix
+    Hr = sqrt_D0(sqrt_D0(H_E).T).T # multiply left and right by D_0^{1/2}
         
-    implied_precision = np.dot(opt_linear.T,
-                               precision_opt_linear)
-    
-    # compute (I+Hr)^{-1}Hr
-    
-    final_matrix = np.linalg.inv(Hr)
-    
-    ctr_g = 0
+    # compute the diagonal blocks of Hr^{-1}
+    # only needed for groups of size > 1
+
+    Hr_LU = lu_factor(Hr)
+    large = [k for k, size in enumerate(sizes) if size > 1]
+    inverse_blocks = {}
+    if large:
+        E = np.zeros((Hr.shape[0], sizes[large].sum()))
+        ctr = 0
+        for k in large:
+            E[slices[k], ctr:ctr + sizes[k]] = np.identity(sizes[k])
+            ctr += sizes[k]
+        Hr_inv_E = lu_solve(Hr_LU, E)
+        ctr = 0
+        for k in large:
+            inverse_blocks[k] = Hr_inv_E[slices[k], ctr:ctr + sizes[k]]
+            ctr += sizes[k]
+
+    # the part of opt_linear not involving each group
+
+    soln_ordered = soln[ordered_variables]
+    full_offset = observed_subgrad + opt_linear.dot(soln_ordered)
+
     ref_dens_info = {}
 
-    for group_g in nz_groups:
+    for k, group_g in enumerate(nz_groups):
         which_g, which_idx_g, _, P_g, r_g, lambda_g, u_g = group_g
-        idx_g = slice(ctr_g, ctr_g + which_idx_g.sum())
+        idx_g = slices[k]
 
-        if which_idx_g.sum() > 1:
-            block_g = final_matrix[idx_g][:,idx_g]
+        if which_idx_g.shape[0] > 1:
+            block_g = inverse_blocks[k]
             block_g = P_g.dot(block_g).dot(P_g)
             # \tilde{\gamma}'s
             eigvals_g = np.linalg.eigvalsh(block_g)[1:]        
 
             # factors in the determinant
             factors_g = lambda_g / ((eigvals_g + 1) * r_g)           
-            k_g = which_idx_g.sum()
+            k_g = which_idx_g.shape[0]
             def logdet_g(factors_g, r_g, k_g, lambda_g, r):
                 r = np.reshape(r, (-1))
                 num = np.multiply.outer(factors_g, r - r_g)
@@ -965,16 +1011,12 @@ def _reference_density_info(soln,
         else: 
             logdet_g = lambda r: np.zeros_like(r).reshape(-1)
 
-        implied_variance = 1 / (np.dot(implied_precision[idx_g][:,idx_g],
-                                       u_g) * u_g).sum()
+        direction = precision_opt_linear[:,idx_g].dot(u_g)
+        implied_variance = 1 / (opt_linear[:,idx_g].dot(u_g) * direction).sum()
 
         # zero out this group's coordinate in the solution
 
-        soln_idx = soln.copy()[ordered_variables]
-        soln_idx[idx_g] = 0
-        offset = (observed_subgrad + 
-                  opt_linear.dot(soln_idx))
-        direction = precision_opt_linear[:,idx_g].dot(u_g)
+        offset = full_offset - opt_linear[:,idx_g].dot(soln_ordered[idx_g])
         num_implied_mean = -((observed_score_state + offset) * 
                              direction).sum()
         implied_mean = num_implied_mean * implied_variance
@@ -1007,8 +1049,6 @@ def _reference_density_info(soln,
                                   logdet_g,
                                   log_cond_density_g)
 
-        ctr_g += which_idx_g.sum()
-        
     return ref_dens_info
 
 class polynomial_gaussian_sampler(affine_gaussian_sampler):
@@ -1111,23 +1151,22 @@ def selected_targets(loglike,
                      penalty,
                      sign_info={}, 
                      dispersion=None,
-                     solve_args={'tol': 1.e-12, 'min_its': 50}):
+                     solve_args={'tol': 1.e-12, 'min_its': 50},
+                     context=None):
 
     X, y = loglike.data
     n, p = X.shape
-    features = []
-    
-    group_assignments = []
-    for group in active_groups:
-        group_idx = penalty.groups == group
-        features.extend(np.nonzero(group_idx)[0])
-        group_assignments.extend([group] * group_idx.sum())
+    context = data_context.ensure(context, X)
+    index = group_index.from_penalty(penalty)
+    features = index.features(active_groups)
+    group_assignments = np.repeat(active_groups,
+                                  [index.sizes[index.position(group)]
+                                   for group in active_groups])
 
     Xfeat = X[:, features]
-    Qfeat = Xfeat.T.dot(W[:, None] * Xfeat)
-    observed_target = restricted_estimator(loglike, features, solve_args=solve_args)
-    cov_target = np.linalg.inv(Qfeat)
-    _score_linear = -Xfeat.T.dot(W[:, None] * X).T
+    observed_target = context.restricted_estimator(loglike, features, solve_args=solve_args)
+    cov_target = context.inverse(W, features)
+    _score_linear = -context.weighted_gram(W, features)
     crosscov_target_score = _score_linear.dot(cov_target)
     alternatives = ['twosided'] * len(features)
 
@@ -1146,24 +1185,22 @@ def full_targets(loglike,
                  active_groups,
                  penalty,
                  dispersion=None,
-                 solve_args={'tol': 1.e-12, 'min_its': 50}):
+                 solve_args={'tol': 1.e-12, 'min_its': 50},
+                 context=None):
     
     X, y = loglike.data
     n, p = X.shape
-    features = []
-    
-    group_assignments = []
-    for group in active_groups:
-        group_idx = penalty.groups == group
-        features.extend(np.nonzero(group_idx)[0])
-        group_assignments.extend([group] * group_idx.sum())
+    context = data_context.ensure(context, X)
+    index = group_index.from_penalty(penalty)
+    features = index.features(active_groups)
+    group_assignments = np.repeat(active_groups,
+                                  [index.sizes[index.position(group)]
+                                   for group in active_groups])
 
     # target is one-step estimator
 
-    Qfull = X.T.dot(W[:, None] * X)
-    Qfull_inv = np.linalg.inv(Qfull)
     full_estimator = loglike.solve(**solve_args)
-    cov_target = Qfull_inv[features][:, features]
+    cov_target = context.inverse_block(W, features)
     observed_target = full_estimator[features]
 
     crosscov_target_score = np.zeros((p, cov_target.shape[0]))
@@ -1188,26 +1225,27 @@ def debiased_targets(loglike,
                      sign_info={}, 
                      dispersion=None,
                      approximate_inverse='JM',
-                     debiasing_args={}):
+                     debiasing_args={},
+                     context=None):
 
     X, y = loglike.data
     n, p = X.shape
-    features = []
-    
-    group_assignments = []
-    for group in active_groups:
-        group_idx = penalty.groups == group
-        features.extend(np.nonzero(group_idx)[0])
-        group_assignments.extend([group] * group_idx.sum())
+    context = data_context.ensure(context, X)
+    index = group_index.from_penalty(penalty)
+    features = index.features(active_groups)
+    group_assignments = np.repeat(active_groups,
+                                  [index.sizes[index.position(group)]
+                                   for group in active_groups])
 
     # relevant rows of approximate inverse
+    # both solvers need a dense design
 
     if approximate_inverse == 'JM':
-        Qinv_hat = np.atleast_2d(debiasing_matrix(X * np.sqrt(W)[:, None], 
+        Qinv_hat = np.atleast_2d(debiasing_matrix(design_columns(X) * np.sqrt(W)[:, None], 
                                                   features,
                                                   **debiasing_args)) / n
     else:
-        Qinv_hat = np.atleast_2d(pseudoinverse_debiasing_matrix(X * np.sqrt(W)[:, None],
+        Qinv_hat = np.atleast_2d(pseudoinverse_debiasing_matrix(design_columns(X) * np.sqrt(W)[:, None],
                                                                 features,
                                                                 **debiasing_args))
 
@@ -1218,18 +1256,17 @@ def debiased_targets(loglike,
     observed_target = nonrand_soln[features] - Qinv_hat.dot(G_nonrand)
 
     if p > n:
-        M1 = Qinv_hat.dot(X.T)
+        M1 = X.dot(Qinv_hat.T).T
         cov_target = (M1 * W[None, :]).dot(M1.T)
-        crosscov_target_score = -(M1 * W[None, :]).dot(X).T
+        crosscov_target_score = -X.T.dot(W[:, None] * M1.T)
     else:
-        Qfull = X.T.dot(W[:, None] * X)
+        Qfull = context.weighted_gram(W)
         cov_target = Qinv_hat.dot(Qfull.dot(Qinv_hat.T))
         crosscov_target_score = -Qinv_hat.dot(Qfull).T
 
     if dispersion is None:  # use Pearson's X^2
         Xfeat = X[:, features]
-        Qrelax = Xfeat.T.dot(W[:, None] * Xfeat)
-        relaxed_soln = nonrand_soln[features] - np.linalg.inv(Qrelax).dot(G_nonrand[features])
+        relaxed_soln = nonrand_soln[features] - context.inverse(W, features).dot(G_nonrand[features])
         dispersion = (((y - loglike.saturated_loss.mean_function(Xfeat.dot(relaxed_soln)))**2 / W).sum() / 
                       (n - len(features)))
 
@@ -1,16 +1,22 @@
 from __future__ import print_function
 
 import numpy as np
+from scipy.linalg import cho_solve
 from scipy.stats import norm as ndist
 
 import regreg.api as rr
 
-from .query import gaussian_query
+from .query import gaussian_query, _batch_MLE
+from ..constraints.affine import box_constraints
 from .randomization import randomization
 from ..algorithms.debiased_lasso import (debiasing_matrix,
                                          pseudoinverse_debiasing_matrix)
 from ..algorithms.sqrt_lasso import solve_sqrt_lasso
-from ..base import restricted_estimator
+from ..base import (screened_solve,
+                    design_columns,
+                    column_norms2,
+                    blocked_design,
+                    data_context)
 
 
 #### High dimensional version
@@ -41,7 +47,8 @@ class lasso(gaussian_query):
                  feature_weights,
                  ridge_term,
                  randomizer,
-                 perturb=None):
+                 perturb=None,
+                 context=None):
         r"""
         Create a new post-selection object for the LASSO problem
 
@@ -64,10 +71,16 @@ class lasso(gaussian_query):
         perturb : np.ndarray
             Random perturbation subtracted as a linear
             term in the objective function.
+
+        context : `data_context` (optional)
+            Cache of Gram matrix blocks and restricted estimators
+            shared with other queries and targets on the same data.
+            If None, one is made by `fit` and stored as `context`.
         """
 
         self.loglike = loglike
         self.nfeature = p = self.loglike.shape[0]
+        self.context = context
 
         if np.asarray(feature_weights).shape == ():
             feature_weights = np.ones(loglike.shape) * feature_weights
@@ -81,7 +94,8 @@ class lasso(gaussian_query):
 
     def fit(self,
             solve_args={'tol': 1.e-12, 'min_its': 50},
-            perturb=None):
+            perturb=None,
+            warm_start=None):
         """
 
         Fit the randomized lasso using `regreg`.
@@ -92,6 +106,13 @@ class lasso(gaussian_query):
         solve_args : keyword args
              Passed to `regreg.problems.simple_problem.solve`.
 
+        perturb : np.ndarray (optional)
+             Random perturbation subtracted as a linear
+             term in the objective function.
+
+        warm_start : np.ndarray (optional)
+             Starting point for the solver.
+
         Returns
         -------
 
@@ -105,7 +126,8 @@ class lasso(gaussian_query):
         (self.initial_soln, 
          self.initial_subgrad) = self._solve_randomized_problem(
                                      perturb=perturb, 
-                                     solve_args=solve_args)
+                                     solve_args=solve_args,
+                                     warm_start=warm_start)
 
         active_signs = np.sign(self.initial_soln)
         active = self._active = active_signs != 0
@@ -136,9 +158,11 @@ class lasso(gaussian_query):
         self.observed_opt_state = np.concatenate([initial_scalings,
                                                   initial_unpenalized])
 
-        _beta_unpenalized = restricted_estimator(self.loglike, 
-                                                 self._overall, 
-                                                 solve_args=solve_args)
+        X, y = self.loglike.data
+        context = self.context = data_context.ensure(self.context, X)
+        _beta_unpenalized = context.restricted_estimator(self.loglike, 
+                                                         self._overall, 
+                                                         solve_args=solve_args)
 
         beta_bar = np.zeros(p)
         beta_bar[overall] = _beta_unpenalized
@@ -158,10 +182,9 @@ class lasso(gaussian_query):
 
         # \bar{\beta}_{E \cup U} piece -- the unpenalized M estimator
 
-        X, y = self.loglike.data
         W = self._W = self.loglike.saturated_loss.hessian(X.dot(beta_bar))
-        _hessian_active = np.dot(X.T, X[:, active] * W[:, None])
-        _hessian_unpen = np.dot(X.T, X[:, unpenalized] * W[:, None])
+        _hessian_active = context.weighted_gram(W, active)
+        _hessian_unpen = context.weighted_gram(W, unpenalized)
 
         _score_linear_term = -np.hstack([_hessian_active, _hessian_unpen])
 
@@ -211,11 +234,16 @@ class lasso(gaussian_query):
         # now make the constraints and implied gaussian
 
         self._setup = True
-        A_scaling = -np.identity(num_opt_var)
-        b_scaling = np.zeros(num_opt_var)
+        # the scalings are nonnegative, the unpenalized 
+        # coordinates are unconstrained
 
-        self._setup_sampler_data = (A_scaling[:active.sum()],
-                                    b_scaling[:active.sum()],
+        lower_scaling = -np.inf * np.ones(num_opt_var)
+        lower_scaling[:active.sum()] = 0
+        box_scaling = box_constraints(lower_scaling,
+                                      np.inf * np.ones(num_opt_var))
+
+        self._setup_sampler_data = (box_scaling,
+                                    None,
                                     opt_linear,
                                     opt_offset)
         if num_opt_var > 0:
@@ -225,7 +253,8 @@ class lasso(gaussian_query):
 
     def _solve_randomized_problem(self, 
                                   perturb=None, 
-                                  solve_args={'tol': 1.e-12, 'min_its': 50}):
+                                  solve_args={'tol': 1.e-12, 'min_its': 50},
+                                  warm_start=None):
 
         # take a new perturbation if supplied
         if perturb is not None:
@@ -238,15 +267,50 @@ class lasso(gaussian_query):
                                      -self._initial_omega, 
                                      0)
 
-        problem = rr.simple_problem(self.loglike, self.penalty)
+        # strong rule screening, checked against the KKT conditions
 
-        initial_soln = problem.solve(quad, **solve_args) 
+        initial_soln = screened_solve(self.loglike,
+                                      self.penalty,
+                                      quadratic=quad,
+                                      solve_args=solve_args,
+                                      initial=warm_start)
         initial_subgrad = -(self.loglike.smooth_objective(initial_soln, 
                                                           'grad') +
                             quad.objective(initial_soln, 'grad'))
 
         return initial_soln, initial_subgrad
 
+    # hooks for `gaussian_query.ensemble`
+
+    def _ensemble_warm_start(self, fit_args):
+
+        # the unperturbed solution; the shared context
+        # caches Gram matrix blocks per distinct active set
+
+        X, y = self.loglike.data
+        self.context = data_context.ensure(self.context, X)
+        quad = rr.identity_quadratic(self.ridge_term, 0, 0, 0)
+        return screened_solve(self.loglike,
+                              self.penalty,
+                              quadratic=quad,
+                              solve_args=fit_args.get('solve_args', 
+                                                      {'tol': 1.e-12, 'min_its': 50}))
+
+    def _ensemble_fit(self, perturb, warm_start, fit_args):
+        signs = self.fit(perturb=perturb, warm_start=warm_start, **fit_args)
+        return signs != 0
+
+    def _ensemble_targets(self, target, features, **target_args):
+        target_args = dict(target_args)
+        target_args.setdefault('context', self.context)
+        if target == 'debiased':
+            target_args.setdefault('penalty', self.penalty)
+        return form_targets(target, 
+                            self.loglike, 
+                            self._W, 
+                            features, 
+                            **target_args)
+
     @staticmethod
     def gaussian(X,
                  Y,
@@ -270,8 +334,9 @@ class lasso(gaussian_query):
         Parameters
         ----------
 
-        X : ndarray
-            Shape (n,p) -- the design matrix.
+        X : ndarray, `scipy.sparse` matrix or `blocked_design`
+            Shape (n,p) -- the design matrix. A `np.memmap`
+            is read in blocks of rows through `blocked_design`.
 
         Y : ndarray
             Shape (n,) -- the response.
@@ -307,13 +372,16 @@ class lasso(gaussian_query):
 
         """
 
+        if isinstance(X, np.memmap):
+            X = blocked_design(X)
+
         loglike = rr.glm.gaussian(X, 
                                   Y, 
                                   coef=1. / sigma ** 2, 
                                   quadratic=quadratic)
         n, p = X.shape
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
         if ridge_term is None:
             ridge_term = np.std(Y) * np.sqrt(mean_diag) / np.sqrt(n - 1)
 
@@ -349,8 +417,9 @@ class lasso(gaussian_query):
         Parameters
         ----------
 
-        X : ndarray
-            Shape (n,p) -- the design matrix.
+        X : ndarray, `scipy.sparse` matrix or `blocked_design`
+            Shape (n,p) -- the design matrix. A `np.memmap`
+            is read in blocks of rows through `blocked_design`.
 
         successes : ndarray
             Shape (n,) -- response vector. An integer number of successes.
@@ -387,11 +456,13 @@ class lasso(gaussian_query):
         L : `selection.randomized.lasso.lasso`
 
         """
+        if isinstance(X, np.memmap):
+            X = blocked_design(X)
         n, p = X.shape
 
         loglike = rr.glm.logistic(X, successes, trials=trials, quadratic=quadratic)
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
 
         if ridge_term is None:
             ridge_term = np.std(Y) * np.sqrt(mean_diag) / np.sqrt(n - 1)
@@ -473,7 +544,7 @@ class lasso(gaussian_query):
 
         # scale for randomization seems kind of meaningless here...
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
 
         if ridge_term is None:
             ridge_term = np.std(times) * np.sqrt(mean_diag) / np.sqrt(n - 1)
@@ -547,7 +618,7 @@ class lasso(gaussian_query):
 
         # scale for randomizer seems kind of meaningless here...
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
 
         if ridge_term is None:
             ridge_term = np.std(counts) * np.sqrt(mean_diag) / np.sqrt(n - 1)
@@ -640,7 +711,7 @@ class lasso(gaussian_query):
         if np.asarray(feature_weights).shape == ():
             feature_weights = np.ones(p) * feature_weights
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
         if ridge_term is None:
             ridge_term = np.sqrt(mean_diag) / (n - 1)
 
@@ -688,16 +759,17 @@ def selected_targets(loglike,
                      features, 
                      sign_info={}, 
                      dispersion=None,
-                     solve_args={'tol': 1.e-12, 'min_its': 50}):
+                     solve_args={'tol': 1.e-12, 'min_its': 50},
+                     context=None):
 
     X, y = loglike.data
     n, p = X.shape
+    context = data_context.ensure(context, X)
 
     Xfeat = X[:, features]
-    Qfeat = Xfeat.T.dot(W[:, None] * Xfeat)
-    observed_target = restricted_estimator(loglike, features, solve_args=solve_args)
-    cov_target = np.linalg.inv(Qfeat)
-    _score_linear = -Xfeat.T.dot(W[:, None] * X).T
+    _score_linear = -context.weighted_gram(W, features)
+    observed_target = context.restricted_estimator(loglike, features, solve_args=solve_args)
+    cov_target = context.inverse(W, features)
     crosscov_target_score = _score_linear.dot(cov_target)
     alternatives = ['twosided'] * features.sum()
     features_idx = np.arange(p)[features]
@@ -716,20 +788,20 @@ def full_targets(loglike,
                  W, 
                  features, 
                  dispersion=None,
-                 solve_args={'tol': 1.e-12, 'min_its': 50}):
+                 solve_args={'tol': 1.e-12, 'min_its': 50},
+                 context=None):
     
     X, y = loglike.data
     n, p = X.shape
+    context = data_context.ensure(context, X)
     features_bool = np.zeros(p, np.bool)
     features_bool[features] = True
     features = features_bool
 
     # target is one-step estimator
 
-    Qfull = X.T.dot(W[:, None] * X)
-    Qfull_inv = np.linalg.inv(Qfull)
-    full_estimator = loglike.solve(**solve_args)
-    cov_target = Qfull_inv[features][:, features]
+    full_estimator = _full_estimator(loglike, W, context, solve_args)
+    cov_target = context.inverse_block(W, features)
     observed_target = full_estimator[features]
     crosscov_target_score = np.zeros((p, cov_target.shape[0]))
     crosscov_target_score[features] = -np.identity(cov_target.shape[0])
@@ -741,6 +813,29 @@ def full_targets(loglike,
     alternatives = ['twosided'] * features.sum()
     return observed_target, cov_target * dispersion, crosscov_target_score.T * dispersion, alternatives
 
+def _full_estimator(loglike, W, context, solve_args):
+    r"""
+    Unpenalized estimator using all features.
+
+    A Newton step from 0 using the Cholesky factor of $X^TWX$ 
+    cached in `context` (the one `inverse_block` uses) solves 
+    a quadratic loss with Hessian $X^TWX$. Otherwise the
+    gradient at the step is not 0 and `loglike.solve` is used.
+    """
+    quadratic = getattr(loglike, 'quadratic', None)
+
+    def gradient(beta):
+        G = loglike.smooth_objective(beta, 'grad')
+        if quadratic is not None:
+            G = G + quadratic.objective(beta, 'grad')
+        return G
+
+    G_0 = gradient(np.zeros(loglike.shape[0]))
+    estimator = -cho_solve(context.cholesky(W), G_0)
+    if np.linalg.norm(gradient(estimator)) <= 1.e-8 * max(np.linalg.norm(G_0), 1):
+        return estimator
+    return loglike.solve(**solve_args)
+
 def debiased_targets(loglike, 
                      W, 
                      features, 
@@ -748,26 +843,28 @@ def debiased_targets(loglike,
                      penalty=None, #required kwarg
                      dispersion=None,
                      approximate_inverse='JM',
-                     debiasing_args={}):
+                     debiasing_args={},
+                     context=None):
 
     if penalty is None:
         raise ValueError('require penalty for consistent estimator')
 
     X, y = loglike.data
     n, p = X.shape
+    context = data_context.ensure(context, X)
     features_bool = np.zeros(p, np.bool)
     features_bool[features] = True
     features = features_bool
 
     # relevant rows of approximate inverse
-
+    # both solvers need a dense design
 
     if approximate_inverse == 'JM':
-        Qinv_hat = np.atleast_2d(debiasing_matrix(X * np.sqrt(W)[:, None], 
+        Qinv_hat = np.atleast_2d(debiasing_matrix(design_columns(X) * np.sqrt(W)[:, None], 
                                                   np.nonzero(features)[0],
                                                   **debiasing_args)) / n
     else:
-        Qinv_hat = np.atleast_2d(pseudoinverse_debiasing_matrix(X * np.sqrt(W)[:, None],
+        Qinv_hat = np.atleast_2d(pseudoinverse_debiasing_matrix(design_columns(X) * np.sqrt(W)[:, None],
                                                                 np.nonzero(features)[0],
                                                                 **debiasing_args))
 
@@ -778,18 +875,17 @@ def debiased_targets(loglike,
     observed_target = nonrand_soln[features] - Qinv_hat.dot(G_nonrand)
 
     if p > n:
-        M1 = Qinv_hat.dot(X.T)
+        M1 = X.dot(Qinv_hat.T).T
         cov_target = (M1 * W[None, :]).dot(M1.T)
-        crosscov_target_score = -(M1 * W[None, :]).dot(X).T
+        crosscov_target_score = -X.T.dot(W[:, None] * M1.T)
     else:
-        Qfull = X.T.dot(W[:, None] * X)
+        Qfull = context.weighted_gram(W)
         cov_target = Qinv_hat.dot(Qfull.dot(Qinv_hat.T))
         crosscov_target_score = -Qinv_hat.dot(Qfull).T
 
     if dispersion is None:  # use Pearson's X^2
         Xfeat = X[:, features]
-        Qrelax = Xfeat.T.dot(W[:, None] * Xfeat)
-        relaxed_soln = nonrand_soln[features] - np.linalg.inv(Qrelax).dot(G_nonrand[features])
+        relaxed_soln = nonrand_soln[features] - context.inverse(W, features).dot(G_nonrand[features])
         dispersion = (((y - loglike.saturated_loss.mean_function(Xfeat.dot(relaxed_soln)))**2 / W).sum() / 
                       (n - features.sum()))
 
@@ -809,6 +905,150 @@ def form_targets(target,
                    features,
                    **kwargs)
 
+def batch_lasso(X,
+                Y,
+                feature_weights,
+                sigma=1.,
+                quadratic=None,
+                ridge_term=None,
+                randomizer_scale=None,
+                perturb=None,
+                target='selected',
+                level=0.9,
+                ncpu=1,
+                context=None,
+                solve_args={'tol': 1.e-12, 'min_its': 50},
+                MLE_args={'tol': 1.e-12}):
+    r"""
+    Randomized Gaussian LASSO followed by the selective MLE
+    for each column of `Y`, with one design `X`.
+
+    Everything depending only on `X` is computed once: 
+    the column norms setting the default ridge term
+    and randomizer scale, and (through a shared `data_context`) 
+    the blocks of $X^TX$ and their factorizations used by the
+    queries and targets. Each randomized problem is warm 
+    started at the solution for the previous response.
+    The selective MLEs are computed in a pool of `ncpu`
+    processes.
+
+    Parameters
+    ----------
+
+    X : ndarray, `scipy.sparse` matrix or `blocked_design`
+        Shape (n,p) -- the design matrix.
+
+    Y : ndarray
+        Shape (n,m) -- the responses.
+
+    feature_weights: [float, sequence]
+        Penalty weights, as in `lasso.gaussian`.
+
+    sigma : float (optional)
+        Noise standard deviation, as in `lasso.gaussian`.
+
+    quadratic : `regreg.identity_quadratic.identity_quadratic` (optional)
+        An optional quadratic term to be added to the objective.
+
+    ridge_term : float (optional)
+        How big a ridge term to add? Defaults to the value 
+        `lasso.gaussian` uses for each response.
+
+    randomizer_scale : float (optional)
+        Scale for IID components of randomizer. Defaults
+        to the value `lasso.gaussian` uses for each response.
+
+    perturb : ndarray (optional)
+        Shape (p,m) -- perturbations for each response.
+        If None, drawn from each randomizer.
+
+    target : str
+        One of ['selected', 'full', 'debiased'].
+
+    level : float
+        Confidence level.
+
+    ncpu : int
+        Number of processes computing the selective MLEs.
+
+    context : `data_context` (optional)
+        Cache of Gram matrix blocks for `X`.
+
+    solve_args : dict
+        Passed to `lasso.fit` and the target constructor.
+
+    MLE_args : dict
+        Passed to the solver of `selective_MLE`.
+
+    Returns
+    -------
+
+    result : `pd.DataFrame`
+        One row per response and selected variable, with 
+        columns `response` and `variable` followed
+        by those of `selective_MLE`.
+
+    """
+
+    if isinstance(X, np.memmap):
+        X = blocked_design(X)
+    Y = np.asarray(Y)
+    n, p = X.shape
+
+    context = data_context.ensure(context, X)
+    mean_diag = np.mean(column_norms2(X))
+    feature_weights = np.asarray(feature_weights) / sigma ** 2
+
+    MLE_problems = []
+    warm_start = None
+
+    for j in range(Y.shape[1]):
+        y = Y[:, j]
+
+        _ridge_term, _randomizer_scale = ridge_term, randomizer_scale
+        if _ridge_term is None:
+            _ridge_term = np.std(y) * np.sqrt(mean_diag) / np.sqrt(n - 1)
+        if _randomizer_scale is None:
+            _randomizer_scale = np.sqrt(mean_diag) * 0.5 * np.std(y) * np.sqrt(n / (n - 1.))
+
+        loglike = rr.glm.gaussian(X, y, coef=1. / sigma ** 2, quadratic=quadratic)
+        conv = lasso(loglike,
+                     feature_weights,
+                     _ridge_term,
+                     randomization.isotropic_gaussian((p,), _randomizer_scale),
+                     context=context)
+        signs = conv.fit(solve_args=solve_args,
+                         perturb=None if perturb is None else perturb[:, j],
+                         warm_start=warm_start)
+        warm_start = conv.initial_soln
+        nonzero = signs != 0
+        if not nonzero.sum():
+            continue
+
+        target_args = {'context': context}
+        if target == 'debiased':
+            target_args['penalty'] = conv.penalty
+        else:
+            target_args['solve_args'] = solve_args
+        (observed_target,
+         cov_target,
+         cov_target_score,
+         _) = form_targets(target, loglike, conv._W, nonzero, **target_args)
+
+        args = conv.sampler._selective_MLE_args(observed_target,
+                                                cov_target,
+                                                cov_target_score,
+                                                conv.observed_opt_state)
+        MLE_problems.append(('response',
+                             j,
+                             np.nonzero(nonzero)[0],
+                             args,
+                             {'solve_args': MLE_args,
+                              'level': level,
+                              'useC': conv.useC}))
+
+    return _batch_MLE(MLE_problems, 'response', ncpu=ncpu)
+
 class split_lasso(lasso):
 
     """
@@ -820,7 +1060,8 @@ class split_lasso(lasso):
                  feature_weights,
                  proportion_select,
                  ridge_term=0,
-                 perturb=None):
+                 perturb=None,
+                 context=None):
 
         (self.loglike,
          self.feature_weights,
@@ -831,17 +1072,20 @@ class split_lasso(lasso):
                              ridge_term)
 
         self.nfeature = p = self.loglike.shape[0]
+        self.context = context
         self.penalty = rr.weighted_l1norm(self.feature_weights, lagrange=1.)
         self._initial_omega = perturb
 
     def fit(self,
             solve_args={'tol': 1.e-12, 'min_its': 50},
             perturb=None,
-            estimate_dispersion=True):
+            estimate_dispersion=True,
+            warm_start=None):
 
         signs = lasso.fit(self, 
                           solve_args=solve_args,
-                          perturb=perturb)
+                          perturb=perturb,
+                          warm_start=warm_start)
         
         # for data splitting randomization,
         # we need to estimate a dispersion parameter
@@ -909,7 +1153,8 @@ class split_lasso(lasso):
                                   # optional binary vector 
                                   # indicating selection data 
                                   perturb=None, 
-                                  solve_args={'tol': 1.e-12, 'min_its': 50}):
+                                  solve_args={'tol': 1.e-12, 'min_its': 50},
+                                  warm_start=None):
 
         # take a new perturbation if none supplied
         if perturb is not None:
@@ -932,6 +1177,8 @@ class split_lasso(lasso):
         randomized_loss.coef *= inv_frac
 
         problem = rr.simple_problem(randomized_loss, self.penalty)
+        if warm_start is not None:
+            problem.coefs[:] = warm_start
         initial_soln = problem.solve(quad, **solve_args) 
         initial_subgrad = -(randomized_loss.smooth_objective(initial_soln,
                                                              'grad') +
@@ -2,7 +2,7 @@ import functools
 
 import numpy as np
 import regreg.api as rr
-from ..constraints.affine import constraints
+from ..constraints.affine import constraints, box_constraints
 
 from .query import gaussian_query
 from .randomization import randomization
@@ -226,11 +226,11 @@ class modelQ(gaussian_query):
 
         opt_linear, opt_offset = self.opt_transform
 
-        A_scaling = -np.identity(self.num_opt_var)
-        b_scaling = np.zeros(self.num_opt_var)
+        box_scaling = box_constraints(np.zeros(self.num_opt_var),
+                                      np.inf * np.ones(self.num_opt_var))
 
-        self._setup_sampler(A_scaling,
-                            b_scaling,
+        self._setup_sampler(box_scaling,
+                            None,
                             opt_linear,
                             opt_offset)
         
@@ -4,7 +4,7 @@ import numpy as np
 from scipy.stats import norm as ndist, invgamma
 from scipy.linalg import fractional_matrix_power
 
-from ..algorithms.barrier_affine import solve_barrier_affine_py
+from ..algorithms.barrier_affine import solve_barrier, constraint_structure
 
 
 class posterior(object):
@@ -68,6 +68,10 @@ class posterior(object):
         self.linear_part = linear_part
         self.offset = offset
 
+        # the constraint is fixed, so its structure is detected once
+        self._structure = constraint_structure(linear_part, offset)
+        self.solver_diagnostics = {}
+
         self.initial_estimate = np.asarray(result['MLE'])
         self.dispersion = dispersion
         self.log_ref = log_ref
@@ -98,14 +102,14 @@ class posterior(object):
         prec_marginal = self.prec_marginal
         conjugate_marginal = prec_marginal.dot(mean_marginal)
 
-        solver = solve_barrier_affine_py
-
-        val, soln, hess = solver(conjugate_marginal,
-                                 prec_marginal,
-                                 self.feasible_point,
-                                 self.linear_part,
-                                 self.offset,
-                                 **self.solve_args)
+        val, soln, hess = solve_barrier(conjugate_marginal,
+                                        prec_marginal,
+                                        self.feasible_point,
+                                        self.linear_part,
+                                        self.offset,
+                                        structure=self._structure,
+                                        diagnostics=self.solver_diagnostics,
+                                        **self.solve_args)
 
         log_normalizer = -val - mean_marginal.T.dot(prec_marginal).dot(mean_marginal) / 2.
 
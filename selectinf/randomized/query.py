@@ -1,8 +1,11 @@
+import copy
 import functools
 from itertools import product
+from multiprocessing import Pool
 
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from scipy.stats import norm as ndist
 from scipy.optimize import bisect
 
@@ -11,11 +14,13 @@ import regreg.api as rr
 
 from ..distributions.api import discrete_family
 from ..constraints.affine import (sample_from_constraints,
-                                  constraints)
+                                  constraints,
+                                  box_constraints)
 from .posterior_inference import posterior
 from .selective_MLE_utils import solve_barrier_affine as solve_barrier_affine_C
 from .approx_reference import approximate_grid_inference
-from ..algorithms.barrier_affine import solve_barrier_affine_py
+from ..algorithms.barrier_affine import (solve_barrier_affine_py,
+                                         solve_barrier)
 
 class query(object):
     r"""
@@ -111,9 +116,18 @@ class gaussian_query(query):
                        # for covariance of randomization
                        dispersion=1):
 
-        A, b = linear_part, offset
-        if not np.all(A.dot(self.observed_opt_state) - b <= 0):
-            raise ValueError('constraints not satisfied')
+        # the selection region is either {o: Ao <= b} or
+        # a `box_constraints` (with `offset` ignored)
+
+        if isinstance(linear_part, box_constraints):
+            box = linear_part
+            if not box.value(self.observed_opt_state) <= 0:
+                raise ValueError('constraints not satisfied')
+        else:
+            box = None
+            A, b = linear_part, offset
+            if not np.all(A.dot(self.observed_opt_state) - b <= 0):
+                raise ValueError('constraints not satisfied')
 
         (cond_mean,
          cond_cov,
@@ -139,10 +153,17 @@ class gaussian_query(query):
         _, randomizer_prec = self.randomizer.cov_prec
         self.cond_mean, self.cond_cov, self.randomizer_prec = cond_mean, cond_cov, randomizer_prec
 
-        affine_con = constraints(A,
-                                 b,
-                                 mean=cond_mean,
-                                 covariance=cond_cov)
+        if box is not None:
+            affine_con = box_constraints(box.lower,
+                                         box.upper,
+                                         sign=box.sign,
+                                         mean=cond_mean,
+                                         covariance=cond_cov)
+        else:
+            affine_con = constraints(A,
+                                     b,
+                                     mean=cond_mean,
+                                     covariance=cond_cov)
 
         self.sampler = affine_gaussian_sampler(affine_con,
                                                self.observed_opt_state,
@@ -379,6 +400,127 @@ class gaussian_query(query):
                                        solve_args=solve_args)
         return G.summary(alternatives=alternatives)
 
+    def ensemble(self,
+                 ndraw,
+                 target,
+                 perturbations=None,
+                 fit_args={},
+                 target_args={},
+                 level=0.9,
+                 ncpu=1,
+                 MLE_args={'tol': 1.e-12}):
+        """
+        Refit the query for an ensemble of randomizations
+        and compute the selective MLE for each.
+
+        Each randomized problem is warm started at the solution
+        of the unperturbed problem (when the query solves one) and
+        all fits share the query's data, so quantities cached per 
+        distinct active set (e.g. the Hessian blocks and restricted 
+        estimators of a `data_context`) are computed once. The 
+        selective MLEs are computed in a pool of `ncpu` processes.
+
+        Parameters
+        ----------
+        ndraw : int
+            Number of randomizations.
+        target : str
+            Which targets, e.g. 'selected' for `lasso` or 
+            'marginal' for `screening`.
+        perturbations : sequence, optional
+            Perturbations of the draws. If None, `ndraw` 
+            are drawn from `self.randomizer`.
+        fit_args : dict, optional
+            Passed to `fit`.
+        target_args : dict, optional
+            Passed to the target constructor.
+        level : float, optional
+            Confidence level.
+        ncpu : int, optional
+            Number of processes computing the selective MLEs.
+        MLE_args : dict, optional
+            Passed to the solver of `selective_MLE`.
+
+        Returns
+        -------
+        result : `pd.DataFrame`
+            One row per draw and selected variable, with 
+            columns `draw` and `variable` followed
+            by those of `selective_MLE`.
+        """
+
+        if perturbations is None:
+            perturbations = [self.randomizer.sample() for _ in range(ndraw)]
+
+        warm_start = self._ensemble_warm_start(fit_args)
+
+        MLE_problems = []
+        for draw, perturb in enumerate(perturbations):
+            query = copy.copy(self)
+            selected = query._ensemble_fit(perturb, warm_start, fit_args)
+            if not selected.sum():
+                continue
+
+            (observed_target,
+             cov_target,
+             cov_target_score,
+             _) = query._ensemble_targets(target, selected, **target_args)
+
+            args = query.sampler._selective_MLE_args(observed_target,
+                                                     cov_target,
+                                                     cov_target_score,
+                                                     query.observed_opt_state)
+            MLE_problems.append(('draw',
+                                 draw,
+                                 np.nonzero(selected)[0],
+                                 args,
+                                 {'solve_args': MLE_args,
+                                  'level': level,
+                                  'useC': query.useC}))
+
+        return _batch_MLE(MLE_problems, 'draw', ncpu=ncpu)
+
+    # hooks for `ensemble`, overwritten by subclasses
+
+    def _ensemble_warm_start(self, fit_args):
+        return None
+
+    def _ensemble_fit(self, perturb, warm_start, fit_args):
+        return np.asarray(self.fit(perturb=perturb, **fit_args)) != 0
+
+    def _ensemble_targets(self, target, features, **target_args):
+        return getattr(self, '%s_targets' % target)(features, **target_args)
+
+def _batch_MLE(MLE_problems, key, ncpu=1):
+    """
+    Selective MLEs of a batch of problems, computed in a pool 
+    of `ncpu` processes, stacked in one frame with columns
+    `key` and `variable` followed by those of `selective_MLE`.
+    """
+    if ncpu > 1 and len(MLE_problems) > 1:
+        pool = Pool(ncpu)
+        try:
+            results = pool.map(_MLE_worker, MLE_problems)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_MLE_worker(problem) for problem in MLE_problems]
+
+    if not results:
+        return pd.DataFrame(columns=[key, 'variable'])
+    return pd.concat(results, ignore_index=True)
+
+def _MLE_worker(problem):
+    """
+    Selective MLE of one of a batch of problems,
+    labelled by a key column and the selected variables.
+    """
+    key, value, variables, args, kwargs = problem
+    result = selective_MLE(*args, **kwargs)[0]
+    result.insert(0, key, value)
+    result.insert(1, 'variable', variables)
+    return result
 
 class multiple_queries(object):
     '''
@@ -877,6 +1019,9 @@ class affine_gaussian_sampler(optimization_sampler):
         self.useC = useC
         self.randomizer_prec = randomizer_prec
 
+        # which barrier solver was used, see `solve_barrier`
+        self.solver_diagnostics = {}
+
     def log_cond_density(self,
                          opt_sample,
                          target_sample,
@@ -948,22 +1093,44 @@ class affine_gaussian_sampler(optimization_sampler):
         solve_args : dict, optional
             Arguments passed to solver.
         """
-        score_offset = self.observed_score_state + self.logdens_transform[1]
-
-        return selective_MLE(observed_target,
-                             target_cov,
-                             target_score_cov,
-                             init_soln,
-                             self.mean,
-                             self.covariance,
-                             self.logdens_transform[0],
-                             self.affine_con.linear_part,
-                             self.affine_con.offset,
-                             self.randomizer_prec,
-                             score_offset,
+        return selective_MLE(*self._selective_MLE_args(observed_target,
+                                                       target_cov,
+                                                       target_score_cov,
+                                                       init_soln),
                              solve_args=solve_args,
                              level=level,
-                             useC=self.useC)
+                             useC=self.useC,
+                             diagnostics=self.solver_diagnostics)
+
+    def _selective_MLE_args(self,
+                            observed_target,
+                            target_cov,
+                            target_score_cov,
+                            init_soln):
+        """
+        Positional arguments of the module 
+        `selective_MLE` for this sampler.
+        """
+        score_offset = self.observed_score_state + self.logdens_transform[1]
+
+        # a box is passed as is, so the solver can use its structure
+
+        if isinstance(self.affine_con, box_constraints):
+            linear_part, offset = self.affine_con, None
+        else:
+            linear_part, offset = self.affine_con.linear_part, self.affine_con.offset
+
+        return (observed_target,
+                target_cov,
+                target_score_cov,
+                init_soln,
+                self.mean,
+                self.covariance,
+                self.logdens_transform[0],
+                linear_part,
+                offset,
+                self.randomizer_prec,
+                score_offset)
 
     def reparam_map(self,
                     parameter_target,
@@ -989,15 +1156,17 @@ class affine_gaussian_sampler(optimization_sampler):
         if useC:
             solver = solve_barrier_affine_C
         else:
-            solver = _solve_barrier_affine_py
-
-        val, soln, hess = solver(conjugate_arg,
-                                 prec_opt,
-                                 # JT: I think this quadratic is wrong should involve target_cov and target_lin too?
-                                 init_soln,
-                                 self.affine_con.linear_part,
-                                 self.affine_con.offset,
-                                 **solve_args)
+            solver = solve_barrier_affine_py
+
+        val, soln, hess = solve_barrier(conjugate_arg,
+                                        prec_opt,
+                                        # JT: I think this quadratic is wrong should involve target_cov and target_lin too?
+                                        init_soln,
+                                        self.affine_con.linear_part,
+                                        self.affine_con.offset,
+                                        affine_solver=solver,
+                                        diagnostics=self.solver_diagnostics,
+                                        **solve_args)
 
         inter_map = target_cov.dot(target_lin.T.dot(prec_opt))
         param_map = parameter_target + inter_map.dot(mean_param - soln)
@@ -1366,7 +1535,8 @@ def selective_MLE(observed_target,
                   score_offset,
                   solve_args={'tol': 1.e-12},
                   level=0.9,
-                  useC=False):
+                  useC=False,
+                  diagnostics=None):
     """
     Selective MLE based on approximation of
     CGF.
@@ -1376,8 +1546,10 @@ def selective_MLE(observed_target,
         Observed estimate of target.
     target_cov : ndarray
         Estimated covaraince of target.
-    target_score_cov : ndarray
+    target_score_cov : ndarray or sparse matrix
         Estimated covariance of target and score of randomized query.
+        If sparse, no dense object of the dimension of the score
+        is formed.
     init_soln : ndarray
         Feasible point for optimization problem.
     cond_mean : ndarray
@@ -1387,8 +1559,9 @@ def selective_MLE(observed_target,
     logdens_linear : ndarray
         Describes how conditional mean of optimization
         variables varies with target.
-    linear_part : ndarray
-        Linear part of affine constraints: $\{o:Ao \leq b\}$
+    linear_part : ndarray or `box_constraints`
+        Linear part of affine constraints: $\{o:Ao \leq b\}$,
+        or a `box_constraints` in which case `offset` is ignored.
     offset : ndarray
         Offset part of affine constraints: $\{o:Ao \leq b\}$
     solve_args : dict, optional
@@ -1396,52 +1569,66 @@ def selective_MLE(observed_target,
     level : float, optional
         Confidence level.
     useC : bool, optional
-        Use python or C solver.
+        Use python or C solver for general constraints.
+    diagnostics : dict, optional
+        Updated with the barrier solver used, see `solve_barrier`.
     """
 
     if np.asarray(observed_target).shape in [(), (0,)]:
         raise ValueError('no target specified')
 
     observed_target = np.atleast_1d(observed_target)
-    prec_target = np.linalg.inv(target_cov)
+    prec_target = _inverse_covariance(target_cov)
 
-    prec_opt = np.linalg.inv(cond_cov)
+    prec_opt = _inverse_covariance(cond_cov)
 
     # target_lin determines how the conditional mean of optimization variables
     # vary with target
     # logdens_linear determines how the argument of the optimization density
     # depends on the score, not how the mean depends on score, hence the minus sign
 
-    target_linear = target_score_cov.T.dot(prec_target)
+    if sparse.issparse(target_score_cov):
+        # e.g. coordinate targets of a screening query:
+        # target_linear stays sparse, only products
+        # of the dimension of the target are dense
+        target_linear = target_score_cov.T.dot(sparse.csr_matrix(prec_target)).tocsr()
+        target_lin = - _dense(target_linear.T.dot(logdens_linear.T)).T
+    else:
+        target_linear = target_score_cov.T.dot(prec_target)
+        target_lin = - _dense(logdens_linear.dot(target_linear))
     target_offset = score_offset - target_linear.dot(observed_target)
 
-    target_lin = - logdens_linear.dot(target_linear)
     target_off = cond_mean - target_lin.dot(observed_target)
 
     if np.asarray(randomizer_prec).shape in [(), (0,)]:
         _P = target_linear.T.dot(target_offset) * randomizer_prec
-        _prec = prec_target + (target_linear.T.dot(target_linear) * randomizer_prec) - target_lin.T.dot(prec_opt).dot(
+        _prec = prec_target + (_dense(target_linear.T.dot(target_linear)) * randomizer_prec) - target_lin.T.dot(prec_opt).dot(
             target_lin)
     else:
-        _P = target_linear.T.dot(randomizer_prec).dot(target_offset)
-        _prec = prec_target + (target_linear.T.dot(randomizer_prec).dot(target_linear)) - target_lin.T.dot(
+        prec_linear = _dense(target_linear.T.dot(randomizer_prec)).T
+        _P = prec_linear.T.dot(target_offset)
+        _prec = prec_target + _dense(target_linear.T.dot(prec_linear)) - target_lin.T.dot(
             prec_opt).dot(target_lin)
 
     C = target_cov.dot(_P - target_lin.T.dot(prec_opt).dot(target_off))
 
     conjugate_arg = prec_opt.dot(cond_mean)
 
+    # orthant and monotone constraints use specialized solvers
+
     if useC:
         solver = solve_barrier_affine_C
     else:
         solver = solve_barrier_affine_py
 
-    val, soln, hess = solver(conjugate_arg,
-                             prec_opt,
-                             init_soln,
-                             linear_part,
-                             offset,
-                             **solve_args)
+    val, soln, hess = solve_barrier(conjugate_arg,
+                                    prec_opt,
+                                    init_soln,
+                                    linear_part,
+                                    offset,
+                                    affine_solver=solver,
+                                    diagnostics=diagnostics,
+                                    **solve_args)
 
     final_estimator = target_cov.dot(_prec).dot(observed_target) \
                       + target_cov.dot(target_lin.T.dot(prec_opt.dot(cond_mean - soln))) + C
@@ -1482,6 +1669,25 @@ def selective_MLE(observed_target,
     return result, observed_info_mean, log_ref
 
 
+def _dense(A):
+    """
+    Dense array from a (possibly sparse) matrix.
+    """
+    if sparse.issparse(A):
+        return A.toarray()
+    return np.asarray(A)
+
+def _inverse_covariance(cov):
+    """
+    Inverse of a covariance matrix, 
+    without factorizing it when it is diagonal.
+    """
+    cov = np.asarray(cov)
+    diag = np.diag(cov)
+    if np.count_nonzero(cov) == np.count_nonzero(diag) and np.all(diag != 0):
+        return np.diag(1. / diag)
+    return np.linalg.inv(cov)
+
 def normalizing_constant(target_parameter,
                          observed_target,
                          target_cov,
@@ -1492,7 +1698,8 @@ def normalizing_constant(target_parameter,
                          logdens_linear,
                          linear_part,
                          offset,
-                         useC=False):
+                         useC=False,
+                         diagnostics=None):
     """
     Approximation of normalizing constant
     in affine constrained Gaussian.
@@ -1526,7 +1733,9 @@ def normalizing_constant(target_parameter,
     level : float, optional
         Confidence level.
     useC : bool, optional
-        Use python or C solver.
+        Use python or C solver for general constraints.
+    diagnostics : dict, optional
+        Updated with the barrier solver used, see `solve_barrier`.
     """
 
     target_parameter = np.atleast_1d(target_parameter)
@@ -1569,14 +1778,16 @@ def normalizing_constant(target_parameter,
     if useC:
         solver = solve_barrier_affine_C
     else:
-        solver = _solve_barrier_affine_py
-
-    value, soln, hess = solver(-linear_term,
-                               full_Q,
-                               full_feasible,
-                               full_con_linear,
-                               offset,
-                               **solve_args)
+        solver = solve_barrier_affine_py
+
+    value, soln, hess = solve_barrier(-linear_term,
+                                      full_Q,
+                                      full_feasible,
+                                      full_con_linear,
+                                      offset,
+                                      affine_solver=solver,
+                                      diagnostics=diagnostics,
+                                      **solve_args)
     return (-value + 0.5 * np.sum(target_parameter * prec_target.dot(target_parameter)),
             soln[:ntarget],
             hess[:ntarget][:, :ntarget])
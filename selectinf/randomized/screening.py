@@ -1,11 +1,13 @@
 from __future__ import print_function
 import functools
 import numpy as np
+from scipy import sparse
 from scipy.stats import norm as ndist
 
 import regreg.api as rr
 
 from .query import gaussian_query
+from ..constraints.affine import box_constraints
 from .randomization import randomization
 
 class screening(gaussian_query):
@@ -28,10 +30,47 @@ class screening(gaussian_query):
         self._randomized_score = self.observed_score_state - self._initial_omega
         return self._randomized_score, self._randomized_score.shape[0]
 
+    def _setup_implied_gaussian(self,
+                                opt_linear,
+                                opt_offset,
+                                # optional dispersion parameter
+                                # for covariance of randomization
+                                dispersion=1):
+
+        # opt_linear has one nonzero per column, the sign of
+        # a selected coordinate, stored as a sparse p x k matrix.
+        # with isotropic randomization the conditional precision is
+        # diagonal and logdens_linear has one nonzero per row
+
+        _, prec = self.randomizer.cov_prec
+        prec = prec / dispersion
+
+        if sparse.issparse(opt_linear):
+            opt_linear = opt_linear.tocsc()
+            one_per_column = (np.all(np.diff(opt_linear.indptr) == 1) and
+                              np.unique(opt_linear.indices).shape[0] == opt_linear.nnz)
+            if np.asarray(prec).shape in [(), (0,)] and one_per_column:
+                values = opt_linear.data ** 2
+                cond_precision = np.diag(values * prec)
+                cond_cov = np.diag(1. / (values * prec))
+                logdens_linear = sparse.diags(1. / values).dot(opt_linear.T).tocsr()
+                cond_mean = -logdens_linear.dot(self.observed_score_state + opt_offset)
+                return cond_mean, cond_cov, cond_precision, logdens_linear
+            opt_linear = opt_linear.toarray()
+
+        return gaussian_query._setup_implied_gaussian(self,
+                                                      opt_linear,
+                                                      opt_offset,
+                                                      dispersion=dispersion)
+
     def multivariate_targets(self, features, dispersion=1.):
         """
         Entries of the mean of \Sigma[E,E]^{-1}Z_E
         """
+        variances, diagonal = _covariance_diagonal(self.covariance)
+        if diagonal:
+            return self._diagonal_targets(features, variances, dispersion)
+
         score_linear = self.covariance[:, features].copy() / dispersion
         Q = score_linear[features]
         cov_target = np.linalg.inv(Q)
@@ -48,6 +87,10 @@ class screening(gaussian_query):
         """
         Entries of the mean of \Sigma[E,E]^{-1}Z_E
         """
+        variances, diagonal = _covariance_diagonal(self.covariance)
+        if diagonal:
+            return self._diagonal_targets(features, variances, dispersion)
+
         score_linear = self.covariance[:, features].copy() / dispersion
         Q = self.covariance / dispersion
         cov_target = (np.linalg.inv(Q)[features])[:, features]
@@ -61,6 +104,14 @@ class screening(gaussian_query):
         """
         Entries of the mean of Z_E
         """
+        variances, diagonal = _covariance_diagonal(self.covariance)
+        if diagonal:
+            idx = np.nonzero(features)[0]
+            return (-self.observed_score_state[idx],
+                    np.diag(variances[idx]),
+                    -self._coordinate_crosscov(idx, variances[idx]),
+                    ['twosided'] * idx.shape[0])
+
         score_linear = self.covariance[:, features]
         Q = score_linear[features]
         cov_target = Q
@@ -70,6 +121,30 @@ class screening(gaussian_query):
 
         return observed_target, cov_target, crosscov_target_score.T, alternatives
 
+    def _diagonal_targets(self, features, variances, dispersion):
+        """
+        Multivariate (equivalently full) targets when
+        \Sigma is diagonal.
+        """
+        idx = np.nonzero(features)[0]
+        scaled = variances[idx] / dispersion
+        return (-self.observed_score_state[idx] / scaled,
+                np.diag(1. / scaled) * dispersion,
+                -self._coordinate_crosscov(idx, np.ones(idx.shape[0])) * dispersion,
+                ['twosided'] * idx.shape[0])
+
+    def _coordinate_crosscov(self, idx, signs):
+        """
+        k x p cross-covariance with the score whose j-th row is 
+        signs[j] times the standard basis vector of idx[j].
+        It is sparse only when the covariance was given as a 
+        1-d array of variances or a sparse matrix.
+        """
+        crosscov = _signed_coordinates(self.nfeature, idx, signs).T
+        if sparse.issparse(self.covariance) or np.asarray(self.covariance).ndim == 1:
+            return crosscov.tocsr()
+        return crosscov.toarray()
+
 class marginal_screening(screening):
 
     def __init__(self,
@@ -106,19 +181,18 @@ class marginal_screening(screening):
         self.observed_opt_state = (np.fabs(_randomized_score) - self.threshold)[self._selected]
         self.num_opt_var = self.observed_opt_state.shape[0]
 
-        opt_linear = np.zeros((p, self.num_opt_var))
-        opt_linear[self._selected] = np.diag(active_signs)
+        opt_linear = _signed_coordinates(p, np.nonzero(self._selected)[0], active_signs)
         opt_offset = np.zeros(p)
         opt_offset[self._selected] = active_signs * self.threshold[self._selected]
         opt_offset[self._not_selected] = _randomized_score[self._not_selected]
 
         self._setup = True
 
-        A_scaling = -np.identity(len(active_signs))
-        b_scaling = np.zeros(self.num_opt_var)
+        box_scaling = box_constraints(np.zeros(self.num_opt_var),
+                                      np.inf * np.ones(self.num_opt_var))
 
-        self._setup_sampler(A_scaling,
-                            b_scaling,
+        self._setup_sampler(box_scaling,
+                            None,
                             opt_linear,
                             opt_offset)
 
@@ -134,8 +208,8 @@ class marginal_screening(screening):
         Threshold
         '''
 
-        randomized_stdev = np.sqrt(np.diag(covariance) + randomizer_scale**2)
-        p = covariance.shape[0]
+        randomized_stdev = np.sqrt(_covariance_diagonal(covariance)[0] + randomizer_scale**2)
+        p = randomized_stdev.shape[0]
         randomizer = randomization.isotropic_gaussian((p,), randomizer_scale)
         threshold = randomized_stdev * ndist.ppf(1. - marginal_level / 2.)
 
@@ -148,14 +222,27 @@ class marginal_screening(screening):
 # Stepup procedures like Benjamini-Hochberg
 
 def stepup_selection(Z_values, stepup_Z):
-
-    absZ_argsort = np.argsort(np.fabs(Z_values))[::-1]
-    absZ_sorted = np.fabs(Z_values)[absZ_argsort]
-    survivors = absZ_sorted - stepup_Z >= 0
-    if np.any(survivors):
-        num_selected = max(np.nonzero(survivors)[0]) + 1
+    """
+    Step-up selection of the largest $|Z|$ values.
+
+    The number selected is the largest $k$ with at least $k$ of the
+    $|Z|$ values above the $k$-th cutoff. It is read off the sorted
+    $|Z|$ values with `np.searchsorted`, so only arrays of the size
+    of `Z_values` are formed.
+    """
+    absZ = np.fabs(Z_values)
+    stepup_Z = np.asarray(stepup_Z)
+    num_above = absZ.shape[0] - np.searchsorted(np.sort(absZ), stepup_Z, side='left')
+    survivors = np.nonzero(num_above >= np.arange(1, stepup_Z.shape[0] + 1))[0]
+    if survivors.shape[0] > 0:
+        num_selected = survivors[-1] + 1
+        if num_selected < absZ.shape[0]:
+            selected_idx = np.argpartition(-absZ, num_selected - 1)[:num_selected]
+        else:
+            selected_idx = np.arange(absZ.shape[0])
+        selected_idx = selected_idx[np.argsort(-absZ[selected_idx], kind='mergesort')]
         return (num_selected,                    # how many selected
-                absZ_argsort[:num_selected],     # ordered indices of those selected
+                selected_idx,                    # ordered indices of those selected
                 stepup_Z[num_selected - 1])      # the selected are greater than this number 
     else:
         return 0, None, None
@@ -175,8 +262,8 @@ class stepup(screening):
                            randomizer,
                            perturb=None)                           
 
-        self.stepup_Z = stepup_Z
-        if not (np.all(sorted(self.stepup_Z)[::-1] == self.stepup_Z) and
+        self.stepup_Z = np.asarray(stepup_Z)
+        if not (np.all(np.diff(self.stepup_Z) <= 0) and
                 np.all(np.greater_equal(self.stepup_Z, 0))):
             raise ValueError('stepup Z values should be non-negative and non-increasing')
 
@@ -207,9 +294,7 @@ class stepup(screening):
             self.observed_opt_state = np.zeros(self.num_opt_var)
             self.observed_opt_state[:] = np.fabs(_randomized_score[selected_idx]) - last_cutoff
 
-            opt_linear = np.zeros((p, self.num_opt_var))
-            for j in range(self.num_opt_var):
-                opt_linear[selected_idx[j], j] = active_signs[j]
+            opt_linear = _signed_coordinates(p, selected_idx, active_signs)
 
             opt_offset = np.zeros(p)
             opt_offset[self._selected] = active_signs * last_cutoff
@@ -217,11 +302,11 @@ class stepup(screening):
 
             self._setup = True
 
-            A_scaling = -np.identity(self.num_opt_var)
-            b_scaling = np.zeros(self.num_opt_var)
+            box_scaling = box_constraints(np.zeros(self.num_opt_var),
+                                          np.inf * np.ones(self.num_opt_var))
 
-            self._setup_sampler(A_scaling,
-                                b_scaling,
+            self._setup_sampler(box_scaling,
+                                None,
                                 opt_linear,
                                 opt_offset)
         else:
@@ -235,13 +320,20 @@ class stepup(screening):
            randomizer_scale,
            q=0.2,
            perturb=None):
-        
-        if not np.allclose(np.diag(covariance), covariance[0, 0]):
+        """
+        Randomized Benjamini-Hochberg.
+
+        `covariance` can be a 1-d array of variances
+        (a diagonal covariance), in which case no
+        p x p object is formed.
+        """
+        variances = _covariance_diagonal(covariance)[0]
+        if not np.allclose(variances, variances[0]):
             raise ValueError('Benjamin-Hochberg expecting Z scores with identical variance, standardize your Z')
 
         p = observed_score.shape[0]
 
-        randomized_stdev = np.sqrt(covariance[0, 0] + randomizer_scale**2)
+        randomized_stdev = np.sqrt(variances[0] + randomizer_scale**2)
         randomizer = randomization.isotropic_gaussian((p,), randomizer_scale)
 
         # Benjamini-Hochberg cutoffs
@@ -253,21 +345,34 @@ class stepup(screening):
                       stepup_Z,
                       perturb=perturb)
 
+    @staticmethod
     def BH_general(observed_score,
                    covariance, 
                    randomizer_cov,
                    q=0.2,
                    perturb=None):
-        
-        if not np.allclose(np.diag(covariance), covariance[0, 0]):
+        """
+        Randomized Benjamini-Hochberg with
+        a general Gaussian randomization.
+
+        Either covariance can be a 1-d array of variances,
+        and a diagonal `randomizer_cov` gives an isotropic
+        randomization.
+        """
+        variances = _covariance_diagonal(covariance)[0]
+        randomizer_var, randomizer_diagonal = _covariance_diagonal(randomizer_cov)
+        if not np.allclose(variances, variances[0]):
             raise ValueError('Benjamin-Hochberg expecting Z scores with identical variance, standardize your Z')
-        if not np.allclose(np.diag(randomizer_cov), randomizer_cov[0, 0]):
+        if not np.allclose(randomizer_var, randomizer_var[0]):
             raise ValueError('Benjamin-Hochberg expecting Z scores with identical variance, standardize your randomization')
 
         p = observed_score.shape[0]
 
-        randomizer = randomization.gaussian(randomizer_cov)
-        randomized_stdev = np.sqrt(covariance[0, 0] + randomizer_cov[0, 0])
+        if randomizer_diagonal:
+            randomizer = randomization.isotropic_gaussian((p,), np.sqrt(randomizer_var[0]))
+        else:
+            randomizer = randomization.gaussian(randomizer_cov)
+        randomized_stdev = np.sqrt(variances[0] + randomizer_var[0])
 
         # Benjamini-Hochberg cutoffs
         stepup_Z = randomized_stdev * ndist.ppf(1 - q * np.arange(1, p + 1) / (2 * p))
@@ -326,8 +431,7 @@ class topK(screening):
             self.observed_opt_state = np.fabs(Z[self._selected])
             self.num_opt_var = self.observed_opt_state.shape[0]
 
-            opt_linear = np.zeros((p, self.num_opt_var))
-            opt_linear[self._selected] = np.diag(topK_signs)
+            opt_linear = _signed_coordinates(p, np.nonzero(self._selected)[0], topK_signs)
             opt_offset = np.zeros(p)  
 
         else:
@@ -344,8 +448,7 @@ class topK(screening):
             self.observed_opt_state = Z[self._selected]
             self.num_opt_var = self.observed_opt_state.shape[0]
 
-            opt_linear = np.zeros((p, self.num_opt_var))
-            opt_linear[self._selected] = np.identity(self.num_opt_var)
+            opt_linear = _signed_coordinates(p, np.nonzero(self._selected)[0], np.ones(self.num_opt_var))
             opt_offset = np.zeros(p)  
 
         # in both cases, this conditioning means we just need to compute
@@ -354,14 +457,36 @@ class topK(screening):
 
         lower_bound = np.max(Z[self._not_selected])
 
-        A_scaling = -np.identity(self.num_opt_var)
-        b_scaling = -np.ones(self.num_opt_var) * lower_bound
+        box_scaling = box_constraints(np.ones(self.num_opt_var) * lower_bound,
+                                      np.inf * np.ones(self.num_opt_var))
 
-        self._setup_sampler(A_scaling,
-                            b_scaling,
+        self._setup_sampler(box_scaling,
+                            None,
                             opt_linear,
                             opt_offset)
 
         return self._selected
 
-
+def _signed_coordinates(p, rows, signs):
+    """
+    Sparse p x k matrix whose j-th column is signs[j]
+    times the standard basis vector of rows[j].
+    """
+    rows = np.asarray(rows)
+    return sparse.csc_matrix((np.asarray(signs, float),
+                              (rows, np.arange(rows.shape[0]))),
+                             shape=(p, rows.shape[0]))
+
+def _covariance_diagonal(covariance):
+    """
+    Diagonal of a covariance given as a dense or sparse matrix,
+    or as a 1-d array of variances, and whether it is diagonal.
+    """
+    if sparse.issparse(covariance):
+        variances = covariance.diagonal()
+        return variances, (covariance - sparse.diags(variances)).count_nonzero() == 0
+    covariance = np.asarray(covariance)
+    if covariance.ndim == 1:
+        return covariance, True
+    variances = np.diag(covariance)
+    return variances, np.count_nonzero(covariance) == np.count_nonzero(variances)
@@ -17,7 +17,7 @@ from regreg.atoms.slope import _basic_proximal_map
 import regreg.api as rr
 
 from .randomization import randomization
-from ..base import restricted_estimator
+from ..base import column_norms2, design_columns, data_context
 from .query import gaussian_query
 
 
@@ -28,7 +28,8 @@ class slope(gaussian_query):
                  slope_weights,
                  ridge_term,
                  randomizer,
-                 perturb=None):
+                 perturb=None,
+                 context=None):
         r"""
         Create a new post-selection object for the SLOPE problem
 
@@ -51,10 +52,16 @@ class slope(gaussian_query):
         perturb : np.ndarray
             Random perturbation subtracted as a linear
             term in the objective function.
+
+        context : `data_context` (optional)
+            Cache of Gram matrix blocks and restricted estimators
+            shared with other queries and targets on the same data.
+            If None, one is made by `fit` and stored as `context`.
         """
 
         self.loglike = loglike
         self.nfeature = p = self.loglike.shape[0]
+        self.context = context
 
         if np.asarray(slope_weights).shape == ():
             slope_weights = np.ones(loglike.shape) * slope_weights
@@ -110,7 +117,9 @@ class slope(gaussian_query):
         self.observed_opt_state = initial_scalings
         self._unpenalized = np.zeros(p, np.bool)
 
-        _beta_unpenalized = restricted_estimator(self.loglike, self._overall, solve_args=solve_args)
+        X, y = self.loglike.data
+        context = self.context = data_context.ensure(self.context, X)
+        _beta_unpenalized = context.restricted_estimator(self.loglike, self._overall, solve_args=solve_args)
 
         beta_bar = np.zeros(p)
         beta_bar[overall] = _beta_unpenalized
@@ -118,39 +127,33 @@ class slope(gaussian_query):
 
         self.num_opt_var = self.observed_opt_state.shape[0]
 
-        X, y = self.loglike.data
         W = self._W = self.loglike.saturated_loss.hessian(X.dot(beta_bar))
-        _hessian_active = np.dot(X.T, X[:, active] * W[:, None])
+        _hessian_active = context.weighted_gram(W, active)
         _score_linear_term = -_hessian_active
         self.score_transform = (_score_linear_term, np.zeros(_score_linear_term.shape[0]))
 
         self.observed_score_state = _score_linear_term.dot(_beta_unpenalized)
         self.observed_score_state[inactive] += self.loglike.smooth_objective(beta_bar, 'grad')[inactive]
 
-        cur_indx_array = []
-        cur_indx_array.append(0)
-        cur_indx = 0
-        pointer = 0
-        signs_cluster = []
-        for j in range(p - 1):
-            if np.abs(sorted_soln[j + 1]) != np.abs(sorted_soln[cur_indx]):
-                cur_indx_array.append(j + 1)
-                cur_indx = j + 1
-                sign_vec = np.zeros(p)
-                sign_vec[np.arange(j + 1 - cur_indx_array[pointer]) + cur_indx_array[pointer]] = \
-                    np.sign(self.initial_soln[indices[np.arange(j + 1 - cur_indx_array[pointer]) + cur_indx_array[pointer]]])
-                signs_cluster.append(sign_vec)
-                pointer = pointer + 1
-                if sorted_soln[j + 1] == 0:
-                    break
-
-        signs_cluster = np.asarray(signs_cluster).T
-
-        if signs_cluster.size == 0:
+        # clusters of tied magnitudes among the nonzero
+        # coefficients, largest magnitude first
+
+        nactive = active.sum()
+        sorted_active = indices[:nactive]
+        sorted_abs = np.fabs(sorted_soln[:nactive])
+        cluster_starts = np.hstack([0, np.flatnonzero(np.diff(sorted_abs) != 0) + 1]).astype(np.intp)
+        sorted_signs = active_signs[sorted_active]
+
+        if nactive == 0:
             return active_signs
         else:
-            X_clustered = X[:, indices].dot(signs_cluster)
-            _opt_linear_term = X.T.dot(X_clustered)
+            # X times the p x K matrix of signs of each cluster,
+            # a segmented sum of the signed active columns
+
+            X_clustered = np.add.reduceat(design_columns(X, sorted_active) * sorted_signs[None, :],
+                                          cluster_starts,
+                                          axis=1)
+            _opt_linear_term = np.asarray(X.T.dot(X_clustered))
 
             _, prec = self.randomizer.cov_prec
             opt_linear, opt_offset = (_opt_linear_term, self.initial_subgrad)
@@ -188,7 +191,7 @@ class slope(gaussian_query):
         loglike = rr.glm.gaussian(X, Y, coef=1. / sigma ** 2, quadratic=quadratic)
         n, p = X.shape
 
-        mean_diag = np.mean((X ** 2).sum(0))
+        mean_diag = np.mean(column_norms2(X))
         if ridge_term is None:
             ridge_term = np.std(Y) * np.sqrt(mean_diag) / np.sqrt(n - 1)
 
@@ -245,41 +248,41 @@ def _projection_onto_selected_subgradients(prox_arg,
 
     result = np.zeros_like(prox_arg)
 
-    ordered_clustering = []
-    cur_idx = 0
-    for cluster_size in cluster_sizes:
-        ordered_clustering.append([ordering[j + cur_idx] for j in range(cluster_size)])
-        cur_idx += cluster_size
+    ordering = np.asarray(ordering)
+    cluster_sizes = np.asarray(cluster_sizes, np.intp)
+    cluster_ends = np.cumsum(cluster_sizes)
+    cluster_starts = cluster_ends - cluster_sizes
+    ncluster = cluster_sizes.shape[0]
 
-    # Now, run appropriate SLOPE prox on each cluster
-    cur_idx = 0
-    for i, cluster in enumerate(ordered_clustering):
-        prox_subarg = np.array([prox_arg[j] for j in cluster])
+    # the last cluster is handled by the SLOPE prox
+    # if the last value of the solution was zero
 
-        # If the value of the soln to the prox was non-zero
-        # then we solve a SLOPE of size 1 smaller than the cluster
+    nfixed = ncluster - 1 if last_value_zero and ncluster > 0 else ncluster
 
-        # If the cluster size is 1, the value is just
-        # the corresponding signed weight
+    # If the value of the soln to the prox was non-zero
+    # then we solve a SLOPE of size 1 smaller than the cluster
 
-        if i < len(ordered_clustering) - 1 or not last_value_zero:
-            if len(cluster) == 1:
-                result[cluster[0]] = weights[cur_idx] * active_signs[cluster[0]]
-            else:
-                indices = [j + cur_idx for j in range(len(cluster))]
-                cluster_weights = weights[indices]
+    # If the cluster size is 1, the value is just
+    # the corresponding signed weight
 
-                ir = IsotonicRegression()
-                _ir_result = ir.fit_transform(np.arange(len(cluster)), cluster_weights[::-1])[::-1]
-                result[indices] = -np.multiply(active_signs[indices], _ir_result/2.)
+    singletons = cluster_starts[:nfixed][cluster_sizes[:nfixed] == 1]
+    result[ordering[singletons]] = weights[singletons] * active_signs[ordering[singletons]]
 
-        else:
-            indices = np.array([j + cur_idx for j in range(len(cluster))])
-            cluster_weights = weights[indices]
+    for i in np.flatnonzero(cluster_sizes[:nfixed] > 1):
+        positions = np.arange(cluster_starts[i], cluster_ends[i])
+        cluster = ordering[positions]
+        cluster_weights = weights[positions]
+
+        ir = IsotonicRegression()
+        _ir_result = ir.fit_transform(np.arange(cluster_sizes[i]), cluster_weights[::-1])[::-1]
+        result[cluster] = -np.multiply(active_signs[cluster], _ir_result/2.)
 
-            slope_prox = _basic_proximal_map(prox_subarg, cluster_weights)
-            result[indices] = prox_subarg - slope_prox
+    if nfixed < ncluster:
+        positions = np.arange(cluster_starts[-1], cluster_ends[-1])
+        cluster = ordering[positions]
+        prox_subarg = prox_arg[cluster]
 
-        cur_idx += len(cluster)
+        slope_prox = _basic_proximal_map(prox_subarg, weights[positions])
+        result[cluster] = prox_subarg - slope_prox
 
     return result
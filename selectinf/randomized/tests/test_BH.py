@@ -1,9 +1,12 @@
 import numpy as np
+import nose.tools as nt
+from scipy import sparse
 
 from scipy.stats import norm as ndist
 
 from ...tests.instance import gaussian_instance
-from ...tests.decorators import rpy_test_safe
+from ...tests.flags import SET_SEED
+from ...tests.decorators import rpy_test_safe, set_seed_iftrue
 
 from ..screening import stepup
 from ..screening import stepup, stepup_selection
@@ -41,6 +44,58 @@ def test_BH_procedure():
         np.testing.assert_allclose(sorted(BHfilter(2 * ndist.sf(np.fabs(Z)), q=0.2)),
                                    sorted(stepup_selection(Z, BH_cutoffs)[1]))
 
+@set_seed_iftrue(SET_SEED)
+def test_stepup_selection():
+
+    # reference: compare each sorted |Z| to its cutoff
+
+    for p in [1, 5, 50, 500]:
+        Z = np.random.standard_normal(p) * 2
+        stepup_Z = np.sort(np.fabs(np.random.standard_normal(p)) * 2)[::-1]
+
+        order = np.argsort(-np.fabs(Z))
+        survivors = np.nonzero(np.fabs(Z)[order] >= stepup_Z)[0]
+
+        K, selected_idx, last_cutoff = stepup_selection(Z, stepup_Z)
+        if survivors.shape[0] > 0:
+            nt.assert_equal(K, survivors.max() + 1)
+            np.testing.assert_equal(selected_idx, order[:K])
+            nt.assert_equal(last_cutoff, stepup_Z[K - 1])
+        else:
+            nt.assert_equal(K, 0)
+
+@set_seed_iftrue(SET_SEED)
+def test_BH_diagonal(p=300, s=30, sigma=2.):
+
+    # a vector of variances gives the same
+    # selection and MLE as the dense covariance
+
+    Z = np.random.standard_normal(p) * sigma
+    Z[:s] += 4 * sigma
+    perturb = np.random.standard_normal(p) * sigma
+
+    results = []
+    for covariance in [sigma**2 * np.identity(p),
+                       sigma**2 * np.ones(p)]:
+        BH_select = stepup.BH(Z,
+                              covariance,
+                              sigma,
+                              q=0.1)
+        BH_select.useC = False
+        nonzero = BH_select.fit(perturb=perturb)
+        targets = BH_select.full_targets(nonzero, dispersion=sigma**2)
+        if covariance.ndim == 1:
+            nt.assert_true(sparse.issparse(targets[2]))
+        results.append((nonzero,
+                        BH_select.selective_MLE(*targets[:3])[0]))
+
+    np.testing.assert_equal(results[0][0], results[1][0])
+    for col in ['MLE', 'SE', 'pvalue']:
+        np.testing.assert_allclose(results[0][1][col], 
+                                   results[1][1][col],
+                                   rtol=1.e-6,
+                                   atol=1.e-10)
+
 @np.testing.dec.skipif(True, "independent estimator test not working")
 def test_independent_estimator(n=100, n1=50, q=0.2, signal=3, p=100):
 
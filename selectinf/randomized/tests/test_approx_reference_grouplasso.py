@@ -1,7 +1,16 @@
+from collections import OrderedDict
+
 import numpy as np
+from scipy.linalg import block_diag
 
 from ...tests.instance import gaussian_group_instance
-from ..approx_reference_grouplasso import group_lasso, approximate_grid_inference
+from ...tests.flags import SET_SEED
+from ...tests.decorators import set_seed_iftrue
+from ..approx_reference_grouplasso import (group_lasso, 
+                                           approximate_grid_inference,
+                                           calc_GammaMinus,
+                                           jacobian_grad_hess,
+                                           log_jacobian)
 
 def test_approx_pivot(n=500,
                       p=200,
@@ -61,6 +70,37 @@ def test_approx_pivot(n=500,
 
             return pivot
 
+@set_seed_iftrue(SET_SEED)
+def test_jacobian(sizes=[3, 1, 4, 2, 5]):
+
+    active_dirs = OrderedDict()
+    for g, size in enumerate(sizes):
+        u = np.random.standard_normal(size)
+        active_dirs[g] = u / np.linalg.norm(u)
+
+    m = sum([size - 1 for size in sizes])
+    W = np.random.standard_normal((m, m))
+    C = W.dot(W.T) / m + np.identity(m)
+    gamma = np.random.exponential(size=len(sizes)) + 0.5
+
+    # block diagonal versions of Gamma^minus and the summing matrix
+
+    GammaMinus = block_diag(*[np.identity(size - 1) * g for g, size in zip(gamma, sizes)])
+    S = block_diag(*[np.ones((1, size - 1)) for size in sizes])
+    GpC_inv = np.linalg.inv(GammaMinus + C)
+
+    np.testing.assert_allclose(calc_GammaMinus(gamma, active_dirs), GammaMinus)
+
+    J, grad_J, hess_J = jacobian_grad_hess(gamma, C, active_dirs)
+    np.testing.assert_allclose(J, np.log(np.linalg.det(GammaMinus + C)))
+    np.testing.assert_allclose(grad_J, S.dot(GpC_inv.diagonal()))
+    np.testing.assert_allclose(hess_J, -S.dot((GpC_inv * GpC_inv.T).dot(S.T)))
+
+    gammas = np.random.exponential(size=(6, len(sizes))) + 0.5
+    np.testing.assert_allclose(log_jacobian(gammas, C, active_dirs),
+                               [jacobian_grad_hess(g, C, active_dirs)[0] for g in gammas])
+    np.testing.assert_allclose(log_jacobian(gammas, C, active_dirs, chunksize=4),
+                               log_jacobian(gammas, C, active_dirs))
 
 def main(nsim=300, CI = False):
 
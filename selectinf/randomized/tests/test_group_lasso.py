@@ -10,6 +10,7 @@ from ..group_lasso import (group_lasso,
                            full_targets, 
                            debiased_targets)
 from ...tests.instance import gaussian_instance
+from ...base import group_index
 from ...tests.flags import SET_SEED
 from ...tests.decorators import set_sampling_params_iftrue, set_seed_iftrue
 from ...algorithms.sqrt_lasso import choose_lambda, solve_sqrt_lasso
@@ -279,6 +280,27 @@ def test_all_targets(n=100, p=20, signal_fac=1.5, s=5, sigma=3, rho=0.4):
                          rho=rho, 
                          target=target)
 
+@set_seed_iftrue(SET_SEED)
+def test_group_index(p=60):
+
+    groups = np.random.choice([3, 7, 0, 12, 5], p)
+    index = group_index(groups)
+    x = np.random.standard_normal(p)
+
+    nt.assert_equal(list(index.labels), sorted(np.unique(groups)))
+    np.testing.assert_equal(index.offsets[-1], p)
+    for k, g in enumerate(index.labels):
+        np.testing.assert_equal(index.indices(g), np.nonzero(groups == g)[0])
+        np.testing.assert_allclose(index.norms(x)[k], np.linalg.norm(x[groups == g]))
+        nt.assert_equal(index.position(g), k)
+
+    labels = [7, 0]
+    np.testing.assert_equal(index.features(labels),
+                            np.hstack([np.nonzero(groups == g)[0] for g in labels]))
+
+    penalty = rr.group_lasso(groups, weights=dict([(g, 1.) for g in np.unique(groups)]), lagrange=1.)
+    nt.assert_true(group_index.from_penalty(penalty) is group_index.from_penalty(penalty))
+
 def main(nsim=500, n=200, p=50, target='full', sigma=3):
 
     import matplotlib.pyplot as plt
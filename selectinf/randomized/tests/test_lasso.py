@@ -1,11 +1,19 @@
 from __future__ import division, print_function
+import os, shutil, tempfile
 
 import numpy as np
+from scipy import sparse
+import nose.tools as nt
 
 import regreg.api as rr
 
-from ..lasso import lasso, selected_targets, full_targets, debiased_targets
+from ..lasso import (lasso, 
+                     selected_targets, 
+                     full_targets, 
+                     debiased_targets,
+                     batch_lasso)
 from ...tests.instance import gaussian_instance
+from ...base import blocked_design, data_context
 from ...tests.flags import SET_SEED
 from ...tests.decorators import set_seed_iftrue
 from ...algorithms.sqrt_lasso import choose_lambda, solve_sqrt_lasso
@@ -355,6 +363,188 @@ def test_compareR(n=200,
     assert np.linalg.norm(conv.sampler.affine_con.mean - cond_mean[:,0]) / np.linalg.norm(cond_mean[:,0]) < 1.e-3
 
 
+@set_seed_iftrue(SET_SEED)
+def test_sparse_design(n=200, p=50, density=0.1):
+    """
+    A `scipy.sparse` design gives the same query and
+    targets as its dense version
+    """
+
+    X_sparse = sparse.random(n, p, density=density, format='csr',
+                             data_rvs=np.random.standard_normal)
+    X = X_sparse.toarray()
+    beta = np.zeros(p)
+    beta[:3] = 5
+    Y = X.dot(beta) + np.random.standard_normal(n)
+
+    W = np.ones(p) * 2 * np.std(Y)
+    W[0] = 0
+    perturb = np.random.standard_normal(p) * np.std(Y)
+
+    conv = lasso.gaussian(X, Y, W, randomizer_scale=np.std(Y))
+    conv_sparse = lasso.gaussian(X_sparse, Y, W, randomizer_scale=np.std(Y))
+
+    signs = conv.fit(perturb=perturb)
+    np.testing.assert_equal(conv_sparse.fit(perturb=perturb), signs)
+    np.testing.assert_allclose(conv_sparse.opt_linear, conv.opt_linear)
+    np.testing.assert_allclose(conv_sparse.observed_score_state, 
+                               conv.observed_score_state)
+
+    nonzero = signs != 0
+    for form_target in [selected_targets, full_targets]:
+        targets = form_target(conv.loglike, conv._W, nonzero)
+        targets_sparse = form_target(conv_sparse.loglike, conv_sparse._W, nonzero)
+        for val, val_sparse in zip(targets[:3], targets_sparse[:3]):
+            np.testing.assert_allclose(val_sparse, val, rtol=1.e-6, atol=1.e-8)
+
+@set_seed_iftrue(SET_SEED)
+def test_blocked_design(n=500, p=30, chunksize=77):
+    """
+    A memory-mapped design read in blocks of rows gives 
+    the same query and targets as the in-memory design
+    """
+
+    X, Y, beta = gaussian_instance(n=n, p=p, s=3, signal=5)[:3]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, 'X.npy')
+        np.save(filename, X)
+
+        W = np.ones(p) * 2 * np.std(Y)
+        perturb = np.random.standard_normal(p) * np.std(Y)
+        conv = lasso.gaussian(X, Y, W, randomizer_scale=np.std(Y))
+        signs = conv.fit(perturb=perturb)
+        nonzero = signs != 0
+        targets = selected_targets(conv.loglike, conv._W, nonzero)
+
+        for nthreads in [1, 2]:
+            X_blocked = blocked_design.from_npy(filename, 
+                                                chunksize=chunksize,
+                                                nthreads=nthreads)
+            np.testing.assert_allclose(X_blocked.T.dot(Y), X.T.dot(Y))
+
+            conv_blocked = lasso.gaussian(X_blocked, Y, W, randomizer_scale=np.std(Y))
+            np.testing.assert_equal(conv_blocked.fit(perturb=perturb), signs)
+            np.testing.assert_allclose(conv_blocked.opt_linear, conv.opt_linear)
+
+            targets_blocked = selected_targets(conv_blocked.loglike, 
+                                               conv_blocked._W, 
+                                               nonzero)
+            for val, val_blocked in zip(targets[:3], targets_blocked[:3]):
+                np.testing.assert_allclose(val_blocked, val, rtol=1.e-6, atol=1.e-8)
+    finally:
+        shutil.rmtree(tmpdir)
+
+@set_seed_iftrue(SET_SEED)
+def test_data_context(n=200, p=30):
+    """
+    Targets formed with the context of a query
+    agree with those formed from scratch
+    """
+
+    X, Y, beta = gaussian_instance(n=n, p=p, s=3, signal=5)[:3]
+    W = np.ones(p) * 2 * np.std(Y)
+
+    context = data_context(X)
+    conv = lasso(rr.glm.gaussian(X, Y), W, 0, 
+                 randomization.isotropic_gaussian((p,), np.std(Y)),
+                 context=context)
+    signs = conv.fit()
+    nonzero = signs != 0
+    nt.assert_true(conv.context is context and context.nbytes > 0)
+
+    for form_target in [selected_targets, full_targets]:
+        targets = form_target(conv.loglike, conv._W, nonzero)
+        targets_context = form_target(conv.loglike, conv._W, nonzero, context=context)
+        for val, val_context in zip(targets[:3], targets_context[:3]):
+            np.testing.assert_allclose(val_context, val, rtol=1.e-6, atol=1.e-8)
+
+    nt.assert_raises(ValueError, selected_targets, rr.glm.gaussian(X.copy(), Y), 
+                     conv._W, nonzero, context=context)
+
+@set_seed_iftrue(SET_SEED)
+def test_full_estimator(n=200, p=30):
+    """
+    The full targets use a Newton step with the cached
+    Cholesky factor instead of solving the unpenalized problem
+    """
+
+    X, Y, beta = gaussian_instance(n=n, p=p, s=3, signal=5)[:3]
+    W = np.ones(p) * 2 * np.std(Y)
+
+    conv = lasso.gaussian(X, Y, W)
+    signs = conv.fit()
+    nonzero = signs != 0
+
+    context = data_context(X)
+    observed_target = full_targets(conv.loglike, conv._W, nonzero, context=context)[0]
+    full_estimator = conv.loglike.solve(tol=1.e-14, min_its=200)
+    np.testing.assert_allclose(observed_target, full_estimator[nonzero], rtol=1.e-6, atol=1.e-8)
+
+@set_seed_iftrue(SET_SEED)
+def test_batch_lasso(n=200, p=20, m=4):
+    """
+    Batched fits over the columns of Y agree with 
+    separate fits of each response
+    """
+
+    X, Y, beta = gaussian_instance(n=n, p=p, s=3, signal=5)[:3]
+    Y = np.array([X.dot(beta) + np.random.standard_normal(n) for _ in range(m)]).T
+    W = np.ones(p) * 2
+    perturb = np.random.standard_normal((p, m))
+
+    result = batch_lasso(X, Y, W, perturb=perturb)
+    nt.assert_equal(list(result.columns[:2]), ['response', 'variable'])
+    result_pool = batch_lasso(X, Y, W, perturb=perturb, ncpu=2)
+    np.testing.assert_allclose(result_pool['MLE'], result['MLE'])
+
+    for j in range(m):
+        conv = lasso.gaussian(X, Y[:, j], W)
+        signs = conv.fit(perturb=perturb[:, j])
+        nonzero = signs != 0
+        (observed_target,
+         cov_target,
+         cov_target_score,
+         alternatives) = selected_targets(conv.loglike, conv._W, nonzero)
+        MLE = conv.selective_MLE(observed_target, cov_target, cov_target_score)[0]
+
+        result_j = result[result['response'] == j]
+        np.testing.assert_equal(np.asarray(result_j['variable']), np.nonzero(nonzero)[0])
+        np.testing.assert_allclose(np.asarray(result_j['MLE']), MLE['MLE'], rtol=1.e-5)
+        np.testing.assert_allclose(np.asarray(result_j['SE']), MLE['SE'], rtol=1.e-5)
+
+def test_lasso_ensemble(n=200, p=20, ndraw=4):
+    """
+    Ensemble of randomizations agrees with 
+    separate fits for each perturbation
+    """
+
+    X, Y, beta = gaussian_instance(n=n, p=p, s=3, signal=5)[:3]
+    W = np.ones(p) * 2
+    conv = lasso.gaussian(X, Y, W)
+    perturb = [conv.randomizer.sample() for _ in range(ndraw)]
+
+    result = conv.ensemble(ndraw, 'selected', perturbations=perturb)
+    nt.assert_equal(list(result.columns[:2]), ['draw', 'variable'])
+    nt.assert_true(conv.context.nbytes > 0)
+    result_pool = conv.ensemble(ndraw, 'selected', perturbations=perturb, ncpu=2)
+    np.testing.assert_allclose(result_pool['MLE'], result['MLE'])
+
+    for r in range(ndraw):
+        conv_r = lasso.gaussian(X, Y, W)
+        signs = conv_r.fit(perturb=perturb[r])
+        nonzero = signs != 0
+        (observed_target,
+         cov_target,
+         cov_target_score,
+         alternatives) = selected_targets(conv_r.loglike, conv_r._W, nonzero)
+        MLE = conv_r.selective_MLE(observed_target, cov_target, cov_target_score)[0]
+
+        result_r = result[result['draw'] == r]
+        np.testing.assert_equal(np.asarray(result_r['variable']), np.nonzero(nonzero)[0])
+        np.testing.assert_allclose(np.asarray(result_r['MLE']), MLE['MLE'], rtol=1.e-5)
+
 def main(nsim=500, n=500, p=200, sqrt=False, target='full', sigma=3, AR=True):
 
     import matplotlib.pyplot as plt
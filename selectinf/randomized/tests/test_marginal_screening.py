@@ -1,8 +1,10 @@
 import numpy as np
+from scipy import sparse
 
 from ...tests.instance import gaussian_instance
 from ..screening import marginal_screening
 from ..lasso import lasso
+from ..query import selective_MLE
 
 def test_marginal(n=500, 
                   p=50, 
@@ -163,6 +165,119 @@ def test_both():
     test_marginal(marginal=True)
     test_marginal(marginal=False)
 
+def test_structured_MLE(p=200, s=10, signal=3):
+
+    Z = np.random.standard_normal(p)
+    Z[:s] += signal
+    marginal_select = marginal_screening.type1(Z,
+                                               np.identity(p),
+                                               0.1,
+                                               1.)
+    marginal_select.useC = False
+
+    nonzero = marginal_select.fit()
+    if nonzero.sum() > 0:
+
+        # logdens_linear has one nonzero per row
+
+        sampler = marginal_select.sampler
+        logdens_linear = sampler.logdens_transform[0]
+        assert(sparse.issparse(logdens_linear))
+        assert(logdens_linear.nnz == nonzero.sum())
+
+        (observed_target, 
+         cov_target, 
+         crosscov_target_score, 
+         alternatives) = marginal_select.marginal_targets(nonzero)
+
+        result = marginal_select.selective_MLE(observed_target,
+                                               cov_target,
+                                               crosscov_target_score)[0]
+
+        # compare to the dense path
+
+        dense_result = selective_MLE(observed_target,
+                                     cov_target,
+                                     crosscov_target_score,
+                                     marginal_select.observed_opt_state,
+                                     sampler.mean,
+                                     sampler.covariance,
+                                     logdens_linear.toarray(),
+                                     sampler.affine_con.linear_part,
+                                     sampler.affine_con.offset,
+                                     sampler.randomizer_prec,
+                                     sampler.observed_score_state + sampler.logdens_transform[1],
+                                     useC=False)[0]
+
+        for col in ['MLE', 'SE', 'pvalue']:
+            np.testing.assert_allclose(result[col], dense_result[col], rtol=1.e-5, atol=1.e-8)
+
+def test_summary_identity(p=50, s=5, signal=4, ndraw=2000, burnin=500):
+
+    # a dense identity covariance gives dense targets, so
+    # summary works as for any other covariance
+
+    Z = np.random.standard_normal(p)
+    Z[:s] += signal
+    marginal_select = marginal_screening.type1(Z,
+                                               np.identity(p),
+                                               0.1,
+                                               1.)
+
+    nonzero = marginal_select.fit() != 0
+    if nonzero.sum() > 0:
+        for targets in [marginal_select.marginal_targets(nonzero),
+                        marginal_select.multivariate_targets(nonzero),
+                        marginal_select.full_targets(nonzero)]:
+            (observed_target, 
+             cov_target, 
+             crosscov_target_score, 
+             alternatives) = targets
+            assert(not sparse.issparse(crosscov_target_score))
+
+            result = marginal_select.summary(observed_target, 
+                                             cov_target, 
+                                             crosscov_target_score, 
+                                             alternatives,
+                                             ndraw=ndraw,
+                                             burnin=burnin,
+                                             compute_intervals=True)
+            pvalue = np.asarray(result['pvalue'], float)
+            intervals = np.asarray(result[['lower_confidence', 'upper_confidence']], float)
+            assert(np.all((pvalue >= 0) & (pvalue <= 1)))
+            assert(np.all(intervals[:, 0] <= intervals[:, 1]))
+
+def test_ensemble(p=100, s=10, signal=4, ndraw=5):
+
+    Z = np.random.standard_normal(p)
+    Z[:s] += signal
+    marginal_select = marginal_screening.type1(Z,
+                                               np.identity(p),
+                                               0.1,
+                                               1.)
+    marginal_select.useC = False
+    perturb = [marginal_select.randomizer.sample() for _ in range(ndraw)]
+
+    result = marginal_select.ensemble(ndraw, 'marginal', perturbations=perturb)
+    result_pool = marginal_select.ensemble(ndraw, 'marginal', perturbations=perturb, ncpu=2)
+    np.testing.assert_allclose(result_pool['MLE'], result['MLE'])
+
+    # each draw agrees with a separate fit
+
+    for r in range(ndraw):
+        select_r = marginal_screening.type1(Z,
+                                            np.identity(p),
+                                            0.1,
+                                            1.)
+        select_r.useC = False
+        nonzero = select_r.fit(perturb=perturb[r])
+        result_r = result[result['draw'] == r]
+        np.testing.assert_equal(np.asarray(result_r['variable']), np.nonzero(nonzero)[0])
+        if nonzero.sum() > 0:
+            targets = select_r.marginal_targets(nonzero)
+            MLE = select_r.selective_MLE(*targets[:3])[0]
+            np.testing.assert_allclose(np.asarray(result_r['MLE']), MLE['MLE'])
+
 def main(nsim=1000, test_fn=test_marginal, use_MLE=False):
 
     import matplotlib.pyplot as plt
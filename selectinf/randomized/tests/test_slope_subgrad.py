@@ -19,3 +19,30 @@ def test_projection():
     print("projection", proj)
 
 
+def test_projection_ordering():
+
+    # the projection is computed in the original coordinates,
+    # so permuting the coordinates permutes the projection
+
+    prox_arg = np.random.normal(0,1,10)
+    weights = np.linspace(3, 5, 10)[::-1]
+    ordering = np.random.choice(10, 10, replace=False)
+    cluster_sizes = [2,3,1,1,3]
+    active_signs = np.random.choice([-1,1], 10)
+
+    for last_value_zero in [True, False]:
+        proj = _projection_onto_selected_subgradients(prox_arg,
+                                                      weights,
+                                                      ordering,
+                                                      cluster_sizes,
+                                                      active_signs,
+                                                      last_value_zero=last_value_zero)
+
+        sorted_proj = _projection_onto_selected_subgradients(prox_arg[ordering],
+                                                             weights,
+                                                             np.arange(10),
+                                                             cluster_sizes,
+                                                             active_signs[ordering],
+                                                             last_value_zero=last_value_zero)
+
+        np.testing.assert_allclose(proj[ordering], sorted_proj)
@@ -1,5 +1,6 @@
 import numpy as np
 import mpmath as mp
+from scipy.stats import f as fdist
 
 from .base import truncated
 
@@ -7,19 +8,16 @@ from .base import truncated
 def sf_F(d1, d2, scale):
 
     def sf(a, b=np.inf, dps=15):
-        dps_temp = mp.mp.dps
-        mp.mp.dps = dps
-
-        tmp_a = d1*a/d2
-        tmp_b = d1*b/d2
-        beta_a = tmp_a / (1. + tmp_a)
-        beta_b = tmp_b / (1. + tmp_b)
-        if b == np.inf:
-            beta_b = 1.
-        sf = mp.betainc(d1/2., d2/2., 
-                        x1=beta_a, x2=beta_b,
-                        regularized=True)
-        mp.mp.dps = dps_temp
+        with mp.mp.workdps(dps):
+            tmp_a = d1*a/d2
+            tmp_b = d1*b/d2
+            beta_a = tmp_a / (1. + tmp_a)
+            beta_b = tmp_b / (1. + tmp_b)
+            if b == np.inf:
+                beta_b = 1.
+            sf = mp.betainc(d1/2., d2/2., 
+                            x1=beta_a, x2=beta_b,
+                            regularized=True)
         return sf
 
     return sf
@@ -34,10 +32,48 @@ class truncated_F(truncated):
         self._d1 = d1
         self._d2 = d2
         self._scale = scale
+        self._F = fdist(d1, d2, scale=scale)
+        self._Fsf = sf_F(d1, d2, scale)
 
-        truncated.__init__(self,
-                           intervals,
-                           null_f,
-                           null_f,
-                           sf_F(d1, d2, scale),
-                           null_f)
+        truncated.__init__(self, intervals)
+
+    def _cdf_notTruncated(self, a, b, dps):
+        """
+        Compute the probability of being in the interval (a, b)
+        for a variable with an F distribution (not truncated)
+        
+        Parameters
+        ----------
+        a, b : float
+            Bounds of the interval. Can be infinite.
+
+        dps : int
+            Decimal precision (decimal places). Used in mpmath
+
+        Returns
+        -------
+        p : float
+            The probability of being in the intervals (a, b)
+            P( a < X < b)
+            for a non truncated variable
+
+        """
+        scale = self._scale
+        a = max(0, a) / scale
+        b = max(0, b) / scale
+        return self._Fsf(a, b, dps=dps)
+
+    def _logcdf_notTruncated(self, z):
+        return self._F.logcdf(z)
+
+    def _logsf_notTruncated(self, z):
+        return self._F.logsf(z)
+
+    def _ppf_notTruncated(self, p):
+        return self._F.ppf(p)
+
+    def _isf_notTruncated(self, p):
+        return self._F.isf(p)
+
+    def _quantile_notTruncated(self, q, tol=1.e-6):
+        return self._F.ppf(q)
@@ -10,48 +10,45 @@ from .F import sf_F
 def sf_T(df):
 
     def sf(a, b=np.inf, dps=15):
-        dps_temp = mp.dps
-        mp.dps = dps
-
-        # case1: sign(a) == sign(b)
+        with mp.workdps(dps):
+            # case1: sign(a) == sign(b)
         
-        d1 = 1.
-        d2 = df
-        scale = 1.
-
-        if a*b >= 0.:
-            a, b = sorted([a**2, b**2])
-            tmp_a = d1*a/d2
-            beta_a = tmp_a / (1. + tmp_a)
-            if b < np.inf:
-                tmp_b = d1*b/d2
-                beta_b = tmp_b / (1. + tmp_b)
-            else:
-                beta_b = 1.
-            sf = mp.betainc(d1/2., d2/2., 
-                            x1=beta_a, x2=beta_b,
-                            regularized=True)
-        # case2: different signs
-
-        else:
-            a, b = [a**2, b**2]
-            if a < np.inf:
+            d1 = 1.
+            d2 = df
+            scale = 1.
+
+            if a*b >= 0.:
+                a, b = sorted([a**2, b**2])
                 tmp_a = d1*a/d2
                 beta_a = tmp_a / (1. + tmp_a)
+                if b < np.inf:
+                    tmp_b = d1*b/d2
+                    beta_b = tmp_b / (1. + tmp_b)
+                else:
+                    beta_b = 1.
+                sf = mp.betainc(d1/2., d2/2., 
+                                x1=beta_a, x2=beta_b,
+                                regularized=True)
+            # case2: different signs
+
             else:
-                beta_a = 1.
-            if b < np.inf:
-                tmp_b = d1*b/d2
-                beta_b = tmp_b / (1. + tmp_b)
-            else:
-                beta_b = 1.
-            sf = (mp.betainc(d1/2., d2/2., 
-                            x1=0, x2=beta_a, 
-                            regularized=True) + 
-                  mp.betainc(d1/2., d2/2., 
-                            x1=0, x2=beta_b, 
-                            regularized=True)) 
-        mp.dps = dps_temp
+                a, b = [a**2, b**2]
+                if a < np.inf:
+                    tmp_a = d1*a/d2
+                    beta_a = tmp_a / (1. + tmp_a)
+                else:
+                    beta_a = 1.
+                if b < np.inf:
+                    tmp_b = d1*b/d2
+                    beta_b = tmp_b / (1. + tmp_b)
+                else:
+                    beta_b = 1.
+                sf = (mp.betainc(d1/2., d2/2., 
+                                x1=0, x2=beta_a, 
+                                regularized=True) + 
+                      mp.betainc(d1/2., d2/2., 
+                                x1=0, x2=beta_b, 
+                                regularized=True)) 
         return sf / 2.
 
     return sf
@@ -91,6 +88,18 @@ class truncated_T(truncated):
 
         return self._Tsf(a, b, dps=self.dps)
 
+    def _logcdf_notTruncated(self, z):
+        return self._T.logcdf(z)
+
+    def _logsf_notTruncated(self, z):
+        return self._T.logsf(z)
+
+    def _ppf_notTruncated(self, p):
+        return self._T.ppf(p)
+
+    def _isf_notTruncated(self, p):
+        return self._T.isf(p)
+
     def _pdf_notTruncated(self, z, dps):
         """
         Compute the density for the non truncated T distribution
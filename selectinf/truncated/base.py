@@ -6,12 +6,20 @@ restricted to a set of intervals.
 """
 import numpy as np
 from scipy.stats import chi
+from scipy.special import logsumexp
 from mpmath import fsum
 
 import warnings
 
 from abc import ABCMeta, abstractmethod
 
+from ..distributions.pvalue import FLOAT_RTOL, _log1mexp
+
+# Assumed relative accuracy of the log distribution
+# and survival functions of the subclasses.
+
+_LOG_ACCURACY = 16 * np.finfo(np.float64).eps
+_TINY = np.finfo(np.float64).tiny
 
 class truncated(object):
     """
@@ -42,6 +50,17 @@ class truncated(object):
         -> plt_cdf
         -> plt_pdf (if you also have  _pdf_notTruncated)
 
+    You can implement, for a double precision engine : 
+
+    _logcdf_notTruncated(self, z), _logsf_notTruncated(self, z) :
+        vectorized log distribution and survival functions.
+        cdf and sf are then computed in log space over arrays of z,
+        and mpmath is used only for entries flagged as imprecise.
+
+    _ppf_notTruncated(self, p), _isf_notTruncated(self, p) :
+        vectorized quantile and inverse survival functions,
+        used by quantile and rvs in the same way.
+
     """
 
     __metaclass__ = ABCMeta
@@ -60,6 +79,29 @@ class truncated(object):
 
         """
         self.intervals = intervals
+        self._cutoffs = np.array([(a, b) for a, b in intervals],
+                                 np.float64).reshape((-1, 2))
+
+        # double precision engine: log masses of the intervals
+
+        self._logQ = None
+        if self._has_float_engine():
+            logQ, precise = self._log_mass(self._cutoffs[:,0],
+                                           self._cutoffs[:,1])
+            with np.errstate(divide='ignore'):
+                logsumQ = logsumexp(logQ)
+            if np.all(precise) and np.isfinite(logsumQ):
+                self._logQ, self._logsumQ = logQ, logsumQ
+                return
+
+        self._setup_mp()
+
+    def _setup_mp(self):
+        """
+        Compute the masses of the intervals with mpmath,
+        doubling the precision until they do not underflow.
+        """
+        intervals = self.intervals
 
         dps = 15
         not_precise = True
@@ -72,7 +114,90 @@ class truncated(object):
         self._dps = dps
         self._Q = Q
 
-               
+    def _has_float_engine(self):
+        return (hasattr(self, '_logcdf_notTruncated') and
+                hasattr(self, '_logsf_notTruncated'))
+
+    def _log_mass(self, a, b):
+        """
+        Vectorized log probability of the intervals (a, b)
+        for the non truncated distribution, computed from
+        whichever of the log distribution or survival functions
+        is smaller on the interval.
+
+        Returns
+        -------
+        logP : np.float
+            Log probabilities.
+
+        precise : np.bool
+            False where the estimated relative error of
+            the probability exceeds `FLOAT_RTOL`.
+        """
+        a, b = np.broadcast_arrays(np.asarray(a, np.float64),
+                                   np.asarray(b, np.float64))
+        with np.errstate(all='ignore'):
+            logcdf_a = np.asarray(self._logcdf_notTruncated(a))
+            logcdf_b = np.asarray(self._logcdf_notTruncated(b))
+            logsf_a = np.asarray(self._logsf_notTruncated(a))
+            logsf_b = np.asarray(self._logsf_notTruncated(b))
+
+            use_sf = logsf_a < logcdf_b
+            log_large = np.where(use_sf, logsf_a, logcdf_b)
+            log_small = np.where(use_sf, logsf_b, logcdf_a)
+            D = log_small - log_large
+            logP = log_large + _log1mexp(D)
+
+            scale = 1 + np.fabs(log_large) + np.where(np.isinf(log_small), 0,
+                                                      np.fabs(log_small))
+            rel_error = _LOG_ACCURACY * scale * np.exp(D) / -np.expm1(D)
+
+        empty = a >= b
+        logP = np.where(empty, -np.inf, logP)
+        precise = empty | ((rel_error <= FLOAT_RTOL) & np.isfinite(logP))
+        return logP, precise
+
+    def _logsf_float(self, z):
+        a, b = self._cutoffs.T
+        lower = np.maximum(a[:,None], z.reshape(-1)[None,:])
+        logP, precise = self._log_mass(lower, b[:,None])
+        with np.errstate(divide='ignore'):
+            logsf = logsumexp(logP, axis=0) - self._logsumQ
+        return logsf.reshape(z.shape), precise.all(0).reshape(z.shape)
+
+    def _logcdf_float(self, z):
+        a, b = self._cutoffs.T
+        upper = np.minimum(b[:,None], z.reshape(-1)[None,:])
+        logP, precise = self._log_mass(a[:,None], upper)
+        with np.errstate(divide='ignore'):
+            logcdf = logsumexp(logP, axis=0) - self._logsumQ
+        return logcdf.reshape(z.shape), precise.all(0).reshape(z.shape)
+
+    def _evaluate(self, float_method, mp_method, z):
+        """
+        Evaluate `float_method` in log space over the array `z`,
+        falling back to the scalar `mp_method` for entries
+        flagged as imprecise.
+        """
+        z = np.asarray(z, np.float64)
+        if self._logQ is None:
+            value = np.zeros(z.shape)
+            precise = np.zeros(z.shape, bool)
+        else:
+            logvalue, precise = float_method(z)
+            value = np.exp(logvalue)
+
+        if not np.all(precise):
+            if not hasattr(self, '_Q'):
+                self._setup_mp()
+            for idx in np.ndindex(z.shape):
+                if not precise[idx]:
+                    value[idx] = float(mp_method(z[idx]))
+
+        if value.shape == ():
+            return float(value)
+        return value
+
     @abstractmethod
     def _cdf_notTruncated(self, a, b, dps=15):
         """
@@ -159,7 +284,7 @@ class truncated(object):
             )
 
         U = np.random.uniform(size=size)
-        X = np.array([self.quantile(u) for u in U])
+        X = np.asarray(self.quantile(U)).reshape(U.shape)
         return X
 
 
@@ -169,22 +294,31 @@ class truncated(object):
 
         Parameters
         ----------
-        z : float
+        z : float or np.float
             Minimum bound of the interval
 
         Returns
         -------
-        sf : float
+        sf : float or np.float
             The survival function of the truncated distribution
             sf(z) = P( X > z | X is in intervals )
         
+        """
+        return self._evaluate(self._logsf_float, self._sf_mp, z)
+
+    def _sf_mp(self, z):
+        """
+        Multiprecision version of `sf` for a scalar `z`.
         """
         intervals = self.intervals
         Q, sumQ = self._Q, self._sumQ
         N = len(Q)
         dps = self._dps
 
-        k, (a, b) = min( (k, (a, b))  for k, (a, b) in enumerate(intervals) if b > z)
+        above = [(k, (a, b)) for k, (a, b) in enumerate(intervals) if b > z]
+        if not above:
+            return 0.
+        k, (a, b) = min(above)
 
         sf = fsum(Q[k+1:]) + self._cdf_notTruncated(max(a, z), b, dps)
         sf /= sumQ
@@ -198,22 +332,24 @@ class truncated(object):
 
         Parameters
         ----------
-        z : float
+        z : float or np.float
             Minimum bound of the interval
 
         Returns
         -------
-        cdf : float
+        cdf : float or np.float
             function  The cumulative distribution function of the 
             truncated distribution
             cdf(z) = P( X < z | X is in intervals )
         
         
-        WARNING : This method only use the sf method : it is never going to be 
-        more precise
+        WARNING : The multiprecision fallback only uses the sf method :
+        it is never going to be more precise
         """
-        cdf = 1. - self.sf(z)
-        return cdf
+        return self._evaluate(self._logcdf_float, self._cdf_mp, z)
+
+    def _cdf_mp(self, z):
+        return 1. - self._sf_mp(z)
 
 
     def pdf(self, z):
@@ -240,17 +376,37 @@ class truncated(object):
             )
        
         intervals = self.intervals
-        dps = self._dps
+        if self._logQ is None:
+            dps, sumQ = self._dps, self._sumQ
+        else:
+            dps, sumQ = 15, np.exp(self._logsumQ)
 
         if intervals(z):
             p = self._pdf_notTruncated(z, dps)
-            p /= self._sumQ
+            p /= sumQ
         else:
             p = 0
 
         return p
 
     def quantile(self, q, tol=1.e-6):
+        """
+        Compute the quantile function of the truncated distribution
+
+        Parameters
+        ----------
+        q : float or np.float
+            Probabilities, between 0 and 1.
+
+        tol : float
+            Precision of the multiprecision fallback.
+
+        Returns
+        -------
+        z : float or np.float
+            z such that P( X < z | X is in intervals ) = q
+
+        """
         if not hasattr(self, '_quantile_notTruncated'):
             raise NotImplementedError( \
                 """The 'quantile_notTruncated' method 
@@ -258,7 +414,62 @@ class truncated(object):
                 quantile method"""
             )
 
+        q = np.asarray(q, np.float64)
+        if (self._logQ is not None and 
+            hasattr(self, '_ppf_notTruncated') and
+            hasattr(self, '_isf_notTruncated')):
+            z, precise = self._quantile_float(q)
+        else:
+            z = np.zeros(q.shape)
+            precise = np.zeros(q.shape, bool)
+
+        # _quantile_float returns numpy scalars for a scalar q
+
+        z = np.array(z, float)
+        precise = np.array(precise, bool)
+        if not np.all(precise):
+            if not hasattr(self, '_Q'):
+                self._setup_mp()
+            for idx in np.ndindex(q.shape):
+                if not precise[idx]:
+                    z[idx] = float(self._quantile_mp(q[idx], tol))
+
+        if z.shape == ():
+            return float(z)
+        return z
 
+    def _quantile_float(self, q):
+        """
+        Vectorized quantile in double precision. Within the interval
+        containing the quantile, the non truncated distribution is
+        inverted from whichever tail is smaller.
+        """
+        a, b = self._cutoffs.T
+        W = np.exp(self._logQ - self._logsumQ)
+        cum_W = np.cumsum(W)
+
+        k = np.minimum(np.searchsorted(cum_W, q, side='right'), W.shape[0] - 1)
+        left, right = cum_W[k] - W[k], cum_W[k]
+
+        with np.errstate(all='ignore'):
+            log_lower = np.logaddexp(self._logcdf_notTruncated(a[k]),
+                                     np.log(q - left) + self._logsumQ)
+            log_upper = np.logaddexp(self._logsf_notTruncated(b[k]),
+                                     np.log(right - q) + self._logsumQ)
+            use_lower = log_lower < log_upper
+            z = np.where(use_lower,
+                         self._ppf_notTruncated(np.exp(log_lower)),
+                         self._isf_notTruncated(np.exp(log_upper)))
+        z = np.clip(z, a[k], b[k])
+
+        log_used = np.where(use_lower, log_lower, log_upper)
+        precise = (np.exp(log_used) >= _TINY) & ~np.isnan(z)
+        return z, precise
+
+    def _quantile_mp(self, q, tol=1.e-6):
+        """
+        Multiprecision version of `quantile` for a scalar `q`.
+        """
         Q = self._Q
         sumQ = self._sumQ
         intervals = self.intervals
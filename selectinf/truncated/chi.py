@@ -41,8 +41,21 @@ class truncated_chi(truncated):
 
         self._k = k
         self._scale = scale
+        self._chi = chi(k, scale=scale)
         truncated.__init__(self, I)
 
+    def _logcdf_notTruncated(self, z):
+        return self._chi.logcdf(z)
+
+    def _logsf_notTruncated(self, z):
+        return self._chi.logsf(z)
+
+    def _ppf_notTruncated(self, p):
+        return self._chi.ppf(p)
+
+    def _isf_notTruncated(self, p):
+        return self._chi.isf(p)
+
     def _cdf_notTruncated(self, a, b, dps):
         """
         Compute the probability of being in the interval (a, b)
@@ -67,17 +80,14 @@ class truncated_chi(truncated):
         scale = self._scale
         k = self._k
 
-        dps_temp = mp.mp.dps
-        mp.mp.dps = dps
-
-        a = max(0, a)
-        b = max(0, b)
+        with mp.mp.workdps(dps):
+            a = max(0, a)
+            b = max(0, b)
 
-        sf = mp.gammainc(1./2 * k, 
-                         1./2*((a/scale)**2), 
-                         1./2*((b/scale)**2), 
-                         regularized=True)
-        mp.mp.dps = dps_temp
+            sf = mp.gammainc(1./2 * k, 
+                             1./2*((a/scale)**2), 
+                             1./2*((b/scale)**2), 
+                             regularized=True)
         return sf
 
     def _pdf_notTruncated(self, z, dps):
@@ -154,8 +164,21 @@ class truncated_chi2(truncated):
 
         self._k = k
         self._scale = scale
+        self._chi2 = chi2(k, scale=scale)
         truncated.__init__(self, I)
 
+    def _logcdf_notTruncated(self, z):
+        return self._chi2.logcdf(z)
+
+    def _logsf_notTruncated(self, z):
+        return self._chi2.logsf(z)
+
+    def _ppf_notTruncated(self, p):
+        return self._chi2.ppf(p)
+
+    def _isf_notTruncated(self, p):
+        return self._chi2.isf(p)
+
     def _cdf_notTruncated(self, a, b, dps):
         """
         Compute the probability of being in the interval (a, b)
@@ -180,17 +203,14 @@ class truncated_chi2(truncated):
         scale = self._scale
         k = self._k
 
-        dps_temp = mp.mp.dps
-        mp.mp.dps = dps
-
-        a = max(0, a)
-        b = max(0, b)
+        with mp.mp.workdps(dps):
+            a = max(0, a)
+            b = max(0, b)
 
-        cdf = mp.gammainc(1./2 * k, 
-                         1./2*(a/scale), 
-                         1./2*(b/scale), 
-                         regularized=True)
-        mp.mp.dps = dps_temp
+            cdf = mp.gammainc(1./2 * k, 
+                             1./2*(a/scale), 
+                             1./2*(b/scale), 
+                             regularized=True)
         return cdf
 
     def _pdf_notTruncated(self, z, dps):
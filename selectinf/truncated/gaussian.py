@@ -4,11 +4,19 @@ performs (conditional) UMPU tests for Gaussians
 restricted to a set of intervals.
 
 """
+from multiprocessing import Pool
+
 import numpy as np
+from scipy.special import log_ndtr, ndtri, ndtri_exp
+
 from ..distributions.pvalue import (norm_pdf, 
                                     truncnorm_cdf, 
+                                    truncnorm_cdf_vec,
+                                    log_norm_interval,
                                     norm_q,
                                     norm_interval,
+                                    norm_interval_mp,
+                                    mp_precision,
                                     mp)
 
 from scipy.stats import norm as ndist
@@ -68,28 +76,34 @@ class truncated_gaussian(truncated):
         """
         scale = self._scale
         mu = self._mu
-        dps_temp = mp.dps
-        mp.dps = dps
-
-        val = norm_interval((a-mu)/scale,
-                            (b-mu)/scale)
-        mp.dps = dps_temp
+        with mp.workdps(dps):
+            val = norm_interval((a-mu)/scale,
+                                (b-mu)/scale)
 
         return val
 
+    def _logcdf_notTruncated(self, z):
+        return log_ndtr((z - self._mu) / self._scale)
+
+    def _logsf_notTruncated(self, z):
+        return log_ndtr((self._mu - z) / self._scale)
+
+    def _ppf_notTruncated(self, p):
+        return self._mu + self._scale * ndtri(p)
+
+    def _isf_notTruncated(self, p):
+        return self._mu - self._scale * ndtri(p)
+
     def _pdf_notTruncated(self, z, dps):
 
         scale = self._scale
         mu = self._mu
-        dps_temp = mp.dps
-        mp.dps = dps
-
-        val = norm_pdf(Z)
-        mp.dps = dps_temp
+        with mp.workdps(dps):
+            val = norm_pdf((z-mu)/scale) / scale
 
         return val
 
-    def _quantile_notTruncated(self, q, dps, tol=1.e-6):
+    def _quantile_notTruncated(self, q, tol=1.e-6):
         """
         Compute the quantile for the non truncated distribution
 
@@ -110,11 +124,8 @@ class truncated_gaussian(truncated):
 
         scale = self._scale
         mu = self._mu
-        dps_temp = mp.dps
-        mp.dps = dps
-
-        val = norm_q(q)
-        mp.dps = dps_temp
+        with mp.workdps(self._dps):
+            val = mu + scale * norm_q(q)
 
         return val
 
@@ -158,8 +169,11 @@ class truncated_gaussian_old(object):
 
     def _mu_or_scale_changed(self):
         
+        # `G` below differences first moments over
+        # nested intervals, so P is kept in multiprecision
+
         mu, scale = self.mu, self.scale
-        self.P = np.array([norm_interval((a-mu)/scale,
+        self.P = np.array([norm_interval_mp((a-mu)/scale,
                                          (b-mu)/scale) 
                            for a, b in self.intervals])
         self.D = np.array([(norm_pdf((a-mu)/scale), 
@@ -218,37 +232,39 @@ class truncated_gaussian_old(object):
                                                       self.scale)
     
     def cdf(self, observed):
-        P, mu, scale = self.P, self.mu, self.scale
-        z = observed
-        k = int(np.floor((self.intervals <= observed).sum() / 2))
-        if k < self.intervals.shape[0]:
-            if observed > self.intervals[k,0]:
-                return (P[:k].sum() + 
-                        (norm_interval((self.intervals[k,0] - mu) / scale,
-                                       (observed - mu) / scale))
-                        ) / P.sum()
+        with mp_precision():
+            P, mu, scale = self.P, self.mu, self.scale
+            z = observed
+            k = int(np.floor((self.intervals <= observed).sum() / 2))
+            if k < self.intervals.shape[0]:
+                if observed > self.intervals[k,0]:
+                    return (P[:k].sum() + 
+                            (norm_interval((self.intervals[k,0] - mu) / scale,
+                                           (observed - mu) / scale))
+                            ) / P.sum()
+                else:
+                    return P[:k].sum() / P.sum()
             else:
-                return P[:k].sum() / P.sum()
-        else:
-            return 1.
+                return 1.
 
     def quantile(self, q):
-        P, mu, scale = self.P, self.mu, self.scale
-        Psum = P.sum()
-        Csum = np.cumsum(np.array([0]+list(P)))
-        k = max(np.nonzero(Csum < Psum*q)[0])
-
-        try:
+        with mp_precision():
+            P, mu, scale = self.P, self.mu, self.scale
+            Psum = P.sum()
+            Csum = np.cumsum(np.array([0]+list(P)))
             k = max(np.nonzero(Csum < Psum*q)[0])
-        except ValueError:
-            if np.isnan(q):
-                raise TruncatedGaussianError('invalid quantile')
 
-        pnorm_increment = Psum*q - Csum[k]
-        if np.mean(self.intervals[k]) < 0:
-            return mu + norm_q(norm_interval(-np.inf,(self.intervals[k,0]-mu)/scale) + pnorm_increment) * scale
-        else:
-            return mu - norm_q(norm_interval((self.intervals[k,0]-mu)/scale, np.inf) - pnorm_increment) * scale
+            try:
+                k = max(np.nonzero(Csum < Psum*q)[0])
+            except ValueError:
+                if np.isnan(q):
+                    raise TruncatedGaussianError('invalid quantile')
+
+            pnorm_increment = Psum*q - Csum[k]
+            if np.mean(self.intervals[k]) < 0:
+                return mu + norm_q(norm_interval(-np.inf,(self.intervals[k,0]-mu)/scale) + pnorm_increment) * scale
+            else:
+                return mu - norm_q(norm_interval((self.intervals[k,0]-mu)/scale, np.inf) - pnorm_increment) * scale
         
     # make a function for vector version?
     def right_endpoint(self, left_endpoint, alpha):
@@ -264,23 +280,24 @@ class truncated_gaussian_old(object):
         """
         $g_{\mu}$ from Will's code
         """
-        klass = self.__class__
-        c1 = left_endpoint # shorthand from Will's code
-        mu, P, D = self.mu, self.P, self.D
-
-        const = np.array(1-alpha)*(np.sum(D[:,0]-D[:,1]) + mu*P.sum())
-        right_endpoint = float(self.right_endpoint(left_endpoint, alpha))
-        if np.isnan(right_endpoint):
-            return np.inf
-        valid_intervals = []
-        for a, b in self.intervals:
-            intersection = (max(left_endpoint, a),
-                            min(right_endpoint, b))
-            if intersection[1] > intersection[0]:
-                valid_intervals.append(intersection)
-        if valid_intervals:
-            return klass(valid_intervals, mu=self.mu, scale=self.scale).delta.sum() - const
-        return 0
+        with mp_precision():
+            klass = self.__class__
+            c1 = left_endpoint # shorthand from Will's code
+            mu, P, D = self.mu, self.P, self.D
+
+            const = np.array(1-alpha)*(np.sum(D[:,0]-D[:,1]) + mu*P.sum())
+            right_endpoint = float(self.right_endpoint(left_endpoint, alpha))
+            if np.isnan(right_endpoint):
+                return np.inf
+            valid_intervals = []
+            for a, b in self.intervals:
+                intersection = (max(left_endpoint, a),
+                                min(right_endpoint, b))
+                if intersection[1] > intersection[0]:
+                    valid_intervals.append(intersection)
+            if valid_intervals:
+                return klass(valid_intervals, mu=self.mu, scale=self.scale).delta.sum() - const
+            return 0
 
     def dG(self, left_endpoint, alpha):
         """
@@ -435,3 +452,261 @@ def find_root(f, y, lb, ub, tol=1e-6):
         elif fc < y: b = c
     
     return c
+
+# Batched interval solvers for Gaussians truncated to a single
+# interval [L,U], vectorized over arrays of (L, Z, U, S).
+# All computations are done in standardized units $\theta = \mu / S$.
+
+def equal_tailed_intervals(L, Z, U, S, alpha=0.05,
+                           tol=1.e-8,
+                           max_iter=100):
+    r"""
+    Equal-tailed selection intervals for $\mu_j$ based on
+    observations $Z_j \sim N(\mu_j, S_j^2)$ truncated to $[L_j,U_j]$.
+
+    The lower (upper) endpoint solves
+    $F_{\mu}(Z_j) = 1 - \alpha/2$ ($F_{\mu}(Z_j) = \alpha/2$)
+    where $F_{\mu}$ is the truncated Gaussian distribution function.
+    All endpoints are found simultaneously by a bracketed
+    Illinois iteration.
+
+    Parameters
+    ----------
+
+    L, Z, U, S : np.float(k)
+        Lower truncation limits, observed values, upper
+        truncation limits and standard deviations,
+        as returned by `constraints.bounds_matrix`.
+
+    alpha : float
+        1 minus the confidence level.
+
+    tol : float
+        Tolerance for the endpoints, in units of $S_j$.
+
+    max_iter : int
+        Maximum number of Illinois iterations.
+
+    Returns
+    -------
+
+    intervals : np.float((k,2))
+        Lower and upper endpoints.
+
+    """
+    a, x, b, S = _standardize(L, Z, U, S)
+
+    def F(target):
+        def _F(theta, idx):
+            return truncnorm_cdf_vec(x[idx] - theta,
+                                     a[idx] - theta,
+                                     b[idx] - theta) - target
+        return _F
+
+    lower = _solve_decreasing(F(1 - 0.5 * alpha), x - 2, x + 2, tol, max_iter)
+    upper = _solve_decreasing(F(0.5 * alpha), x - 2, x + 2, tol, max_iter)
+    return np.array([lower, upper]).T * S[:,None]
+
+def UMAU_intervals(L, Z, U, S, alpha=0.05,
+                   tol=1.e-8,
+                   max_iter=100,
+                   ncpu=1):
+    r"""
+    UMAU selection intervals for $\mu_j$ based on
+    observations $Z_j \sim N(\mu_j, S_j^2)$ truncated to $[L_j,U_j]$.
+
+    The upper endpoint is the root in $\mu$ of the function
+    $G$ of `truncated_gaussian_old`, the lower endpoint is
+    found by negation. In standardized units
+    $G$ is proportional to
+
+    .. math::
+
+        \frac{\phi(Z-\mu) - \phi(c_2-\mu)}{\Phi(U-\mu) - \Phi(L-\mu)}
+        - (1 - \alpha)\frac{\phi(L-\mu) - \phi(U-\mu)}{\Phi(U-\mu) - \Phi(L-\mu)}
+
+    where $c_2$ is the right endpoint of the acceptance region,
+    so it can be evaluated in log space in double precision.
+    All endpoints are found simultaneously by a bracketed
+    Illinois iteration.
+
+    Parameters
+    ----------
+
+    L, Z, U, S : np.float(k)
+        Lower truncation limits, observed values, upper
+        truncation limits and standard deviations,
+        as returned by `constraints.bounds_matrix`.
+
+    alpha : float
+        1 minus the confidence level.
+
+    tol : float
+        Tolerance for the endpoints, in units of $S_j$.
+
+    max_iter : int
+        Maximum number of Illinois iterations.
+
+    ncpu : int
+        If larger than 1, the intervals are split into
+        `ncpu` chunks solved in a `multiprocessing.Pool`.
+
+    Returns
+    -------
+
+    intervals : np.float((k,2))
+        Lower and upper endpoints.
+
+    """
+    a, x, b, S = _standardize(L, Z, U, S)
+
+    if ncpu > 1 and a.shape[0] > 1:
+        chunks = [(a_, x_, b_, S_, alpha, tol, max_iter) for a_, x_, b_, S_ in
+                  zip(*[np.array_split(v, min(ncpu, a.shape[0])) for v in [a, x, b, S]])]
+        pool = Pool(ncpu)
+        try:
+            return np.vstack(pool.map(_UMAU_chunk, chunks))
+        finally:
+            pool.close()
+            pool.join()
+
+    upper = _UMAU_upper(a, x, b, alpha, tol, max_iter)
+    lower = -_UMAU_upper(-b, -x, -a, alpha, tol, max_iter)
+    return np.array([lower, upper]).T * S[:,None]
+
+def _UMAU_chunk(args):
+    a, x, b, S, alpha, tol, max_iter = args
+    return UMAU_intervals(a * S, x * S, b * S, S, alpha=alpha,
+                          tol=tol, max_iter=max_iter)
+
+def _standardize(L, Z, U, S):
+    L, Z, U, S = [np.asarray(v, np.float64).reshape(-1) for v in
+                  np.broadcast_arrays(L, Z, U, S)]
+    return L / S, Z / S, U / S, S
+
+def _UMAU_upper(a, x, b, alpha, tol, max_iter):
+
+    def G(theta, idx):
+        return _G_standardized(a[idx] - theta,
+                               x[idx] - theta,
+                               b[idx] - theta,
+                               alpha)
+
+    return _solve_decreasing(G, x, x + 2, tol, max_iter)
+
+def _G_standardized(a, x, b, alpha):
+    """
+    $G$ function of `truncated_gaussian_old`
+    for $N(0,1)$ truncated to $[a,b]$ with observation $x$,
+    normalized by the mass of $[a,b]$.
+    """
+    logM = log_norm_interval(a, b)[0]
+    alpha1 = truncnorm_cdf_vec(x, a, b)
+    c2 = _truncnorm_quantile(np.minimum(alpha1 + 1 - alpha, 1), a, b, logM)
+
+    def ratio(z):
+        logphi = np.where(np.isinf(z), -np.inf, -0.5 * z**2)
+        return np.exp(logphi - 0.5 * np.log(2 * np.pi) - logM)
+
+    # far from the root, the terms can overflow
+
+    with np.errstate(invalid='ignore', over='ignore'):
+        G = (ratio(x) - ratio(c2)) - (1 - alpha) * (ratio(a) - ratio(b))
+    return np.where(alpha1 > alpha, np.inf, G)
+
+def _truncnorm_quantile(p, a, b, logM):
+    """
+    Quantile of $N(0,1)$ truncated to $[a,b]$, where `logM`
+    is the log of the mass of $[a,b]$. The quantile is computed
+    from whichever tail of $N(0,1)$ is smaller at the answer.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_lower = np.logaddexp(log_ndtr(a), np.log(p) + logM)
+        log_upper = np.logaddexp(log_ndtr(-b), np.log1p(-p) + logM)
+    q = np.where(log_lower < np.log(0.5),
+                 ndtri_exp(np.minimum(log_lower, 0)),
+                 -ndtri_exp(np.minimum(log_upper, 0)))
+    return np.clip(q, a, b)
+
+def _solve_decreasing(f, lo, hi, tol, max_iter, max_expand=60):
+    r"""
+    Solve $f(\theta_j)=0$ for a batch of decreasing functions
+    by a bracketed Illinois (modified regula falsi) iteration.
+
+    `f(theta, idx)` evaluates the functions with indices
+    `idx` at `theta`. The initial brackets `[lo, hi]`
+    are expanded until they contain the roots; where
+    this fails, the root is taken to be $\pm \infty$.
+    """
+    lo, hi = np.array(lo, np.float64), np.array(hi, np.float64)
+    all_idx = np.arange(lo.shape[0])
+    f_lo, f_hi = f(lo, all_idx), f(hi, all_idx)
+    root = np.full(lo.shape, np.nan)
+    initial_nan = np.isnan(f_lo) | np.isnan(f_hi)
+
+    # expand brackets
+
+    step = hi - lo
+    for _ in range(max_expand):
+        low = f_lo < 0
+        high = f_hi > 0
+        if not (low.any() or high.any()):
+            break
+        idx = np.nonzero(low)[0]
+        hi[idx], f_hi[idx] = lo[idx], f_lo[idx]
+        lo[idx] -= step[idx]
+        f_lo[idx] = f(lo[idx], idx)
+        idx = np.nonzero(high)[0]
+        lo[idx], f_lo[idx] = hi[idx], f_hi[idx]
+        hi[idx] += step[idx]
+        f_hi[idx] = f(hi[idx], idx)
+        step *= 2
+
+    # roots not bracketed, either because the functions
+    # keep their sign or can no longer be evaluated
+    # accurately so far out, are infinite
+
+    root[~(f_lo >= 0)] = -np.inf
+    root[~(f_hi <= 0)] = np.inf
+    root[f_lo == 0] = lo[f_lo == 0]
+    root[f_hi == 0] = hi[f_hi == 0]
+    root[initial_nan] = np.nan
+
+    # Illinois iteration: after two consecutive updates
+    # of the same endpoint, the function value
+    # at the other endpoint is halved
+
+    active = ((f_lo > 0) & (f_hi < 0)) & (hi - lo > tol)
+    last = np.zeros(lo.shape, int)
+    for _ in range(max_iter):
+        idx = np.nonzero(active)[0]
+        if idx.shape[0] == 0:
+            break
+        l, h, fl, fh = lo[idx], hi[idx], f_lo[idx], f_hi[idx]
+        with np.errstate(invalid='ignore', over='ignore'):
+            c = (l * fh - h * fl) / (fh - fl)
+        bisect = ~((c > l) & (c < h))
+        c[bisect] = 0.5 * (l + h)[bisect]
+        fc = f(c, idx)
+
+        move_lo = fc > 0
+        move_hi = fc < 0
+
+        i = idx[move_lo]
+        lo[i], f_lo[i] = c[move_lo], fc[move_lo]
+        f_hi[i] = np.where(last[i] == 1, 0.5 * f_hi[i], f_hi[i])
+        last[i] = 1
+
+        i = idx[move_hi]
+        hi[i], f_hi[i] = c[move_hi], fc[move_hi]
+        f_lo[i] = np.where(last[i] == -1, 0.5 * f_lo[i], f_lo[i])
+        last[i] = -1
+
+        i = idx[fc == 0]
+        root[i] = c[fc == 0]
+        active[i] = False
+        active[idx] &= (hi[idx] - lo[idx] > tol) & ~np.isnan(fc)
+
+    unset = np.isnan(root) & ~initial_nan
+    root[unset] = 0.5 * (lo + hi)[unset]
+    return root
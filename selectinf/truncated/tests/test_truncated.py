@@ -2,7 +2,13 @@ from __future__ import print_function
 import nose.tools as nt
 import numpy as np
 
-from ..gaussian import truncated_gaussian, truncated_gaussian_old
+from ..gaussian import (truncated_gaussian,
+                        truncated_gaussian_old,
+                        equal_tailed_intervals,
+                        UMAU_intervals)
+from ..chi import truncated_chi, truncated_chi2
+from ..T import truncated_T
+from ..F import truncated_F
 from ...tests.decorators import set_sampling_params_iftrue, set_seed_iftrue
 from ...tests.flags import SMALL_SAMPLES, SET_SEED
 
@@ -60,3 +66,71 @@ def test_UMAU_coverage(nsim=1000):
     SE = np.sqrt(alpha*(1-alpha)*nsim)
     print(coverage)
     nt.assert_true(np.fabs(coverage - (1-alpha)*nsim) < 2.1*SE)
+
+@set_seed_iftrue(SET_SEED)
+def test_batched_intervals():
+
+    cases = [((-np.inf, -2.), 1.3, -2.5),
+             ((1., 3.), 1., 2.5),
+             ((2.3, np.inf), 2., 9.),
+             ((-1., 4.), 0.5, 0.3),
+             ((-np.inf, np.inf), 1., 0.4)]
+
+    L, U = np.array([c[0] for c in cases]).T
+    S = np.array([c[1] for c in cases])
+    Z = np.array([c[2] for c in cases])
+
+    ET = equal_tailed_intervals(L, Z, U, S, alpha=0.1)
+    UMAU = UMAU_intervals(L, Z, U, S, alpha=0.1)
+
+    for j, (interval, scale, obs) in enumerate(cases):
+        tg = truncated_gaussian_old([interval], scale=scale)
+        np.testing.assert_allclose(ET[j], tg.equal_tailed_interval(obs, 0.1),
+                                   atol=1.e-4)
+        np.testing.assert_allclose(UMAU[j], tg.UMAU_interval(obs, 0.1),
+                                   atol=1.e-4)
+
+    # coverage of the equal-tailed intervals is exact
+
+    Z = np.random.standard_normal(20000) * 2
+    Z = Z[Z > 2.3]
+    ET = equal_tailed_intervals(2.3, Z, np.inf, 2., alpha=0.25)
+    coverage = np.mean((ET[:,0] < 0) * (ET[:,1] > 0))
+    SE = np.sqrt(0.25 * 0.75 / Z.shape[0])
+    nt.assert_true(np.fabs(coverage - 0.75) < 3 * SE)
+
+def test_float_engine():
+
+    distributions = [truncated_gaussian(intervals, mu=0.5, scale=2.),
+                     truncated_gaussian([(-np.inf,-40.),(30.,31.)]),
+                     truncated_chi([(0.5,1.),(3.,np.inf)], 3, 2.),
+                     truncated_chi2([(0.5,1.),(3.,8.)], 3, 2.),
+                     truncated_T(np.array([(-np.inf,-2.),(1.,3.)]), 10),
+                     truncated_F([(1.,2.),(5.,np.inf)], 3, 20, 1.5)]
+
+    q = np.linspace(0.01, 0.99, 11)
+    for distr in distributions:
+        nt.assert_true(distr._logQ is not None)
+
+        finite = distr._cutoffs[np.isfinite(distr._cutoffs)]
+        Z = np.linspace(max(distr._cutoffs.min(), -45), finite.max() - 1.e-3, 21)
+        sf, cdf = distr.sf(Z), distr.cdf(Z)
+
+        distr._setup_mp()
+        np.testing.assert_allclose(sf, [float(distr._sf_mp(z)) for z in Z],
+                                   rtol=1.e-8, atol=1.e-14)
+        np.testing.assert_allclose(sf + cdf, 1)
+        np.testing.assert_allclose(distr.cdf(distr.quantile(q)), q, atol=1.e-10)
+
+    # mass underflows in double precision, mpmath is used
+
+    distr = truncated_chi([(100., 101.)], 3)
+    nt.assert_true(distr._logQ is None)
+    nt.assert_true(0 < distr.sf(100.5) < 1.e-20)
+
+    # a scalar quantile falling back to mpmath
+
+    distr = truncated_gaussian([(40.,41.)])
+    z = distr.quantile(0.5)
+    nt.assert_true(isinstance(z, float))
+    np.testing.assert_equal(z, distr.quantile(np.array([0.5]))[0])